@@ -0,0 +1,265 @@
+import math
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+
+class PoolBusy(RuntimeError):
+    """The worker pool shed a turn: the queue is full or the user has too many turns in flight."""
+
+    def __init__(self, message: str, retry_after: float = 0.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AgentJob:
+    """
+    One submitted turn.  The worker appends the agent's stream events; events() yields them
+    to the page as they arrive, starting with {"event": "queued", "position": n} while waiting.
+    status: queued, running, done, failed, shed (dropped after waiting too long) or cancelled.
+    """
+
+    _END = object()
+
+    def __init__(self, user: str, prompt: str, run: Callable[[threading.Event], Iterator[Dict[str, Any]]]):
+        self.id = uuid.uuid4().hex[:12]
+        self.user = user
+        self.prompt = prompt
+        self.run = run
+        self.status = "queued"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.submitted = time.monotonic()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._events: "queue.Queue[Any]" = queue.Queue()
+        self._cancelled = threading.Event()
+        self._finished = threading.Event()
+
+    def events(self, poll: float = 0.25, position: Optional[Callable[["AgentJob"], int]] = None) -> Iterator[Dict[str, Any]]:
+        """Stream events until the turn ends; while queued, yield the queue position every `poll` seconds."""
+        last_position = None
+        while True:
+            try:
+                item = self._events.get(timeout=poll)
+            except queue.Empty:
+                if self.status == "queued" and position is not None:
+                    pos = position(self)
+                    if pos != last_position:
+                        last_position = pos
+                        yield {"event": "queued", "position": pos}
+                continue
+            if item is self._END:
+                return
+            yield item
+
+    def cancel(self) -> None:
+        """
+        Stop the turn: a queued job is dropped without running; a running one stops its agent
+        loop (the event passed to run() is set and the event iterator is closed).
+        """
+        self._cancelled.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has ended (its user slot is free); False on timeout."""
+        return self._finished.wait(timeout)
+
+    @property
+    def done(self) -> bool:
+        return self.finished is not None
+
+    def wait_s(self) -> float:
+        return (self.started or time.monotonic()) - self.submitted
+
+    def _put(self, event: Dict[str, Any]) -> None:
+        self._events.put(event)
+
+    def _end(self, status: str) -> None:
+        self.status = status
+        self.finished = time.monotonic()
+        self._finished.set()
+        self._events.put(self._END)
+
+
+class AgentWorkerPool:
+    """
+    A local job queue with N worker threads that run agent turns off the Streamlit script
+    threads.  The page submits a turn and consumes its events (tool calls, tokens, final
+    result) from the job; the agent loop, its asyncio event loop and tool calls run on the
+    pool, so at most `workers` turns run at once in the process however many sessions are open.
+
+    Limits and shedding:
+        - per_user: turns one user (browser session) may have queued or running; more are refused;
+        - max_queue: queued turns beyond the running ones; more are refused with a retry estimate;
+        - max_wait: a turn still queued after this many seconds is shed instead of started late.
+    Refusals raise PoolBusy and are counted; stats and report() give queue depth, running
+    turns, queue wait p50/p95 and turn duration for the sidebar.
+
+    Workers run threads rather than processes: sessions hold tools, result stores, memory and
+    HTTP clients that cannot be pickled, and a turn spends its time waiting on the model, the
+    database and MCP, which release the GIL.
+
+    Example:
+        pool = AgentWorkerPool(workers=4, per_user=1, max_queue=16)
+        job = pool.submit(user_id, prompt, lambda stop: session.agent.stream(prompt, stop=stop))
+        for event in job.events(position=pool.position):
+            ...
+    """
+
+    def __init__(self, workers: int = 4, per_user: int = 1, max_queue: int = 16, max_wait: float = 120.0):
+        self.workers = workers
+        self.per_user = per_user
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self._queue: "deque[AgentJob]" = deque()
+        self._in_flight: Dict[str, int] = {}
+        self._running = 0
+        self._cond = threading.Condition()
+        self._wait_s: deque = deque(maxlen=500)
+        self._turn_s: deque = deque(maxlen=500)
+        self.stats: Dict[str, int] = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                                      "shed_queue_full": 0, "shed_user_limit": 0, "shed_timeout": 0,
+                                      "max_queue_depth": 0}
+        self._threads = [threading.Thread(target=self._work, name=f"agent-worker-{i}", daemon=True)
+                         for i in range(workers)]
+        for t in self._threads:
+            t.start()
+
+    # ----------------------------
+    # Submission
+    # ----------------------------
+    def submit(self, user: str, prompt: str, run: Callable[[threading.Event], Iterator[Dict[str, Any]]]) -> AgentJob:
+        """
+        Queue a turn for user.  run(stop) is called on a worker with the job's cancel event and
+        must return the agent's event iterator (e.g. agent.stream(prompt, stop=stop)); the
+        iterator is closed when the turn ends, so a cancelled turn stops its agent loop before
+        the worker is freed.  Raises PoolBusy when the turn is shed.
+        """
+        job = AgentJob(user, prompt, run)
+        with self._cond:
+            if self._in_flight.get(user, 0) >= self.per_user:
+                self.stats["shed_user_limit"] += 1
+                raise PoolBusy(f"You already have {self.per_user} request(s) running; wait for it to finish.")
+            if len(self._queue) >= self.max_queue:
+                self.stats["shed_queue_full"] += 1
+                raise PoolBusy("The assistant is busy; try again shortly.", retry_after=self._retry_after())
+            self._queue.append(job)
+            self._in_flight[user] = self._in_flight.get(user, 0) + 1
+            self.stats["submitted"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._queue))
+            self._cond.notify()
+        return job
+
+    def position(self, job: AgentJob) -> int:
+        """1-based position of a queued job (0 once it runs)."""
+        with self._cond:
+            for n, queued in enumerate(self._queue, 1):
+                if queued is job:
+                    return n
+        return 0
+
+    def _retry_after(self) -> float:
+        # queued turns drain `workers` at a time at about the median turn duration
+        median = sorted(self._turn_s)[len(self._turn_s) // 2] if self._turn_s else 30.0
+        return median * (len(self._queue) / max(self.workers, 1) + 1)
+
+    # ----------------------------
+    # Workers
+    # ----------------------------
+    def _work(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                job = self._queue.popleft()
+                self._running += 1
+            status = "failed"
+            try:
+                status = self._run(job)
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    left = self._in_flight.get(job.user, 1) - 1
+                    if left > 0:
+                        self._in_flight[job.user] = left
+                    else:
+                        self._in_flight.pop(job.user, None)
+                # after the user's slot is free, so the page can submit again as soon as it sees the end
+                job._end(status)
+
+    def _run(self, job: AgentJob) -> str:
+        if job._cancelled.is_set():
+            self._count("cancelled")
+            return "cancelled"
+        if time.monotonic() - job.submitted > self.max_wait:
+            self._count("shed_timeout")
+            job._put({"event": "error", "error": PoolBusy("The assistant is busy; the request waited too long. "
+                                                            "Please try again.")})
+            return "shed"
+        job.started = time.monotonic()
+        job.status = "running"
+        with self._cond:
+            self._wait_s.append(job.wait_s())
+        events = None
+        try:
+            events = job.run(job._cancelled)
+            for event in events:
+                if event.get("event") == "final":
+                    job.result = event.get("result")
+                elif event.get("event") == "error":
+                    job.error = event.get("error")
+                job._put(event)
+                if job._cancelled.is_set():
+                    break
+        except Exception as e:
+            job.error = e
+            job._put({"event": "error", "error": e})
+        finally:
+            # stops the agent loop behind a generator that was left early
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+        status = "cancelled" if job._cancelled.is_set() else "failed" if job.error is not None else "done"
+        with self._cond:
+            self._turn_s.append(time.monotonic() - job.started)
+        self._count({"done": "completed"}.get(status, status))
+        return status
+
+    def _count(self, key: str) -> None:
+        with self._cond:
+            self.stats[key] += 1
+
+    # ----------------------------
+    # Metrics
+    # ----------------------------
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            waits, turns = sorted(self._wait_s), sorted(self._turn_s)
+            return {"queue_depth": len(self._queue), "running": self._running, "workers": self.workers,
+                    "users_in_flight": len(self._in_flight),
+                    "wait_p50_s": _quantile(waits, 0.50), "wait_p95_s": _quantile(waits, 0.95),
+                    "turn_p50_s": _quantile(turns, 0.50), "turn_p95_s": _quantile(turns, 0.95),
+                    **self.stats}
+
+    def report(self) -> str:
+        s = self.snapshot()
+        shed = s["shed_queue_full"] + s["shed_user_limit"] + s["shed_timeout"]
+        return "\n".join([
+            f"running {s['running']}/{s['workers']}, queued {s['queue_depth']} (max {s['max_queue_depth']}), "
+            f"users {s['users_in_flight']}",
+            f"queue wait p50 {s['wait_p50_s']:.2f} s, p95 {s['wait_p95_s']:.2f} s; "
+            f"turn p50 {s['turn_p50_s']:.1f} s, p95 {s['turn_p95_s']:.1f} s",
+            f"submitted {s['submitted']}, completed {s['completed']}, failed {s['failed']}, "
+            f"cancelled {s['cancelled']}, shed {shed} (queue full {s['shed_queue_full']}, "
+            f"user limit {s['shed_user_limit']}, waited too long {s['shed_timeout']})",
+        ])
+
+
+def _quantile(values: List[float], q: float) -> float:
+    """Nearest-rank quantile of sorted values."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(q * len(values)) - 1)]
@@ -1,11 +1,28 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Union
+import asyncio
+import json
+import math
+import os
+import queue
+import threading
+import time
+import uuid
+import weakref
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Union
 
 # LangChain core
 from langchain.agents import AgentExecutor, initialize_agent, AgentType, create_tool_calling_agent
+from langchain_core.agents import AgentStep
+from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.tools import BaseTool
 from langchain_core.language_models import BaseChatModel
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.messages import SystemMessage
+from pydantic import PrivateAttr
+
+from context_budget import ContextBudget, count_tokens
 
 try:
     from langchain_openai import ChatOpenAI  # type: ignore
@@ -18,6 +35,373 @@ except Exception:
     ChatGroq = None  # type: ignore
 
 
+# ----------------------------
+# Tool state declarations
+# ----------------------------
+# A tool declares whether it keeps state between calls in its metadata:
+#   metadata={"stateful": False}  independent calls may run concurrently
+#   metadata={"stateful": True}   calls run one at a time, in the order the model issued them
+# (e.g. ChartTool and MapDataTool keep _latest_result for the page).  Undeclared tools are
+# treated as stateful.
+
+def declare_tool_state(tool: Any, stateful: bool) -> Any:
+    """Set a tool's stateful/stateless declaration (for tools built by LangChain helpers)."""
+    tool.metadata = {**(getattr(tool, "metadata", None) or {}), "stateful": stateful}
+    return tool
+
+
+def is_stateful(tool: Any) -> bool:
+    return bool((getattr(tool, "metadata", None) or {}).get("stateful", True))
+
+
+class _DeferredStep:
+    """Placeholder for a tool call ConcurrentToolExecutor runs after collecting the whole model turn."""
+
+    def __init__(self, args: tuple):
+        self.args = args
+
+
+class ConcurrentToolExecutor(AgentExecutor):
+    """
+    AgentExecutor that runs the tool calls of one model turn concurrently when the tools are
+    declared stateless (see declare_tool_state).  Calls to stateful tools run one at a time
+    in the order the model issued them; steps are returned in the original order either way.
+
+    Sync runs (invoke/stream) use a thread pool of max_workers: stateless calls each take a
+    worker and the stateful calls share one worker in order.  Async runs (ainvoke,
+    astream_events) already gather all calls of a turn; stateful calls take a per-loop lock,
+    which asyncio grants in request order.
+    """
+
+    max_workers: int = 4
+    _deferring: bool = PrivateAttr(default=False)
+    _stateful_locks: Any = PrivateAttr(default_factory=weakref.WeakKeyDictionary)
+
+    def _perform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        if self._deferring:
+            return _DeferredStep((name_to_tool_map, color_mapping, agent_action, run_manager))
+        return super()._perform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+    def _iter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        # let AgentExecutor plan the turn, but collect its tool calls instead of running them one by one
+        deferred: List[_DeferredStep] = []
+        self._deferring = True
+        try:
+            for item in super()._iter_next_step(name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager):
+                if isinstance(item, _DeferredStep):
+                    deferred.append(item)
+                else:
+                    yield item
+        finally:
+            self._deferring = False
+        if not deferred:
+            return
+        if len(deferred) == 1:
+            yield super()._perform_agent_action(*deferred[0].args)
+            return
+
+        def _run(step: _DeferredStep) -> AgentStep:
+            return super(ConcurrentToolExecutor, self)._perform_agent_action(*step.args)
+
+        def _run_ordered(steps: List[_DeferredStep]) -> List[AgentStep]:
+            return [_run(step) for step in steps]
+
+        stateful = [d for d in deferred if is_stateful(name_to_tool_map.get(d.args[2].tool))]
+        stateless = [d for d in deferred if d not in stateful]
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="agent-tool") as pool:
+            futures = {id(d): pool.submit(_run, d) for d in stateless}
+            ordered = pool.submit(_run_ordered, stateful) if stateful else None
+            results = dict(zip((id(d) for d in stateful), ordered.result() if ordered else []))
+            for d in deferred:
+                yield results[id(d)] if id(d) in results else futures[id(d)].result()
+
+    async def _aperform_agent_action(self, name_to_tool_map, color_mapping, agent_action, run_manager=None):
+        tool = name_to_tool_map.get(agent_action.tool)
+        if tool is None or not is_stateful(tool):
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+        loop = asyncio.get_running_loop()
+        lock = self._stateful_locks.get(loop)
+        if lock is None:
+            lock = self._stateful_locks[loop] = asyncio.Lock()
+        async with lock:
+            return await super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager)
+
+
+def _message_text(content: Any) -> str:
+    """Text of a message/chunk content (a string, or a list of content parts)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return ""
+
+
+# ----------------------------
+# Tracing
+# ----------------------------
+def _percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def _text_size(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode("utf-8"))
+    try:
+        return len(json.dumps(value, default=str).encode("utf-8"))
+    except (TypeError, ValueError):
+        return len(str(value).encode("utf-8"))
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """
+    Records one span per LLM call and tool call of a turn: offset from the turn start,
+    duration, prompt/completion tokens (LLM) and input/output payload sizes in bytes.
+    Callbacks may arrive from several threads (concurrent tools), so spans are locked.
+    Created by TraceStore.handler(); finish() hands the turn to the store.
+    """
+
+    def __init__(self, store: "TraceStore", label: str = ""):
+        self.store = store
+        self.turn_id = uuid.uuid4().hex[:12]
+        self.label = label
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._open: Dict[Any, Dict[str, Any]] = {}
+        self.spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, parent_run_id, kind: str, name: str, input_bytes: int) -> None:
+        with self._lock:
+            self._open[run_id] = {
+                "span": str(run_id), "parent": str(parent_run_id) if parent_run_id else None,
+                "kind": kind, "name": name, "start_ms": (time.perf_counter() - self._t0) * 1000.0,
+                "input_bytes": input_bytes,
+            }
+
+    def _end(self, run_id, **fields: Any) -> None:
+        with self._lock:
+            span = self._open.pop(run_id, None)
+            if span is None:
+                return
+            span["duration_ms"] = (time.perf_counter() - self._t0) * 1000.0 - span["start_ms"]
+            span.update(fields)
+            self.spans.append(span)
+
+    # LLM calls
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+        size = sum(_text_size(getattr(m, "content", m)) for batch in messages for m in batch)
+        name = (kwargs.get("metadata") or {}).get("ls_model_name") or (serialized or {}).get("name") or "llm"
+        self._start(run_id, parent_run_id, "llm", name, size)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+        name = (kwargs.get("metadata") or {}).get("ls_model_name") or (serialized or {}).get("name") or "llm"
+        self._start(run_id, parent_run_id, "llm", name, sum(_text_size(p) for p in prompts))
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens, completion_tokens = usage.get("prompt_tokens"), usage.get("completion_tokens")
+        out_bytes = 0
+        for generations in response.generations:
+            for g in generations:
+                message = getattr(g, "message", None)
+                out_bytes += _text_size(getattr(g, "text", ""))
+                out_bytes += _text_size((getattr(message, "additional_kwargs", None) or {}).get("tool_calls"))
+                meta = getattr(message, "usage_metadata", None)
+                if meta and prompt_tokens is None:
+                    prompt_tokens, completion_tokens = meta.get("input_tokens"), meta.get("output_tokens")
+        self._end(run_id, output_bytes=out_bytes, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error)[:200])
+
+    # Tool calls
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._start(run_id, parent_run_id, "tool", (serialized or {}).get("name") or "tool", _text_size(input_str))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_bytes=_text_size(getattr(output, "content", output)))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error=str(error)[:200])
+
+    def add_span(self, kind: str, name: str, start: float, end: float, **fields: Any) -> None:
+        """Record work done outside LangChain (e.g. running chart code); start/end from time.perf_counter()."""
+        with self._lock:
+            self.spans.append({"span": uuid.uuid4().hex[:12], "parent": None, "kind": kind, "name": name,
+                               "start_ms": (start - self._t0) * 1000.0, "duration_ms": (end - start) * 1000.0,
+                               **fields})
+
+    def finish(self, **fields: Any) -> Dict[str, Any]:
+        """Close the turn and write it to the store; returns the turn record."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda sp: sp["start_ms"])
+        turn = {"turn": self.turn_id, "label": self.label[:200], "started": self.started,
+                "duration_ms": (time.perf_counter() - self._t0) * 1000.0, "spans": spans, **fields}
+        self.store.record(turn)
+        return turn
+
+
+class TraceStore:
+    """
+    Local trace store: one JSON line per agent turn (with its spans) appended to `path`,
+    plus the most recent `keep` turns in memory for the UI and reports.
+
+    Example:
+        store = TraceStore("../../workspace/data/agent_traces.jsonl")
+        handler = store.handler(label=question)
+        executor.invoke({"input": question}, config={"callbacks": [handler]})
+        handler.finish()
+        print(store.report())
+    """
+
+    def __init__(self, path: Optional[str] = None, keep: int = 500):
+        self.path = path
+        self._turns: "deque[Dict[str, Any]]" = deque(maxlen=keep)
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._turns.append(json.loads(line))
+                    except ValueError:
+                        continue
+
+    def handler(self, label: str = "") -> TraceCallbackHandler:
+        return TraceCallbackHandler(self, label)
+
+    def record(self, turn: Dict[str, Any]) -> None:
+        with self._lock:
+            self._turns.append(turn)
+            if self.path:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(turn, default=str) + "\n")
+
+    def recent(self, n: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._turns)[-n:]
+
+    def aggregates(self) -> List[Dict[str, Any]]:
+        """Count, p50 and p95 duration, mean tokens and payload bytes per span (kind, name), plus whole turns."""
+        groups: Dict[tuple, List[Dict[str, Any]]] = {}
+        turns = self.recent(len(self._turns))
+        for turn in turns:
+            groups.setdefault(("turn", "total"), []).append({"duration_ms": turn["duration_ms"]})
+            for sp in turn["spans"]:
+                groups.setdefault((sp["kind"], sp["name"]), []).append(sp)
+        rows = []
+        for (kind, name), spans in groups.items():
+            durations = [sp["duration_ms"] for sp in spans]
+            tokens = [(sp.get("prompt_tokens") or 0) + (sp.get("completion_tokens") or 0) for sp in spans]
+            rows.append({
+                "kind": kind, "name": name, "count": len(spans),
+                "p50_ms": _percentile(durations, 0.50), "p95_ms": _percentile(durations, 0.95),
+                "mean_tokens": sum(tokens) / len(tokens),
+                "mean_output_bytes": sum(sp.get("output_bytes") or 0 for sp in spans) / len(spans),
+                "errors": sum(1 for sp in spans if sp.get("error")),
+            })
+        return sorted(rows, key=lambda r: (r["kind"] != "turn", -r["p95_ms"]))
+
+    def report(self, width: int = 28) -> str:
+        rows = self.aggregates()
+        if not rows:
+            return "(no traces yet)"
+        lines = [f"{'span':<{width}} {'n':>5} {'p50 ms':>9} {'p95 ms':>9} {'tokens':>7} {'out KB':>7}"]
+        for r in rows:
+            name = f"{r['kind']}:{r['name']}"[:width]
+            lines.append(f"{name:<{width}} {r['count']:>5} {r['p50_ms']:>9.0f} {r['p95_ms']:>9.0f} "
+                         f"{r['mean_tokens']:>7.0f} {r['mean_output_bytes'] / 1024:>7.1f}")
+        return "\n".join(lines)
+
+
+def stream_executor(executor: AgentExecutor, inputs: Dict[str, Any], *, tokens: bool = True,
+                    callbacks: Optional[List[Any]] = None,
+                    stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Run an AgentExecutor and yield its progress as it happens, built on astream_events (v2):
+
+      {"event": "tool_start", "tool": name, "tool_input": ...}
+      {"event": "tool_end", "tool": name, "observation": ...}
+      {"event": "token", "text": ...}            chat model output chunks (when tokens=True)
+      {"event": "final", "result": {...}}        the same dict executor.invoke returns
+      {"event": "error", "error": exception}
+
+    The executor runs on a background thread with its own event loop, so the caller (e.g. a
+    Streamlit script) can consume the events synchronously and render each one right away.
+    Tool calls run as with ainvoke() (stateless calls of one turn concurrently with
+    ConcurrentToolExecutor).
+
+    Closing the generator early (or setting `stop`) cancels the executor's task and waits
+    for the background thread to finish (a tool call already running completes first), so
+    an abandoned turn does not keep running unseen.
+    """
+    events: "queue.Queue[Any]" = queue.Queue()
+    done = object()
+    stopping = threading.Event()
+    running: Dict[str, Any] = {}  # the producer's event loop and task, for cancellation
+
+    async def _produce() -> None:
+        running["loop"], running["task"] = asyncio.get_running_loop(), asyncio.current_task()
+        if stopping.is_set():
+            return
+        root = None
+        config = {"callbacks": callbacks} if callbacks else None
+        async for ev in executor.astream_events(inputs, config=config, version="v2"):
+            if root is None:
+                root = ev["run_id"]
+            kind, data = ev["event"], ev.get("data", {})
+            if kind == "on_tool_start":
+                events.put({"event": "tool_start", "tool": ev["name"], "tool_input": data.get("input")})
+            elif kind == "on_tool_end":
+                out = data.get("output")
+                events.put({"event": "tool_end", "tool": ev["name"],
+                            "observation": getattr(out, "content", out)})
+            elif kind == "on_chat_model_stream" and tokens:
+                text = _message_text(getattr(data.get("chunk"), "content", ""))
+                if text:
+                    events.put({"event": "token", "text": text})
+            elif kind == "on_chain_end" and ev["run_id"] == root:
+                events.put({"event": "final", "result": data.get("output") or {}})
+
+    def _run() -> None:
+        try:
+            asyncio.run(_produce())
+        except asyncio.CancelledError:
+            pass  # stopped by the consumer
+        except Exception as e:
+            events.put({"event": "error", "error": e})
+        finally:
+            events.put(done)
+
+    thread = threading.Thread(target=_run, name="agent-stream", daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                item = events.get(timeout=0.25 if stop is not None else None)
+            except queue.Empty:
+                if stop.is_set():
+                    return
+                continue
+            if item is done:
+                return
+            yield item
+    finally:
+        if thread.is_alive():
+            stopping.set()
+            loop, task = running.get("loop"), running.get("task")
+            if loop is not None:
+                try:
+                    loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:
+                    pass  # the loop already finished
+            thread.join()
+
+
 class StructuredChatAgent:
 
     def __init__(
@@ -49,6 +433,14 @@ class StructuredChatAgent:
         # structured-chat expects the "input" key when returning intermediate steps
         return self.executor.invoke({"input": user_input})
 
+    def stream(self, user_input: str, stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Like run(), but yields tool starts, tool results and the final result as they happen
+        (see stream_executor).  The model writes each step as a JSON action blob, so raw
+        tokens are not streamed; the final answer arrives with the "final" event.
+        """
+        return stream_executor(self.executor, {"input": user_input}, tokens=False, stop=stop)
+
 
 class ToolCallingAgent:
     """
@@ -65,9 +457,33 @@ class ToolCallingAgent:
     force_tool : bool
         If True, nudge/require the model to call at least one tool.
     allow_parallel : bool
-        If False, keep tool calls sequential. Important for stateful tools.
+        If True, the model may issue several tool calls per turn; calls to tools declared
+        stateless (metadata {"stateful": False}) run concurrently and stateful tools keep
+        their order (ConcurrentToolExecutor).  If False, keep tool calls sequential.
         OpenAI supports this via bind_tools(..., parallel_tool_calls=False).
         For Groq, pass model_kwargs={'parallel_tool_calls': False} when creating the LLM.
+    max_tool_workers : int
+        Threads for concurrent stateless tool calls.
+    answer_cache : AnswerCache, optional
+        Semantic cache consulted before the loop runs; completed answers are stored in it.
+    payloads : callable, optional
+        Returns the turn's side outputs to cache with the answer (e.g. {"chart": ..., "map": ...}).
+    system_prompt : str, optional
+        Static instructions appended to the built-in system message.  Sent in the system
+        slot, unchanged between turns, so provider prompt caching can apply (rather than
+        prepending them to every user message).
+    context_budget : ContextBudget, optional
+        Compacts and token-caps tool observations in the scratchpad and counts tokens per turn.
+    memory : ConversationMemory, optional
+        Earlier turns (recent ones verbatim, older ones summarized) and the schema facts their
+        tool calls found, sent before the user message within the memory's token budget.
+        Follow-up questions bypass the answer cache, and their answers are not stored in it.
+    planner : FastPathPlanner, optional
+        Tried after the answer cache; questions it recognizes are answered without the agent
+        loop.  Follow-up questions always go to the agent.
+    tracer : TraceStore, optional
+        Records LLM and tool spans of each turn; the last turn's handler is kept in
+        last_trace so the caller can add its own spans before trace_done().
     max_iterations : int
         Safety cap for the loop.
     verbose, return_intermediate_steps : bool
@@ -80,14 +496,29 @@ class ToolCallingAgent:
         llm: BaseChatModel,
         *,
         force_tool: bool = True,
-        allow_parallel: bool = False,
+        allow_parallel: bool = True,
         max_iterations: int = 6,
+        max_tool_workers: int = 4,
         verbose: bool = True,
         return_intermediate_steps: bool = True,
+        answer_cache: Optional[Any] = None,
+        payloads: Optional[Callable[[], Dict[str, Any]]] = None,
+        tracer: Optional[TraceStore] = None,
+        system_prompt: Optional[str] = None,
+        context_budget: Optional[ContextBudget] = None,
+        memory: Optional[Any] = None,
+        planner: Optional[Any] = None,
     ) -> None:
         self.tools = tools
         self.llm = llm
         self.max_iterations = max_iterations
+        self.context_budget = context_budget
+        self.memory = memory
+        self.planner = planner
+        self.answer_cache = answer_cache
+        self.payloads = payloads
+        self.tracer = tracer
+        self.last_trace: Optional[TraceCallbackHandler] = None
 
         tool_choice = "any" if force_tool else "auto"
 
@@ -97,8 +528,8 @@ class ToolCallingAgent:
 
             Follow this loop until you can confidently answer:
             1) THINK: Reason briefly about what to do.
-            2) ACT: If needed, call exactly one tool with correct JSON arguments.
-            3) OBSERVE: Read the tool result.
+            2) ACT: {act}
+            3) OBSERVE: Read the tool result(s).
             4) REPEAT until done.
             5) FINAL: Give the user a clear answer.
 
@@ -107,9 +538,19 @@ class ToolCallingAgent:
             - Tool calls must use the expected JSON schema.
             - If no tool is needed, answer directly.
             """
+        if allow_parallel:
+            act = ("If needed, call one or more tools with correct JSON arguments. When several lookups "
+                   "do not depend on each other's results (e.g. two column descriptions, or the table list "
+                   "and a column description), call them together in the same step; they run concurrently.")
+        else:
+            act = "If needed, call exactly one tool with correct JSON arguments."
+        REACT_TOOLS_SYSTEM_PROMPT = REACT_TOOLS_SYSTEM_PROMPT.replace("{act}", act)
 
+        # a message object, not a template: the static prompt may contain literal braces
+        self.system_prompt = REACT_TOOLS_SYSTEM_PROMPT + ("\n\n" + system_prompt if system_prompt else "")
         prompt = ChatPromptTemplate.from_messages([
-            ("system", REACT_TOOLS_SYSTEM_PROMPT),
+            SystemMessage(content=self.system_prompt),
+            MessagesPlaceholder(variable_name="history", optional=True),
             ("user", "{input}"),
             MessagesPlaceholder(variable_name="agent_scratchpad"),
         ])
@@ -132,22 +573,163 @@ class ToolCallingAgent:
             raise ValueError("The provided llm does not support .bind_tools(...)")
 
         # Create the agent + executor
-        self.agent = create_tool_calling_agent(bound_llm, tools, prompt)
-        self.executor = AgentExecutor(
-            agent=self.agent,
-            tools=tools,
-            verbose=verbose,
-            return_intermediate_steps=return_intermediate_steps,
-            max_iterations=max_iterations,
-        )
+        if context_budget is not None:
+            self.agent = create_tool_calling_agent(bound_llm, tools, prompt,
+                                                   message_formatter=context_budget.message_formatter())
+        else:
+            self.agent = create_tool_calling_agent(bound_llm, tools, prompt)
+        if allow_parallel:
+            self.executor = ConcurrentToolExecutor(
+                agent=self.agent,
+                tools=tools,
+                verbose=verbose,
+                return_intermediate_steps=return_intermediate_steps,
+                max_iterations=max_iterations,
+                max_workers=max_tool_workers,
+            )
+        else:
+            self.executor = AgentExecutor(
+                agent=self.agent,
+                tools=tools,
+                verbose=verbose,
+                return_intermediate_steps=return_intermediate_steps,
+                max_iterations=max_iterations,
+            )
 
-    def run(self, user_input: str) -> Dict[str, Any]:
+    def run(self, user_input: str, cache_key: Optional[str] = None) -> Dict[str, Any]:
         """
         Executes one full agent loop using tool-calling.
+        cache_key: text to look up in the answer cache (e.g. the user's question without the
+        system prompt); defaults to user_input.
         Returns:
           { "output": str, "intermediate_steps": [...], ... }
+        plus "cached": <AnswerCache hit> when the answer came from the cache.
         """
-        return self.executor.invoke({"input": user_input})
+        key = cache_key or user_input
+        handler = self._trace_start(key)
+        follow_up = self._follow_up(key)
+        hit = None if follow_up else self._cached(key)
+        fast = None if follow_up or hit is not None else self._fast_path(key, handler)
+        if hit is not None:
+            result = hit
+        elif fast is not None:
+            result = fast
+            self._remember(key, result)
+        else:
+            t0 = time.perf_counter()
+            inputs = self._inputs(user_input)
+            self._budget_start(inputs)
+            config = {"callbacks": [handler]} if handler else None
+            result = self.executor.invoke(inputs, config=config)
+            if not follow_up:
+                self._remember(key, result)
+            self._agent_done(t0)
+        self._add_turn(key, result)
+        self.trace_done(cached=hit is not None)
+        return result
+
+    def stream(self, user_input: str, cache_key: Optional[str] = None,
+               stop: Optional[threading.Event] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Like run(), but yields tool starts, tool results and final-answer tokens as they
+        happen, then {"event": "final", "result": <run() dict>} (see stream_executor).
+        With a tracer, the caller writes the turn's trace with trace_done() once it has
+        rendered the result (run() does this itself).  Setting stop, or closing the
+        generator, stops the agent loop.
+        """
+        key = cache_key or user_input
+        handler = self._trace_start(key)
+        follow_up = self._follow_up(key)
+        hit = None if follow_up else self._cached(key)
+        if hit is not None:
+            self._add_turn(key, hit)
+            yield {"event": "final", "result": hit}
+            return
+        fast = None if follow_up else self._fast_path(key, handler)
+        if fast is not None:
+            for action, observation in fast["intermediate_steps"]:
+                yield {"event": "tool_start", "tool": action.tool, "tool_input": action.tool_input}
+                yield {"event": "tool_end", "tool": action.tool, "observation": observation}
+            self._remember(key, fast)
+            self._add_turn(key, fast)
+            yield {"event": "final", "result": fast}
+            return
+        t0 = time.perf_counter()
+        inputs = self._inputs(user_input)
+        self._budget_start(inputs)
+        events = stream_executor(self.executor, inputs, callbacks=[handler] if handler else None, stop=stop)
+        try:
+            for event in events:
+                if event["event"] == "final":
+                    if not follow_up:
+                        self._remember(key, event["result"])
+                    self._add_turn(key, event["result"])
+                    self._agent_done(t0)
+                yield event
+        finally:
+            events.close()
+
+    def _fast_path(self, key: str, handler: Optional[TraceCallbackHandler]) -> Optional[Dict[str, Any]]:
+        if self.planner is None:
+            return None
+        return self.planner.run(key, trace=handler)
+
+    def _agent_done(self, started: float) -> None:
+        if self.planner is not None:
+            self.planner.record_agent_turn(time.perf_counter() - started)
+
+    def _inputs(self, user_input: str) -> Dict[str, Any]:
+        inputs: Dict[str, Any] = {"input": user_input}
+        if self.memory is not None:
+            inputs["history"] = self.memory.messages()
+        return inputs
+
+    def _follow_up(self, key: str) -> bool:
+        # an answer that depends on earlier turns must not be served to (or from) other conversations
+        return self.memory is not None and self.memory.is_follow_up(key)
+
+    def _add_turn(self, key: str, result: Dict[str, Any]) -> None:
+        output = result.get("output") if isinstance(result, dict) else None
+        if self.memory is None or not output:
+            return
+        self.memory.add_turn(key, output, result.get("intermediate_steps") or [])
+
+    def _budget_start(self, inputs: Dict[str, Any]) -> None:
+        if self.context_budget is not None:
+            history = sum(count_tokens(str(m.content)) for m in inputs.get("history", []))
+            self.context_budget.begin_turn(system_tokens=count_tokens(self.system_prompt),
+                                           user_tokens=count_tokens(inputs["input"]) + history)
+
+    def _trace_start(self, key: str) -> Optional[TraceCallbackHandler]:
+        self.last_trace = self.tracer.handler(label=key) if self.tracer is not None else None
+        return self.last_trace
+
+    def trace_done(self, **fields: Any) -> Optional[Dict[str, Any]]:
+        """Write the last turn's trace (after the caller added its own spans, e.g. chart rendering)."""
+        handler, self.last_trace = self.last_trace, None
+        return handler.finish(**fields) if handler is not None else None
+
+    def _cached(self, key: str) -> Optional[Dict[str, Any]]:
+        if self.answer_cache is None:
+            return None
+        try:
+            hit = self.answer_cache.lookup(key)
+        except Exception:
+            # embedding failure: run the agent as if there were no cache
+            return None
+        if hit is None:
+            return None
+        return {"output": hit["output"], "intermediate_steps": [], "cached": hit}
+
+    def _remember(self, key: str, result: Dict[str, Any]) -> None:
+        output = result.get("output") if isinstance(result, dict) else None
+        # answers cut off by the iteration/time limit are not worth repeating
+        if self.answer_cache is None or not output or output.startswith("Agent stopped"):
+            return
+        try:
+            self.answer_cache.store(key, output, payloads=self.payloads() if self.payloads else None)
+        except Exception:
+            pass
 
 
 class OpenAIToolCallingAgent(ToolCallingAgent):
@@ -0,0 +1,152 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from sql_tool import DataVersion
+
+
+class AnswerCache:
+    """
+    Semantic cache of final answers, consulted before the agent loop runs.
+
+    Each stored question is embedded with the same embeddings the dictionary tool uses
+    (local sentence-transformers by default).  A new question is a hit when its cosine
+    similarity to a stored one is at least `threshold`, the entry is younger than `ttl`
+    seconds, and both mention the same numbers (years) and the same "by"/"per" groupings,
+    so "uninsured rate by year" does not answer "uninsured rate by state" or another year.
+    A hit returns the stored output together with the chart and map payloads of that turn.
+
+    The cache is emptied when version_fn() changes (the data load version, e.g. the ETL's
+    per-year checksums); version_fn is called at most every version_ttl seconds.
+
+    Example:
+        cache = AnswerCache(dictionary.embeddings, version_fn=sql_tools.data_version)
+        hit = cache.lookup(question)
+        if hit is None:
+            result = agent.run(question)
+            cache.store(question, result["output"], payloads={"chart": chart, "map": map_payload})
+    """
+
+    _NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+    _GROUPING_RE = re.compile(r"\b(?:by|per|for each|across)\s+([a-z]+)", re.I)
+
+    def __init__(
+        self,
+        embeddings,
+        version_fn: Optional[Callable[[], str]] = None,
+        threshold: float = 0.92,
+        ttl: float = 3600.0,
+        max_entries: int = 500,
+        version_ttl: float = 60.0,
+    ):
+        self.embeddings = embeddings
+        self.version_fn = version_fn
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()  # recent embeddings, reused by store()
+        self._next_id = 0
+        self._version = DataVersion(version_fn, ttl=version_ttl) if version_fn is not None else None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    # ----------------------------
+    # Lookup / store
+    # ----------------------------
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Best cached answer for question, or None.  Returns {"output", "payloads", "question"
+        (the cached question), "similarity", "age_s"}.
+        """
+        self._check_version()
+        vector = self._embed(question)
+        signature = self._signature(question)
+        now = time.time()
+        best, best_sim = None, self.threshold
+        with self._lock:
+            for key in [k for k, e in self._entries.items() if now - e["created"] > self.ttl]:
+                del self._entries[key]
+            for key, entry in self._entries.items():
+                if entry["signature"] != signature:
+                    continue
+                sim = float(np.dot(entry["vector"], vector))
+                if sim >= best_sim:
+                    best, best_sim = key, sim
+            if best is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best)
+            entry = self._entries[best]
+            self.stats["hits"] += 1
+            return {"output": entry["output"], "payloads": dict(entry["payloads"]), "question": entry["question"],
+                    "similarity": best_sim, "age_s": now - entry["created"]}
+
+    def store(self, question: str, output: str, payloads: Optional[Dict[str, Any]] = None) -> None:
+        """Remember the final output (and chart/map payloads) of a completed turn."""
+        if not output:
+            return
+        self._check_version()
+        entry = {
+            "question": question,
+            "vector": self._embed(question),
+            "signature": self._signature(question),
+            "output": output,
+            "payloads": {k: v for k, v in (payloads or {}).items() if v is not None},
+            "created": time.time(),
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ----------------------------
+    # Helpers
+    # ----------------------------
+    def _embed(self, text: str) -> np.ndarray:
+        """Unit-length embedding; the last few are memoized so lookup() + store() embed once."""
+        with self._lock:
+            cached = self._vectors.get(text)
+            if cached is not None:
+                self._vectors.move_to_end(text)
+                return cached
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        vector = vector / norm if norm else vector
+        with self._lock:
+            self._vectors[text] = vector
+            while len(self._vectors) > 32:
+                self._vectors.popitem(last=False)
+        return vector
+
+    def _signature(self, text: str) -> tuple:
+        numbers = frozenset(self._NUMBER_RE.findall(text))
+        groupings = frozenset(g.lower().rstrip("s") for g in self._GROUPING_RE.findall(text))
+        return numbers, groupings
+
+    def _check_version(self) -> None:
+        if self._version is not None and self._version.changed():
+            with self._lock:
+                self._entries.clear()
+                self.stats["invalidations"] += 1
+
+    def report(self) -> str:
+        s = self.stats
+        lookups = s["hits"] + s["misses"]
+        rate = s["hits"] / lookups if lookups else 0.0
+        return (f"entries {len(self)}, hits {s['hits']}/{lookups} ({rate:.0%}), stores {s['stores']}, "
+                f"invalidations {s['invalidations']}, data version {(self._version and self._version.current) or '-'}")
@@ -0,0 +1,117 @@
+from typing import Any, List, Optional, Sequence, Tuple
+
+from rollup_router import RollupRouter
+
+
+class ApproximateQuery:
+    """
+    Approximate answers to state/year aggregate queries from the stratified sample the ETL
+    builds (etl_notebooks/sdoh_load.build_sample: sdoh_surveys_sample, strata = state x year).
+
+    Accepts the same query shape as RollupRouter (AVG of measure columns grouped by state
+    and/or year, state/year filters, ORDER BY, LIMIT).  Each AVG becomes the stratified
+    estimate sum(N_h * mean_h) / sum(N_h), with its standard error
+    sqrt(sum(N_h^2 * (1 - n_h/N_h) * s_h^2 / n_h)) / sum(N_h) and a normal confidence interval.
+    N_h is the stratum size scaled by the share of non-null values in the sample.  A stratum
+    with a single sampled county has no sample variance of its own; s_h^2 is then the pooled
+    within-stratum variance of the same year's strata with two or more counties, or of all
+    strata when that year has none.  If no stratum has two counties the standard error (and
+    interval) is NULL rather than an understated value.  Fully sampled strata add no variance.
+
+    Output columns per AVG item <name>: <name>, <name>_std_error, <name>_ci95_low,
+    <name>_ci95_high and <name>_sample_n (sampled counties behind the estimate).
+
+    Example:
+        approx = ApproximateQuery(engine, router)
+        columns, rows = approx.run("SELECT year, AVG(acs_pct_uninsured) FROM sdoh_surveys GROUP BY year")
+    """
+
+    def __init__(self, engine, router: RollupRouter, sample_table: str = "sdoh_surveys_sample", z: float = 1.96):
+        self.engine = engine
+        self.router = router
+        self.sample_table = sample_table
+        self.z = z
+
+    def sql(self, query: str, ast: Any = None) -> Optional[str]:
+        """Estimator SQL for a supported query, or None.  ast: the validator's sqlglot tree of query."""
+        parsed = self.router.parse(query, ast)
+        if parsed is None or any(func != "avg" for func, _, _ in parsed["aggs"]):
+            return None
+        group = parsed["group"]
+        group_sql = ", ".join(group)
+
+        strata_cols, pooled_cols, var_cols, est_cols, out_cols = [], [], [], [], []
+        for i, (_, col, alias) in enumerate(parsed["aggs"]):
+            qc = '"' + col.replace('"', '""') + '"'
+            strata_cols += [
+                f"COUNT({qc}) AS n_{i}",
+                f"AVG({qc}::double precision) AS mean_{i}",
+                f"VAR_SAMP({qc}::double precision) AS s2_{i}",  # NULL for a single county
+            ]
+            # pooled within-stratum variance: per year (p_i) and over all strata (q_i)
+            ss, df = f"SUM((n_{i} - 1) * s2_{i}) FILTER (WHERE n_{i} > 1)", f"SUM(n_{i} - 1) FILTER (WHERE n_{i} > 1)"
+            pooled_cols += [
+                f"{ss} / NULLIF({df}, 0) AS p_{i}",
+                f"SUM({ss}) OVER () / NULLIF(SUM({df}) OVER (), 0) AS q_{i}",
+            ]
+            # N_h scaled to the non-null share of the stratum
+            big_n = f"(big_n * n_{i}::double precision / n_rows)"
+            var_cols.append(
+                f"CASE WHEN n_{i} = 0 OR n_rows >= big_n THEN 0 ELSE {big_n} ^ 2 * (1 - n_rows::double precision / big_n) "
+                f"* COALESCE(s2_{i}, p_{i}, q_{i}) / n_{i} END AS v_{i}"
+            )
+            est_cols += [
+                f"SUM({big_n} * mean_{i}) FILTER (WHERE n_{i} > 0) / NULLIF(SUM({big_n}) FILTER (WHERE n_{i} > 0), 0) AS est_{i}",
+                # NULL when any stratum's variance is unknown
+                f"CASE WHEN COUNT(v_{i}) = COUNT(*) THEN SQRT(SUM(v_{i})) END "
+                f"/ NULLIF(SUM({big_n}) FILTER (WHERE n_{i} > 0), 0) AS se_{i}",
+                f"SUM(n_{i}) AS sample_n_{i}",
+            ]
+            name = alias.replace('"', '""')
+            out_cols += [
+                f'est_{i} AS "{name}"',
+                f'se_{i} AS "{name}_std_error"',
+                f'est_{i} - {self.z} * se_{i} AS "{name}_ci95_low"',
+                f'est_{i} + {self.z} * se_{i} AS "{name}_ci95_high"',
+                f'sample_n_{i} AS "{name}_sample_n"',
+            ]
+
+        where_sql = self.router.filter_sql(parsed["conditions"])
+        select_out = []
+        for kind, i in parsed["items"]:
+            if kind == "key":
+                select_out.append(parsed["keys"][i])
+            else:
+                select_out += out_cols[5 * i: 5 * i + 5]
+
+        return (
+            "WITH strata AS (\n"
+            f"    SELECT state, year, MAX(stratum_size) AS big_n, COUNT(*) AS n_rows, {', '.join(strata_cols)}\n"
+            f'    FROM "{self.sample_table}"'
+            + (f" WHERE {' AND '.join(where_sql)}" if where_sql else "")
+            + "\n    GROUP BY state, year\n"
+            "), pooled AS (\n"
+            f"    SELECT year, {', '.join(pooled_cols)}\n"
+            "    FROM strata GROUP BY year\n"
+            "), variance AS (\n"
+            f"    SELECT strata.*, {', '.join(var_cols)}\n"
+            "    FROM strata JOIN pooled ON pooled.year = strata.year\n"
+            "), est AS (\n"
+            f"    SELECT {group_sql}, {', '.join(est_cols)}\n"
+            f"    FROM variance GROUP BY {group_sql}\n"
+            ")\n"
+            f"SELECT {', '.join(select_out)} FROM est"
+            + self.router.order_limit_sql(parsed)
+        )
+
+    def run(self, query: str, ast: Any = None) -> Tuple[List[str], Sequence[Sequence[Any]]]:
+        """Run the estimator; raises ValueError when the query shape is not supported."""
+        sql = self.sql(query, ast)
+        if sql is None:
+            raise ValueError(
+                "Approximate mode supports only AVG(column) over sdoh_surveys grouped by state and/or year "
+                "with state/year filters. Use sql_db_query for this query."
+            )
+        with self.engine.connect() as conn:
+            result = conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+            return list(result.keys()), result.fetchall()
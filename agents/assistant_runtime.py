@@ -0,0 +1,239 @@
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+from langchain.agents import load_tools
+from langchain_openai import ChatOpenAI
+from sqlalchemy import text
+
+from agents import OpenAIToolCallingAgent, TraceStore, declare_tool_state
+from answer_cache import AnswerCache
+from context_budget import ContextBudget
+from conversation_memory import ConversationMemory
+from chart_tool import ChartTool
+from dictionary_tool import DictionaryLocalTool
+from fast_path import FastPathPlanner
+from mapdata_tool import MapDataTool
+from mcp_tool import McpTool
+from schema_prefetch import SchemaPrefetcher
+from search_tool import SearchTool
+from sql_db_list_stat_func_tool import SQLDBListStatFuncTool
+from sql_tool import SQLTools
+
+
+class AssistantRuntime:
+    """
+    The assistant's process-wide resources, built once and shared by every browser session:
+    the chat model, SQLTools (engine, schema reflection, query templates, validator), the
+    dictionary tool (embedding model and FAISS index), the MCP tool (network handshake), the
+    stat function listing, the schema prefetcher and the community/search tools.
+
+    Anything that holds per-conversation state (the result store, the chart and map tools
+    whose latest output the page reads, the agent bound to those tools) lives in an
+    AssistantSession from session(), which is cheap to build.
+
+    The Streamlit page caches one runtime with st.cache_resource and calls healthy() on each
+    rerun; a failed check (database unreachable after a reconnect) drops the cached runtime
+    so the next rerun builds a fresh one.  A failed MCP handshake is retried by healthy().
+
+    Example:
+        runtime = AssistantRuntime(db_uri=os.environ["DB_URI"], mcp_uri=os.environ["MCP_URI"])
+        session = runtime.session(ResultStore())
+        result = session.agent.run(prompt)
+    """
+
+    def __init__(
+        self,
+        db_uri: str,
+        mcp_uri: str,
+        *,
+        model: str = "gpt-4o",
+        approximate: bool = False,
+        dictionary_dir: str = "../../workspace/data",
+        system_prompt_path: str = "agent_system_prompt.txt",
+        health_interval: float = 30.0,
+        max_iterations: int = 10,
+        answer_cache: bool = True,
+        answer_cache_threshold: float = 0.92,
+        answer_cache_ttl: float = 3600.0,
+        trace_path: Optional[str] = "../../workspace/data/agent_traces.jsonl",
+        fast_path: bool = True,
+        prefetch: bool = True,
+    ):
+        self.mcp_uri = mcp_uri
+        self.health_interval = health_interval
+        self.max_iterations = max_iterations
+        self.timings: Dict[str, float] = {}  # seconds per component, for the rerun latency report
+        t_start = time.perf_counter()
+
+        # OpenAI LLM, key set by docker-compose; stream_usage reports token counts when streaming
+        self.llm = self._timed("llm", lambda: ChatOpenAI(model=model, temperature=0.0, stream_usage=True))
+
+        # LLM / tool spans of every turn, appended to a local JSONL file
+        self.tracer = TraceStore(trace_path)
+
+        # SQL tools: engine + schema reflection; query tools are bound per session
+        self.sql_tools = self._timed("sql_tools", lambda: SQLTools(db_uri=db_uri, llm=self.llm, approximate=approximate))
+        self.stat_func_tool = SQLDBListStatFuncTool(parent=self.sql_tools, schema="public", prefix="")
+
+        # Community tools
+        self.community_tools = self._timed("community_tools", lambda: load_tools(["llm-math"], llm=self.llm))
+        for tool in self.community_tools:
+            declare_tool_state(tool, stateful=False)
+
+        # Dictionary Tool.  Note this tool is used first by ETL to build the dictionary.
+        self.dictionary = self._timed("dictionary_tool", lambda: DictionaryLocalTool(
+            persist_dir=dictionary_dir,
+            model_name="all-MiniLM-L6-v2",
+            search_k=6))
+        self.dictionary_tool = self.dictionary.get_tool()
+
+        # Answers to earlier questions, shared by all sessions; embeds with the dictionary's model
+        # and is emptied when the loaded data changes
+        self.answer_cache = AnswerCache(
+            self.dictionary.embeddings,
+            version_fn=self.sql_tools.data_version,
+            threshold=answer_cache_threshold,
+            ttl=answer_cache_ttl,
+        ) if answer_cache else None
+
+        # Answers "average X by state" / "correlation of X and Y over years" without the agent
+        # loop; sessions bind it to their own tools, metrics are shared
+        self.planner = FastPathPlanner(self.sql_tools, self.dictionary) if fast_path else None
+
+        # Schema and per-year column statistics fetched in the background after dictionary hits,
+        # so the usual sql_db_schema follow-up is answered from cache; emptied on data reloads
+        self.prefetcher = SchemaPrefetcher(
+            self.sql_tools, version_fn=self.sql_tools.data_version) if prefetch else None
+
+        # MCP tool (network handshake); None until the server answers
+        self.mcp_loader = McpTool(server_name="OSM", mcp_url=mcp_uri)
+        self.mcp_tool = self._timed("mcp_tool", self._load_mcp_tool)
+
+        # Internet search tool - only create if API key is set
+        tavily_api_key = os.environ.get("TAVILY_API_KEY")
+        self.search_tool = SearchTool() if tavily_api_key and tavily_api_key.strip() else None
+
+        with open(system_prompt_path) as f:
+            self.system_prompt = f.read()
+
+        self.build_seconds = time.perf_counter() - t_start
+        self._checked_at = time.monotonic()
+
+    def _timed(self, name: str, build):
+        t0 = time.perf_counter()
+        value = build()
+        self.timings[name] = time.perf_counter() - t0
+        return value
+
+    def _load_mcp_tool(self):
+        try:
+            return self.mcp_loader.get_tool("analyze_neighborhood")
+        except Exception as e:
+            print(f"MCP tool unavailable ({self.mcp_uri}): {e}")
+            return None
+
+    # ----------------------------
+    # Health
+    # ----------------------------
+    def healthy(self) -> bool:
+        """
+        Check the shared resources at most every health_interval seconds.  Stale pooled
+        connections are discarded and the database retried once; False means the runtime
+        should be rebuilt.
+        """
+        now = time.monotonic()
+        if now - self._checked_at < self.health_interval:
+            return True
+        self._checked_at = now
+
+        engine = self.sql_tools._get_engine()
+        for attempt in range(2):
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                break
+            except Exception:
+                if attempt:
+                    return False
+                engine.dispose()
+
+        if self.mcp_tool is None:
+            self.mcp_tool = self._load_mcp_tool()
+        return True
+
+    # ----------------------------
+    # Per-session state
+    # ----------------------------
+    def session(self, result_store, memory: Optional[ConversationMemory] = None) -> "AssistantSession":
+        return AssistantSession(self, result_store, memory=memory)
+
+    def shared_tools(self) -> List[Any]:
+        tools = list(self.community_tools) + [self.stat_func_tool, self.dictionary_tool]
+        if self.mcp_tool is not None:
+            tools.append(self.mcp_tool)
+        if self.search_tool is not None:
+            tools.append(self.search_tool)
+        return tools
+
+    def report(self) -> str:
+        """Cold build time per component: what every rerun paid before the runtime was cached."""
+        lines = [f"{'component':<16} {'ms':>9}"]
+        for name, seconds in self.timings.items():
+            lines.append(f"{name:<16} {seconds * 1000.0:>9.1f}")
+        lines.append(f"{'total':<16} {self.build_seconds * 1000.0:>9.1f}")
+        return "\n".join(lines)
+
+
+class AssistantSession:
+    """
+    Per-session tools and agent over a shared AssistantRuntime.  The chart and map tools
+    keep the latest output for the page, and the SQL/chart/map/statistics tools read and
+    write this session's ResultStore, so these are never shared between sessions.
+    Pass the previous session's memory when rebuilding so the conversation carries over.
+    """
+
+    def __init__(self, runtime: AssistantRuntime, result_store, memory: Optional[ConversationMemory] = None):
+        self.runtime = runtime
+        self.result_store = result_store
+        self.chart_tool = ChartTool(llm=runtime.llm, result_store=result_store)
+        self.map_data = MapDataTool(result_store=result_store)
+        self.sql_tools = runtime.sql_tools.bind(result_store)
+        # remember which MCP tool the agent was built with; rebuild when a retry found it
+        self.mcp_tool = runtime.mcp_tool
+        # caps observations in the scratchpad; counts tokens per turn of this session
+        self.context_budget = ContextBudget(max_tokens=800)
+        # earlier turns and discovered schema facts, so follow-ups skip rediscovery
+        self.memory = memory if memory is not None else ConversationMemory(llm=runtime.llm, max_tokens=1500)
+
+        planner = runtime.planner.bind(self.sql_tools, self.chart_tool) if runtime.planner is not None else None
+
+        tools = self.sql_tools.get_tools() + runtime.shared_tools() + [self.chart_tool, self.map_data.tool]
+        # this session's dictionary hits pick the statistics shown with sql_db_schema
+        self.prefetcher = runtime.prefetcher.bind() if runtime.prefetcher is not None else None
+        if self.prefetcher is not None:
+            tools = self.prefetcher.wrap_tools(tools)
+        self.agent = OpenAIToolCallingAgent(tools=tools, llm=runtime.llm, max_iterations=runtime.max_iterations,
+                                            answer_cache=runtime.answer_cache, payloads=self.payloads,
+                                            tracer=runtime.tracer, system_prompt=runtime.system_prompt,
+                                            context_budget=self.context_budget, memory=self.memory,
+                                            planner=planner)
+
+    # ----------------------------
+    # Chart / map payloads of a turn (cached with the answer)
+    # ----------------------------
+    def begin_turn(self) -> None:
+        """Forget the previous turn's chart so payloads() only reports this turn's."""
+        self.chart_tool._latest_result = None
+
+    def payloads(self) -> Dict[str, Any]:
+        return {"chart": self.chart_tool._latest_result, "map": self.map_data._latest_result}
+
+    def restore_payloads(self, payloads: Dict[str, Any]) -> None:
+        """Put cached payloads back where the page reads them."""
+        self.chart_tool._latest_result = payloads.get("chart")
+        self.map_data._latest_result = payloads.get("map")
+
+    def stale(self, runtime: AssistantRuntime) -> bool:
+        """True when the runtime was rebuilt or gained the MCP tool since this session was built."""
+        return runtime is not self.runtime or runtime.mcp_tool is not self.mcp_tool
@@ -7,7 +7,7 @@
 
 from langchain.tools import BaseTool
 from pydantic import BaseModel, Field
-from typing import Type, Optional
+from typing import Any, Dict, Type, Optional
 from abc import ABC, abstractmethod
 import numpy as np
 import json
@@ -16,12 +16,16 @@ import re
 
 class StatisticalToolInput(BaseModel):
     matrix: Optional[str] = Field(None, description="Matrix input as JSON string or CSV rows.")
-    list_: str = Field(..., description="List/vector input as JSON, CSV, or space-separated string.")
+    list_: str = Field(..., description="List/vector input as JSON, CSV, or space-separated string, or a result column handle such as res_3.value.")
 
 
 class BaseStatisticalTool(BaseTool, ABC):
     name: str = "BaseStatisticalTool"
     description: str = "Base class for statistical tools."
+    # per-session ResultStore; lets LIST/MATRIX be sql_db_query result handles
+    result_store: Optional[Any] = None
+    # pure computations: calls may run concurrently
+    metadata: Optional[Dict[str, Any]] = {"stateful": False}
 
     @abstractmethod
     #def _run(self, matrix: Optional[np.ndarray], vector: np.ndarray) -> float:
@@ -30,6 +34,8 @@ class BaseStatisticalTool(BaseTool, ABC):
         pass
 
     def parse_list(self, text: str) -> np.ndarray:
+        if self.result_store is not None and self.result_store.resolve(text):
+            return np.array(self.result_store.column(text), dtype=float)
         try:
             return np.array(json.loads(text))
         except json.JSONDecodeError:
@@ -38,6 +44,13 @@ class BaseStatisticalTool(BaseTool, ABC):
     def parse_matrix(self, text: Optional[str]) -> Optional[np.ndarray]:
         if text is None:
             return None
+        resolved = self.result_store.resolve(text) if self.result_store is not None else None
+        if resolved:
+            handle, name = resolved
+            if name is not None:
+                return np.array(self.result_store.column(text), dtype=float).reshape(-1, 1)
+            columns = self.result_store.to_columns(handle)
+            return np.column_stack([np.array(v, dtype=float) for v in columns.values()])
         try:
             return np.array(json.loads(text))
         except json.JSONDecodeError:
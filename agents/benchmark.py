@@ -0,0 +1,415 @@
+# benchmark.py
+#
+# Offline benchmark of the tool-calling agent: no OpenAI calls, no Overpass.
+#
+#   cd agents
+#   python benchmark.py --repeat 5 --concurrency 4 --json ../../workspace/data/benchmark.json
+#
+# A scripted chat model replays the recorded tool-call sequences in benchmark_corpus.json
+# (optionally with a fixed --llm-latency per call), so what is measured is the agent loop,
+# the tools and the data layer.  Runs against a SQLite fixture of sdoh_surveys by default,
+# or --db-uri (e.g. a local Postgres; the fixture is loaded only when the table is missing).
+#
+import argparse
+import csv
+import gc
+import json
+import os
+import random
+import socket
+import statistics
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Tuple
+
+# the local sentence-transformers embeddings, not OpenAI's
+os.environ.setdefault("EMBEDDINGS", "local")
+
+from langchain.tools import StructuredTool
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from sqlalchemy import create_engine, inspect, text
+
+from agent_workers import AgentWorkerPool
+from agents import ToolCallingAgent, TraceStore, _message_text, _percentile
+from chart_tool import ChartTool
+from context_budget import ContextBudget, count_tokens
+from dictionary_tool import DictionaryLocalTool
+from mapdata_tool import MapDataTool
+from mcp_tool import McpTool
+from result_store import ResultStore
+from schema_prefetch import SchemaPrefetcher
+from sql_db_list_stat_func_tool import SQLDBListStatFuncTool
+from sql_tool import SQLTools
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+# ----------------------------
+# Scripted chat model
+# ----------------------------
+CHART_CODE = """\
+import matplotlib.pyplot as plt
+fig, ax = plt.subplots(figsize=(8, 4))
+ax.plot([2017, 2018, 2019, 2020], [1.0, 2.0, 1.5, 2.5], marker='o')
+ax.set_xlabel('Year')
+plt.tight_layout()"""
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    Chat model that replays recorded responses instead of calling a provider.
+
+    scripts maps a question to its model turns: a list of tool calls ({"tool", "args"}) or a
+    final answer string.  The turn to replay is the number of AI messages after the question
+    in the prompt, so one instance serves concurrent sessions.  Prompts from the chart tool
+    and the SQL query checker get a fixed chart and the query back.  Every call sleeps
+    latency_s and reports token usage counted on the prompt and response.
+    """
+
+    scripts: Dict[str, List[Any]]
+    latency_s: float = 0.0
+    chart_code: str = CHART_CODE
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop=None, run_manager=None, **kwargs) -> ChatResult:
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        content, tool_calls = self._respond(messages)
+        input_tokens = sum(count_tokens(_message_text(m.content)) for m in messages)
+        output_tokens = count_tokens(content) + (count_tokens(json.dumps(tool_calls)) if tool_calls else 0)
+        message = AIMessage(content=content, tool_calls=tool_calls,
+                            usage_metadata={"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                            "total_tokens": input_tokens + output_tokens})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _respond(self, messages: List[BaseMessage]) -> Tuple[str, List[Dict[str, Any]]]:
+        last = max(i for i, m in enumerate(messages) if isinstance(m, HumanMessage))
+        prompt = _message_text(messages[last].content)
+        if "You generate Python code using only the matplotlib library" in prompt:
+            return f"Chart code:\n```python\n{self.chart_code}\n```", []
+        if "Double check the" in prompt:
+            return prompt.split("Double check the")[0].strip(), []
+        turns = self.scripts.get(prompt.strip())
+        if turns is None:
+            raise ValueError(f"No recorded script for {prompt[:80]!r}")
+        step = sum(1 for m in messages[last + 1:] if isinstance(m, AIMessage))
+        if step >= len(turns):
+            return "The recorded script ended before a final answer.", []
+        turn = turns[step]
+        if isinstance(turn, str):
+            return turn, []
+        return "", [{"name": c["tool"], "args": c["args"], "id": f"call_{step}_{i}", "type": "tool_call"}
+                    for i, c in enumerate(turn)]
+
+
+# ----------------------------
+# Fixtures
+# ----------------------------
+FIXTURE_STATES = ("Ohio", "Texas", "California", "New York", "Florida", "Georgia", "Michigan", "Arizona")
+# column -> (mean, standard deviation) of the generated county values
+FIXTURE_MEASURES = {
+    "acs_tot_pop_wt": (100000.0, 60000.0),
+    "acs_pct_uninsured": (9.0, 3.0),
+    "saipe_pct_pov": (14.0, 4.0),
+    "acs_median_hh_inc": (58000.0, 12000.0),
+    "acs_gini_index": (0.45, 0.03),
+    "acs_pct_unemploy": (5.5, 1.8),
+}
+
+
+def load_fixture(engine, counties: int = 25, years=range(2017, 2021), seed: int = 0) -> int:
+    """Create and fill sdoh_surveys with deterministic county rows unless the table exists; returns rows added."""
+    if inspect(engine).has_table("sdoh_surveys"):
+        return 0
+    rng = random.Random(seed)
+    rows = []
+    for state in FIXTURE_STATES:
+        for c in range(1, counties + 1):
+            for year in years:
+                row = {"state": state, "county": f"{state} County {c}", "year": year}
+                row.update({col: max(0.0, rng.gauss(mean, sd)) for col, (mean, sd) in FIXTURE_MEASURES.items()})
+                rows.append(row)
+    columns = ", ".join(f"{col} DOUBLE PRECISION" if engine.dialect.name == "postgresql" else f"{col} REAL"
+                        for col in FIXTURE_MEASURES)
+    names = ["state", "county", "year"] + list(FIXTURE_MEASURES)
+    with engine.begin() as conn:
+        conn.execute(text(f"CREATE TABLE sdoh_surveys (state TEXT, county TEXT, year INTEGER, {columns}, "
+                          "PRIMARY KEY (state, county, year))"))
+        conn.execute(text(f"INSERT INTO sdoh_surveys ({', '.join(names)}) "
+                          f"VALUES ({', '.join(':' + n for n in names)})"), rows)
+    return len(rows)
+
+
+def load_dictionary(persist_dir: Optional[str], csv_path: str) -> DictionaryLocalTool:
+    """The dictionary index in persist_dir, or one built from the ETL's dictionary.csv in a temporary directory."""
+    if persist_dir and os.path.isdir(persist_dir) and os.listdir(persist_dir):
+        return DictionaryLocalTool(persist_dir=persist_dir, model_name="all-MiniLM-L6-v2", search_k=6)
+    mapping: Dict[str, Dict[str, Any]] = {}
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            table = mapping.setdefault(row["table_name"], {"table_description": row["table_description"], "columns": {}})
+            table["columns"][row["column_name"]] = row["column_description"]
+    dictionary = DictionaryLocalTool(persist_dir=tempfile.mkdtemp(prefix="bench_dict_"),
+                                     model_name="all-MiniLM-L6-v2", search_k=6)
+    dictionary.create_index(mapping)
+    return dictionary
+
+
+def canned_neighborhood(latitude: float, longitude: float, radius: float = 1000) -> Dict[str, Any]:
+    """A fixed analyze_neighborhood response shaped like the OSM MCP server's."""
+    groups = {}
+    for g, (group, subgroup) in enumerate((("healthcare", "clinic"), ("food", "supermarket"),
+                                           ("education", "school"), ("transportation", "bus_stop"))):
+        features = [{"id": g * 100 + i, "name": f"{subgroup.title()} {i + 1}", "type": "node",
+                     "coordinates": {"latitude": latitude + 0.001 * (i + 1), "longitude": longitude - 0.001 * (g + 1)},
+                     "distance": 150.0 * (i + 1), "tags": {"amenity": subgroup, "name": f"{subgroup.title()} {i + 1}"},
+                     "feature_group": group, "sub_feature_group": subgroup}
+                    for i in range(5)]
+        groups[group] = {"count": len(features), "features": features,
+                         "metrics": {"total_count": len(features), "avg_distance": 450.0, "min_distance": 150.0}}
+    return {"center": {"coordinates": {"latitude": latitude, "longitude": longitude}, "address": "Mock address"},
+            "scores": {"overall": 7.5, "walkability": 8, "metric_groups": {g: 7.5 for g in groups}},
+            "metric_groups": groups, "analysis_radius": radius, "timestamp": "2024-01-01T00:00:00"}
+
+
+def start_mock_mcp(port: int = 0, timeout: float = 15.0) -> Optional[str]:
+    """Serve canned_neighborhood as analyze_neighborhood from a local FastMCP server; its URL, or None."""
+    try:
+        from fastmcp import FastMCP
+    except Exception:
+        return None
+    if not port:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    server = FastMCP("mock-osm")
+
+    @server.tool()
+    async def analyze_neighborhood(latitude: float, longitude: float, radius: float = 1000) -> Dict[str, Any]:
+        """Nearby SDOH features around a point (canned benchmark data)."""
+        return canned_neighborhood(latitude, longitude, radius)
+
+    def _serve():
+        try:
+            server.run(transport="http", host="127.0.0.1", port=port, show_banner=False, log_level="warning")
+        except TypeError:
+            server.run(transport="http", host="127.0.0.1", port=port)
+
+    threading.Thread(target=_serve, name="mock-mcp", daemon=True).start()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.5).close()
+            return f"http://127.0.0.1:{port}/mcp"
+        except OSError:
+            time.sleep(0.1)
+    return None
+
+
+def mock_mcp_tool(port: int = 0) -> Tuple[Any, str]:
+    """analyze_neighborhood through the real MCP client and a mock server, or in-process when fastmcp is missing."""
+    url = start_mock_mcp(port)
+    if url is not None:
+        try:
+            tool = McpTool(server_name="OSM", mcp_url=url).get_tool("analyze_neighborhood")
+            if tool is not None:
+                return tool, f"mock MCP server {url}"
+        except Exception as e:
+            print(f"Mock MCP server not reachable ({e}); using the in-process stand-in.")
+    tool = StructuredTool.from_function(func=canned_neighborhood, name="analyze_neighborhood",
+                                        description="Nearby SDOH features around a point.",
+                                        metadata={"stateful": False})
+    return tool, "in-process stand-in (fastmcp not installed)"
+
+
+# ----------------------------
+# Harness
+# ----------------------------
+class Bench:
+    """Shared resources built once; session() gives a fresh agent (own result store, chart and map tools)."""
+
+    def __init__(self, db_uri: str, dictionary: DictionaryLocalTool, mcp_tool, llm: ScriptedChatModel,
+                 system_prompt: str, prefetch: bool = True):
+        self.llm = llm
+        self.sql_tools = SQLTools(db_uri=db_uri, llm=llm)
+        dialect = self.sql_tools._get_engine().dialect.name
+        # the statistical function listing reads pg_proc / duckdb_functions()
+        self.stat_tool = (SQLDBListStatFuncTool(parent=self.sql_tools, schema="public", prefix="")
+                          if dialect in ("postgresql", "duckdb") else None)
+        self.dictionary_tool = dictionary.get_tool()
+        self.mcp_tool = mcp_tool
+        self.system_prompt = system_prompt
+        self.tracer = TraceStore()
+        self.prefetcher = SchemaPrefetcher(self.sql_tools, version_fn=self.sql_tools.data_version) if prefetch else None
+
+    def session(self, traced: bool = True) -> ToolCallingAgent:
+        store = ResultStore()
+        chart = ChartTool(llm=self.llm, result_store=store)
+        map_data = MapDataTool(result_store=store)
+        shared = [t for t in (self.stat_tool, self.dictionary_tool, self.mcp_tool) if t is not None]
+        tools = self.sql_tools.bind(store).get_tools() + shared + [chart, map_data.tool]
+        if self.prefetcher is not None:
+            tools = self.prefetcher.bind().wrap_tools(tools)
+        return ToolCallingAgent(tools=tools, llm=self.llm, max_iterations=10, verbose=False,
+                                tracer=self.tracer if traced else None,
+                                system_prompt=self.system_prompt, context_budget=ContextBudget(max_tokens=800))
+
+    @staticmethod
+    def turn(agent: ToolCallingAgent, question: str) -> Dict[str, Any]:
+        result: Dict[str, Any] = {}
+        for event in agent.stream(question):
+            if event["event"] == "error":
+                raise event["error"]
+            if event["event"] == "final":
+                result = event["result"]
+        agent.trace_done()
+        return result
+
+
+def run_latency(bench: Bench, questions: List[str], repeat: int, warmup: int) -> List[Dict[str, Any]]:
+    """End-to-end latency per question over `repeat` fresh sessions (after `warmup` untimed runs)."""
+    bench.tracer = TraceStore(keep=max(1, len(questions) * repeat))
+    rows = []
+    for question in questions:
+        times, steps = [], 0
+        for n in range(warmup + repeat):
+            # warm-up turns are not traced, so per-tool latency covers the timed turns only
+            agent = bench.session(traced=n >= warmup)
+            t0 = time.perf_counter()
+            result = bench.turn(agent, question)
+            elapsed = (time.perf_counter() - t0) * 1000.0
+            if n >= warmup:
+                times.append(elapsed)
+                steps = len(result.get("intermediate_steps") or [])
+        times.sort()
+        rows.append({"question": question, "runs": len(times), "tool_calls": steps,
+                     "p50_ms": _percentile(times, 0.50), "p95_ms": _percentile(times, 0.95),
+                     "mean_ms": statistics.fmean(times)})
+    return rows
+
+
+def run_allocations(bench: Bench, questions: List[str]) -> List[Dict[str, Any]]:
+    """Peak and retained Python allocations of one turn per question (tracemalloc, all threads)."""
+    rows = []
+    tracemalloc.start()
+    try:
+        for question in questions:
+            agent = bench.session(traced=False)
+            gc.collect()
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            bench.turn(agent, question)
+            after, peak = tracemalloc.get_traced_memory()
+            rows.append({"question": question, "peak_kb": (peak - before) / 1024.0,
+                         "retained_kb": (after - before) / 1024.0})
+    finally:
+        tracemalloc.stop()
+    return rows
+
+
+def run_throughput(bench: Bench, questions: List[str], repeat: int, concurrency: int) -> Dict[str, Any]:
+    """Questions per second with `concurrency` agent workers, each job in its own session."""
+    jobs_in = [(f"user{i}", q) for i, q in enumerate(questions * repeat)]
+    pool = AgentWorkerPool(workers=concurrency, per_user=1, max_queue=len(jobs_in), max_wait=3600.0)
+    agents = [bench.session(traced=False) for _ in jobs_in]
+    t0 = time.perf_counter()
+    jobs = [pool.submit(user, q, (lambda stop, a=agent, q=q: a.stream(q, stop=stop))) for (user, q), agent in zip(jobs_in, agents)]
+    failed = 0
+    for job in jobs:
+        for event in job.events():
+            if event["event"] == "error":
+                failed += 1
+    elapsed = time.perf_counter() - t0
+    snap = pool.snapshot()
+    return {"concurrency": concurrency, "questions": len(jobs), "failed": failed, "seconds": elapsed,
+            "questions_per_s": len(jobs) / elapsed if elapsed else 0.0,
+            "wait_p95_s": snap["wait_p95_s"], "turn_p50_s": snap["turn_p50_s"]}
+
+
+def tool_latency(tracer: TraceStore) -> List[Dict[str, Any]]:
+    return [r for r in tracer.aggregates() if r["kind"] in ("tool", "llm")]
+
+
+def print_report(results: Dict[str, Any]) -> None:
+    print(f"\nSetup: {results['setup']}")
+    print(f"\n{'end-to-end (ms)':<60} {'runs':>5} {'tools':>5} {'p50':>8} {'p95':>8}")
+    for r in results["latency"]:
+        print(f"{r['question'][:60]:<60} {r['runs']:>5} {r['tool_calls']:>5} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+    print(f"\n{'per tool (ms)':<34} {'n':>5} {'p50':>8} {'p95':>8} {'out KB':>7}")
+    for r in results["tools"]:
+        print(f"{(r['kind'] + ':' + r['name'])[:34]:<34} {r['count']:>5} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['mean_output_bytes'] / 1024:>7.1f}")
+    if results.get("allocations"):
+        print(f"\n{'allocations (KB)':<60} {'peak':>9} {'retained':>9}")
+        for r in results["allocations"]:
+            print(f"{r['question'][:60]:<60} {r['peak_kb']:>9.0f} {r['retained_kb']:>9.0f}")
+    print(f"\n{'throughput':<12} {'questions':>9} {'failed':>6} {'seconds':>8} {'q/s':>7} {'wait p95 s':>10}")
+    for r in results["throughput"]:
+        print(f"{'x' + str(r['concurrency']):<12} {r['questions']:>9} {r['failed']:>6} {r['seconds']:>8.2f} "
+              f"{r['questions_per_s']:>7.2f} {r['wait_p95_s']:>10.2f}")
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="Offline latency/allocation/throughput benchmark of the agent.")
+    parser.add_argument("--corpus", default=os.path.join(HERE, "benchmark_corpus.json"))
+    parser.add_argument("--db-uri", help="Database to run against (default: a temporary SQLite fixture)")
+    parser.add_argument("--dictionary-dir", help="Existing dictionary index (default: built from etl_notebooks/dictionary.csv)")
+    parser.add_argument("--dictionary-csv", default=os.path.join(HERE, "..", "etl_notebooks", "dictionary.csv"))
+    parser.add_argument("--system-prompt", default=os.path.join(HERE, "agent_system_prompt.txt"))
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per question")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per question before timing")
+    parser.add_argument("--concurrency", type=int, default=4, help="Workers for the throughput run (also runs x1)")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="Simulated seconds per model call")
+    parser.add_argument("--mcp-port", type=int, default=0)
+    parser.add_argument("--no-prefetch", action="store_true", help="Run without the schema prefetcher")
+    parser.add_argument("--no-allocations", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    with open(args.corpus, encoding="utf-8") as f:
+        corpus = json.load(f)["questions"]
+    questions = [q["question"] for q in corpus]
+    llm = ScriptedChatModel(scripts={q["question"]: q["model_turns"] for q in corpus}, latency_s=args.llm_latency)
+
+    db_uri = args.db_uri or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="bench_db_"), "sdoh.sqlite")
+    engine = create_engine(db_uri)
+    added = load_fixture(engine)
+    engine.dispose()
+    t0 = time.perf_counter()
+    dictionary = load_dictionary(args.dictionary_dir, args.dictionary_csv)
+    dictionary_s = time.perf_counter() - t0
+    mcp_tool, mcp_kind = mock_mcp_tool(args.mcp_port)
+    with open(args.system_prompt, encoding="utf-8") as f:
+        system_prompt = f.read()
+    bench = Bench(db_uri, dictionary, mcp_tool, llm, system_prompt, prefetch=not args.no_prefetch)
+
+    results: Dict[str, Any] = {
+        "setup": (f"{db_uri.split(':')[0]} ({'fixture, ' + str(added) + ' rows' if added else 'existing table'}), "
+                  f"dictionary ready in {dictionary_s:.1f} s, MCP: {mcp_kind}, simulated LLM latency "
+                  f"{args.llm_latency * 1000:.0f} ms, schema prefetch {'off' if args.no_prefetch else 'on'}, "
+                  f"{len(questions)} questions x {args.repeat}"),
+    }
+    results["latency"] = run_latency(bench, questions, args.repeat, args.warmup)
+    results["tools"] = tool_latency(bench.tracer)
+    results["allocations"] = [] if args.no_allocations else run_allocations(bench, questions)
+    results["throughput"] = [run_throughput(bench, questions, args.repeat, n)
+                             for n in sorted({1, max(1, args.concurrency)})]
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -6,8 +6,10 @@ from pydantic import BaseModel, Field, PrivateAttr
 from langchain.prompts import PromptTemplate
 from langchain.schema import HumanMessage
 from langchain.tools import Tool
+import asyncio
 import re
 import json
+from decimal import Decimal
 
 class ChartToolInput(BaseModel):
     """Input for the ChartTool."""
@@ -15,6 +17,15 @@ class ChartToolInput(BaseModel):
     # Optional structured data the agent can pass directly:
     data: Optional[Dict[str, Any]] = Field(None, description="Optional structured data: e.g. {'years':[2017,2018],'values':[-0.8,-0.7]} or {'columns': ['year','correlation'], 'rows': [[2017,-0.8], ...]}")
     csv: Optional[str] = Field(None, description="Optional CSV string with header (year,correlation)")
+    handle: Optional[str] = Field(None, description="Optional result handle from sql_db_query (e.g. 'res_3'); the chart uses the full result")
+
+def _json_default(value: Any) -> Any:
+    """Decimal, date and other DB values from result handles."""
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
 
 def get_chart_langchain_tool(llm):
     chart_tool_instance = ChartTool(llm=llm)
@@ -32,11 +43,15 @@ class ChartTool(BaseTool):
     args_schema: ClassVar[Type[BaseModel]] = ChartToolInput
 
     llm: object = Field(..., description="The LLM to use for chart generation")
+    result_store: Optional[Any] = Field(None, description="Per-session ResultStore used to resolve handles")
+    max_handle_rows: int = Field(1000, description="Rows of a handle result inlined into the chart code")
+    # keeps _latest_result for the page, so calls must not run concurrently
+    metadata: Optional[Dict[str, Any]] = {"stateful": True}
     _chart_prompt_template: PromptTemplate = PrivateAttr()
     _latest_result: dict = PrivateAttr(default=None)
 
-    def __init__(self, llm: object, **kwargs):
-        super().__init__(llm=llm, **kwargs)
+    def __init__(self, llm: object, result_store: Optional[Any] = None, **kwargs):
+        super().__init__(llm=llm, result_store=result_store, **kwargs)
         self._chart_prompt_template = PromptTemplate.from_template("""
         You generate Python code using only the matplotlib library to create a chart based on the user's request.
         You do not generate chart images, image markdown or data URIs.
@@ -94,17 +109,35 @@ class ChartTool(BaseTool):
             return None
         return None
 
-    def _run(self, user_input: str, data: Optional[dict] = None, csv: Optional[str] = None) -> str:
+    def _handle_data(self, handle: str) -> Dict[str, List[Any]]:
+        """Column-oriented data of a result handle, truncated to max_handle_rows."""
+        if self.result_store is None:
+            raise ValueError("Result handles are not enabled in this session.")
+        resolved = self.result_store.resolve(handle)
+        if resolved is None:
+            raise ValueError(f"{handle!r} is not a result handle.")
+        return self.result_store.to_columns(resolved[0], max_rows=self.max_handle_rows)
+
+    def _run(self, user_input: str, data: Optional[dict] = None, csv: Optional[str] = None, handle: Optional[str] = None) -> str:
         """
-        If `data` provided, use it. Else if `csv` provided, parse it.
+        If `handle` provided, use the stored result. Else if `data` provided, use it.
+        Else if `csv` provided, parse it.
         Else try to parse user_input for tuple-list or CSV. Finally fall back to calling the LLM.
         Returns a JSON-stringified dict containing explanation, code_block, and parsed `data`.
         """
 
         parsed_data = None
 
+        # 0) a result handle from sql_db_query carries the full table
+        if handle:
+            try:
+                parsed_data = self._handle_data(handle)
+            except (KeyError, ValueError) as e:
+                message = e.args[0] if e.args else str(e)
+                return json.dumps({"code_block": None, "explanation": message, "status": "error", "data": None})
+
         # 1) prefer structured `data` (explicit)
-        if data and isinstance(data, dict):
+        if parsed_data is None and data and isinstance(data, dict):
             # normalize some common shapes: {'rows':[[2017,-0.8],...]} or {'years':[], 'values':[]}
             if "rows" in data and isinstance(data["rows"], list):
                 try:
@@ -147,7 +180,7 @@ class ChartTool(BaseTool):
         prompt_user_input = user_input
         if parsed_data:
             # provide a concise data snippet to the LLM so it includes inline data
-            data_snippet = "DATA: " + json.dumps(parsed_data)
+            data_snippet = "DATA: " + json.dumps(parsed_data, default=_json_default)
             prompt_user_input = f"{user_input}\n\nNote: Use this parsed numeric data for plotting: {data_snippet}"
 
         query = self._chart_prompt_template.format(user_input=prompt_user_input)
@@ -206,7 +239,8 @@ class ChartTool(BaseTool):
 
         # Return a JSON string so caller/agent can parse programmatically.
         # If you prefer a dict in your environment, you may return `result` directly.
-        return json.dumps(result)
+        return json.dumps(result, default=_json_default)
 
-    def _arun(self, user_input: str):
-        raise NotImplementedError("Async operation not supported for ChartTool")
+    async def _arun(self, user_input: str, data: Optional[dict] = None, csv: Optional[str] = None, handle: Optional[str] = None) -> str:
+        # the streaming agent calls tools asynchronously; run the blocking LLM call on a thread
+        return await asyncio.to_thread(self._run, user_input, data=data, csv=csv, handle=handle)
@@ -8,24 +8,13 @@ import contextlib
 import io
 import os
 import json
+import time
+import uuid
 from typing import Any, Dict, List, Optional
 
-from langchain.agents import initialize_agent, AgentType
-from langchain.chat_models import init_chat_model
-from langchain.agents import load_tools
-from langchain.tools import Tool
-from mcp_tool import McpTool
-from dictionary_tool import DictionaryLocalTool
-from sql_db_list_stat_func_tool import SQLDBListStatFuncTool
-
-from agents import StructuredChatAgent, OpenAIToolCallingAgent
-
-from chart_tool import ChartTool
-from search_tool import SearchTool
-#from sql_tool_music import SQLToolsMusic
-from sql_tool import SQLTools
-from mapdata_tool import MapDataTool
-from dictionary_tool import DictionaryLocalTool
+from agent_workers import AgentWorkerPool, PoolBusy
+from assistant_runtime import AssistantRuntime
+from result_store import ResultStore
 
 # Read the DB URI from environment variable
 db_uri = os.environ.get("DB_URI")
@@ -39,90 +28,69 @@ if not mcp_uri:
     st.error("No MCP_URI found. Please set the MCP_URI environment variable.")
     st.stop()
 
-# OpenAI LLM, key set by docker-compose 
-from langchain_openai import ChatOpenAI
-llm = ChatOpenAI(model="gpt-4o", temperature=0.0)
-
-# Chart tool
-chart_tool = ChartTool(llm=llm)
-
-# Internet search tool - only create if API key is set
-tavily_api_key = os.environ.get("TAVILY_API_KEY")
-if tavily_api_key and tavily_api_key.strip():
-    search_tool = SearchTool()
-else:
-    search_tool = None
-
-# Community tools
-community_tools = load_tools(['llm-math'], llm=llm)
-
-# Dictionary Tool.  Note this tool is used first by ETL to build the dictionary.
-dictionary_tool = DictionaryLocalTool(
-    persist_dir="../../workspace/data", 
-    model_name="all-MiniLM-L6-v2", 
-    search_k=6).get_tool()
-
-# SQL Tools
-SQLToolsObj = SQLTools(db_uri=db_uri, llm=llm)
-sql_tools = SQLToolsObj.get_tools()  # or add your own tools here
-
-# List SQL Functions Tool
-sql_db_list_stat_func_tool = SQLDBListStatFuncTool(parent=SQLToolsObj, schema="public", prefix="")
-
-# MCP Tools
-#mcp_tool = McpTool.create_tool(tool_name="tell_a_joke", base_url=mcp_uri)              #works with get post version of McpTool
-mcp_tool_loader = McpTool(server_name= 'OSM', mcp_url=mcp_uri)
-mcp_tool = mcp_tool_loader.get_tool("analyze_neighborhood")
-print(repr(mcp_tool))
-
-# Map Data Tool
-map_data = MapDataTool()
-# Access LangChain tool for the agent
-map_data_tool = map_data.tool
-
 #
-# We are using ZERO_SHOT_REACT_DESCRIPTION so each tool can only accept one input str.
-# If we used OpenAI there are other agent types that allow more inputs and and input types
-# The statistics tool take 2 inputs that are derived from a single string.  But note that
-# we had to wrap MeanTool (which is a BaseTool) as a tool.  This forces the input to be a
-# single string and avoids introspection which finds multi input methods.
+# Process-wide runtime: LLM, SQL engine and schema reflection, dictionary index, MCP tool.
+# Built once per server process (st.cache_resource) instead of on every rerun; Streamlit
+# reruns this script on each interaction, including typing and map pans.
 #
-#  The Tool wrapper:
-#    does not use args_schema
-#    does not inspect your internal method signatures
-#    does not try to build a JSON schema
-#
-
-# Build tools list conditionally including search_tool only if available
-tools_list = [
-    sql_db_list_stat_func_tool,
-    chart_tool,
-    mcp_tool,
-    map_data_tool,
-    dictionary_tool
-]
-
-# Add search_tool only if it was created
-if search_tool is not None:
-    tools_list.append(search_tool)
+# APPROXIMATE_QUERIES=true adds the sampled sql_db_query_approximate tool
+approximate_queries = os.environ.get("APPROXIMATE_QUERIES", "").strip().lower() in ("1", "true", "yes")
+
+@st.cache_resource(show_spinner="Starting the assistant...")
+def get_runtime(db_uri: str, mcp_uri: str, approximate: bool) -> AssistantRuntime:
+    return AssistantRuntime(db_uri=db_uri, mcp_uri=mcp_uri, approximate=approximate)
+
+rerun_start = time.perf_counter()
+runtime = get_runtime(db_uri, mcp_uri, approximate_queries)
+if not runtime.healthy():
+    # database unreachable even after a reconnect: drop the cached runtime and build a new one
+    get_runtime.clear()
+    try:
+        runtime = get_runtime(db_uri, mcp_uri, approximate_queries)
+    except Exception as e:
+        st.error(f"The assistant could not start: {e}")
+        st.stop()
 
-tools = sql_tools + community_tools + tools_list
-
-# 
-# See the other agents defined in agents.py.  Notes on testws:
-# 
-# ZERO_SHOT_REACT_DESCRIPTION does not support multiple input tools like analyze_neighborhood
-# STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION works with llama-3.3-70b-versatile
-# STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION works fails to terminate using llama-3.1-8b-instant
-# CHAT_CONVERSATIONAL_REACT_DESCRIPTION using llama-3.1-8b-instant
 #
+# Agent turns run on a process-wide worker pool, not on this script's thread: at most
+# AGENT_WORKERS turns run at once, one per browser session, and turns are refused when the
+# queue is full.
+#
+@st.cache_resource
+def get_worker_pool(workers: int, max_queue: int) -> AgentWorkerPool:
+    return AgentWorkerPool(workers=workers, per_user=1, max_queue=max_queue)
+
+worker_pool = get_worker_pool(int(os.environ.get("AGENT_WORKERS", "4")),
+                              int(os.environ.get("AGENT_MAX_QUEUE", "16")))
+user_id = st.session_state.setdefault("user_id", uuid.uuid4().hex)
 
 #
-# Use the OpenAI Tools Calling Agent
+# Per-session state: result store, chart/map tools and the agent bound to them.
+# Tools exchange short result handles (res_1, res_2, ...) instead of passing rows through the LLM.
 #
-agent = OpenAIToolCallingAgent(tools=tools, llm=llm, max_iterations=10)
-
-# st.write("DEBUG:", agent.agent.llm_chain.prompt.template)
+if "result_store" not in st.session_state:
+    st.session_state["result_store"] = ResultStore(max_bytes=64 * 1024 * 1024)
+result_store = st.session_state["result_store"]
+session = st.session_state.get("assistant_session")
+if session is None or session.stale(runtime):
+    # keep the conversation memory across a runtime rebuild
+    session = runtime.session(result_store, memory=session.memory if session is not None else None)
+    st.session_state["assistant_session"] = session
+
+chart_tool = session.chart_tool
+map_data = session.map_data
+SQLToolsObj = runtime.sql_tools
+agent = session.agent
+
+# Setup time of this rerun vs. the cold build every rerun used to pay
+rerun_ms = (time.perf_counter() - rerun_start) * 1000.0
+st.session_state.setdefault("rerun_setup_ms", []).append(rerun_ms)
+with st.sidebar.expander("Rerun latency"):
+    history = sorted(st.session_state["rerun_setup_ms"][-50:])
+    st.markdown(f"This rerun: **{rerun_ms:.1f} ms** setup "
+                f"(median of last {len(history)}: {history[len(history) // 2]:.1f} ms)")
+    st.markdown("Uncached build (previously paid on every rerun):")
+    st.code(runtime.report())
 
 # Title
 st.title("🧠 Data Analytics Assistant")
@@ -132,6 +100,7 @@ st.title("🧠 Data Analytics Assistant")
 #
 if "messages" not in st.session_state or st.sidebar.button("Clear message history"):
     st.session_state["messages"] = [{"role": "assistant", "content": "How can I help you?"}]
+    session.memory.clear()
 for msg in st.session_state.messages:
     st.write(f"**{msg['role'].capitalize()}:** {msg['content']}")
 
@@ -232,10 +201,57 @@ def render_map_from_tool(map_tool):
         _map_fragment(ss.map_payload)
 
 #
-# Get the system level prompt to pre-append to each prompt
+# Query templates seen by sql_db_query: counts, mean latency and prepared-statement runs
+#
+with st.sidebar.expander("Query templates"):
+    st.code(SQLToolsObj.templates.report(top=15, width=70))
+
+#
+# Semantic answer cache shared by all sessions: hits, stores, invalidations on data reloads
 #
-with open("agent_system_prompt.txt") as f:
-    SYSTEM_PROMPT = f.read()
+if runtime.answer_cache is not None:
+    with st.sidebar.expander("Answer cache"):
+        st.write(runtime.answer_cache.report())
+
+#
+# Questions answered by the fast-path planner vs. the full agent
+#
+if runtime.planner is not None:
+    with st.sidebar.expander("Fast path"):
+        st.code(runtime.planner.report())
+
+#
+# Schema and column statistics prefetched after dictionary lookups
+#
+if runtime.prefetcher is not None:
+    with st.sidebar.expander("Schema prefetch"):
+        st.write(runtime.prefetcher.report())
+
+#
+# Worker pool: queue depth, wait times and shed turns across all sessions
+#
+with st.sidebar.expander("Agent workers"):
+    st.code(worker_pool.report())
+    previous_job = st.session_state.get("agent_job")
+    if previous_job is not None and not previous_job.done:
+        st.info("Your previous request is still running.")
+
+#
+# Tokens per turn: observations as returned by tools vs. as sent after compaction
+#
+with st.sidebar.expander("Context budget"):
+    st.code(session.context_budget.report())
+
+#
+# What the agent remembers of this conversation: summary, recent turns, schema facts
+#
+with st.sidebar.expander("Conversation memory"):
+    st.write(session.memory.report())
+    facts = session.memory.facts_text()
+    if facts:
+        st.code(facts)
+    if session.memory.summary:
+        st.markdown("**Summary of earlier turns:** " + session.memory.summary)
 
 #
 # Get user input
@@ -250,83 +266,187 @@ prompt = st.text_area(
 # Write response, run chart if generated, render map if map data
 #
 if prompt:
-    with st.spinner("Working on it..."):
+    try:
+        #
+        # Write the input to messages
+        #
+        st.session_state.messages.append({"role": "user", "content": prompt})
+
+        #
+        # Stream the agent: show each tool call and result as it happens and the final
+        # answer token by token, instead of a spinner until the whole loop finishes.
+        # The static system prompt is in the agent's system message, not in each request.
+        #
+        turn_prompt = prompt
+        turn_start = time.perf_counter()
+        first_output_s = None
+        result = {}
+        turn_cached = False
+        answer = ""
+        step = 0
+        status = st.status("Working on it...", expanded=True)
+        answer_slot = st.empty()
+
+        def run_turn(stop):
+            """Runs on a pool worker: forget the previous chart, then stream the agent."""
+            session.begin_turn()
+            return agent.stream(turn_prompt, stop=stop)
+
+        # a turn left running by an interrupted rerun still holds this user's slot: stop it first
+        previous_job = st.session_state.get("agent_job")
+        if previous_job is not None and not previous_job.done:
+            previous_job.cancel()
+            previous_job.wait(timeout=10.0)
         try:
-            #
-            # Write the input to messages
-            #
-            st.session_state.messages.append({"role": "user", "content": prompt})
-
-            #
-            # Run the agent and get the response and intermediate steps
-            #
-            turn_prompt = SYSTEM_PROMPT + "\n\nUser request:\n" + prompt
-            result = agent.run(turn_prompt) 
-            intermediate_steps = result.get("intermediate_steps", [])
-            final_output = result.get("output", "")
-            #
-            # Show the intermediate steps
-            #
-            if intermediate_steps:
-                st.subheader("🧩 Intermediate Reasoning Steps")
-                for i, step in enumerate(intermediate_steps):
-                    st.markdown(f"**Step {i+1}:**")
-                    st.markdown(f"- **Action:** `{step[0].tool}`")
-                    st.markdown(f"- **Tool Input:** `{step[0].tool_input}`")
+            job = worker_pool.submit(user_id, turn_prompt, run_turn)
+        except PoolBusy as busy:
+            # shed under load: the turn never ran, so it is not part of the conversation
+            st.session_state.messages.pop()
+            status.update(label="Not started", state="error")
+            if busy.retry_after:
+                busy.args = (f"{busy} (about {busy.retry_after:.0f} s)",)
+            raise
+        st.session_state["agent_job"] = job
+        try:
+            for event in job.events(position=worker_pool.position):
+                kind = event["event"]
+                if kind == "error":
+                    raise event["error"]
+                if kind == "queued":
+                    status.update(label=f"Waiting for a free worker (position {event['position']})...")
+                    continue
+                if first_output_s is None:
+                    first_output_s = time.perf_counter() - turn_start
+                if kind == "tool_start":
+                    # text streamed before a tool call is reasoning, not the answer
+                    if answer.strip():
+                        status.markdown(answer)
+                    answer = ""
+                    answer_slot.empty()
+                    step += 1
+                    status.update(label=f"Step {step}: {event['tool']}...")
+                    status.markdown(f"**Step {step}:**")
+                    status.markdown(f"- **Action:** `{event['tool']}`")
+                    status.markdown(f"- **Tool Input:** `{event['tool_input']}`")
+                elif kind == "tool_end":
                     # Trim observations longer than 5 lines and append notice
-                    obs = step[1]
+                    obs = event["observation"]
                     obs_lines = str(obs).splitlines()
                     if len(obs_lines) > 5:
                         obs = "\n".join(obs_lines[:5]) + "\n......trimmed to 5 lines"
-                    st.markdown(f"- **Observation:**")
-                    st.code(obs)
-            #
-            #  Add the response to history
-            #
-            st.session_state.messages.append({"role": "assistant", "content": final_output})
-            #
-            # Show the response
-            #
-            st.subheader("💬 Final Answer")
-            st.markdown(final_output)
-            #
-            # If chart code was generated, run the code
-            #
-            if hasattr(chart_tool, "_latest_result") and chart_tool._latest_result:
-                result = chart_tool._latest_result
-                code_block = result.get("code_block")
-
-                if code_block:
-                    st.subheader("📊 Chart")
-                    st.markdown(result.get("explanation"))
-
-                    try:
-                        # Always reset the matplotlib state
-                        plt.close('all')
-
-                        # strip close if include in code so it isn't close before we presnet with plt.gcf()
-                        code_block = code_block.replace("\nplt.close()", "")
-
-                        local_vars = {"plt": plt, "__builtins__": __builtins__}
-                        with contextlib.redirect_stdout(io.StringIO()):
-                            exec(code_block, local_vars)
-
-                        # Force matplotlib to finalize any figure created
-                        fig = plt.gcf()
-
-                        if fig and fig.get_axes():
-                            st.pyplot(fig)
-                        else:
-                            st.warning("No chart was generated. The code ran, but no figure was created.")
-
-                    except Exception as e:
-                        st.error(f"Error running chart code: {e}")
-
-                else:
-                    st.info("No chart code was generated in the response. ")
-
-        except Exception as e:
-            st.error(f"An error occurred: {e}")
-                        
+                    status.markdown(f"- **Observation:**")
+                    status.code(obs)
+                elif kind == "token":
+                    answer += event["text"]
+                    answer_slot.markdown(answer)
+                elif kind == "final":
+                    result = event["result"]
+        finally:
+            # an interrupted rerun (new input, Stop) must not leave the turn running on the pool
+            if not job.done:
+                job.cancel()
+        answer_slot.empty()
+        status.update(label=f"🧩 Intermediate Reasoning Steps ({step})", state="complete", expanded=False)
+        final_output = result.get("output", answer)
+        cached = result.get("cached")
+        turn_cached = bool(cached)
+        if cached:
+            # similar question answered before on the same data: reuse its chart and map
+            session.restore_payloads(cached["payloads"])
+            status.update(label="Answered from cache", state="complete", expanded=False)
+            st.info(f"Answered from cache: a similar question (similarity {cached['similarity']:.2f}, "
+                    f"{cached['age_s'] / 60:.0f} min ago) was \"{cached['question']}\"")
+        elif result.get("fast_path"):
+            status.update(label="Answered on the fast path (no agent loop)", state="complete", expanded=False)
+
+        #
+        # Time to first visible output vs. the full turn
+        #
+        total_s = time.perf_counter() - turn_start
+        first_output_s = total_s if first_output_s is None else first_output_s
+        st.session_state.setdefault("turn_latency", []).append((first_output_s, total_s))
+        st.caption(f"First output after {first_output_s:.2f} s; full answer after {total_s:.2f} s")
+        with st.sidebar.expander("Turn latency"):
+            turns = st.session_state["turn_latency"][-20:]
+            st.code("\n".join([f"{'turn':>4} {'first s':>8} {'total s':>8}"] + [
+                f"{n:>4} {first:>8.2f} {total:>8.2f}" for n, (first, total) in enumerate(turns, 1)]))
+        #
+        #  Add the response to history
+        #
+        st.session_state.messages.append({"role": "assistant", "content": final_output})
+        #
+        # Show the response
+        #
+        st.subheader("💬 Final Answer")
+        st.markdown(final_output)
+        #
+        # If chart code was generated, run the code
+        #
+        if hasattr(chart_tool, "_latest_result") and chart_tool._latest_result:
+            result = chart_tool._latest_result
+            code_block = result.get("code_block")
+
+            if code_block:
+                st.subheader("📊 Chart")
+                st.markdown(result.get("explanation"))
+
+                try:
+                    # Always reset the matplotlib state
+                    plt.close('all')
+
+                    # strip close if include in code so it isn't close before we presnet with plt.gcf()
+                    code_block = code_block.replace("\nplt.close()", "")
+
+                    local_vars = {"plt": plt, "__builtins__": __builtins__}
+                    chart_start = time.perf_counter()
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        exec(code_block, local_vars)
+                    if agent.last_trace is not None:
+                        agent.last_trace.add_span("render", "chart_exec", chart_start, time.perf_counter())
+
+                    # Force matplotlib to finalize any figure created
+                    fig = plt.gcf()
+
+                    if fig and fig.get_axes():
+                        st.pyplot(fig)
+                    else:
+                        st.warning("No chart was generated. The code ran, but no figure was created.")
+
+                except Exception as e:
+                    st.error(f"Error running chart code: {e}")
+
+            else:
+                st.info("No chart code was generated in the response. ")
+
+    except Exception as e:
+        st.error(f"An error occurred: {e}")
+        if agent.last_trace is not None:
+            agent.trace_done(error=str(e)[:200])
+
     # If map data was generated, render map
-        render_map_from_tool(map_data)
\ No newline at end of file
+    map_start = time.perf_counter()
+    render_map_from_tool(map_data)
+    if agent.last_trace is not None:
+        agent.last_trace.add_span("render", "map", map_start, time.perf_counter())
+        agent.trace_done(cached=turn_cached)
+
+#
+# Traces: waterfall of the last turn (LLM calls, tools, rendering) and p50/p95 per span
+#
+with st.sidebar.expander("Traces"):
+    last_turns = runtime.tracer.recent(1)
+    if last_turns and last_turns[-1]["spans"]:
+        spans = last_turns[-1]["spans"]
+        colors = {"llm": "tab:blue", "tool": "tab:orange", "render": "tab:green"}
+        fig, ax = plt.subplots(figsize=(4, 0.3 * len(spans) + 0.8))
+        for i, sp in enumerate(spans):
+            ax.barh(i, sp["duration_ms"] / 1000.0, left=sp["start_ms"] / 1000.0,
+                    color=colors.get(sp["kind"], "tab:gray"))
+        ax.set_yticks(range(len(spans)))
+        ax.set_yticklabels([f"{sp['kind']}:{sp['name']}"[:24] for sp in spans], fontsize=7)
+        ax.invert_yaxis()
+        ax.set_xlabel("seconds since turn start", fontsize=7)
+        ax.tick_params(axis="x", labelsize=7)
+        st.pyplot(fig)
+        plt.close(fig)
+    st.code(runtime.tracer.report(width=24))
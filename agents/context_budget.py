@@ -0,0 +1,205 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import tiktoken  # type: ignore
+except Exception:
+    tiktoken = None  # type: ignore
+
+_encoding = None
+_encoding_failed = False
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text for the gpt-4o tokenizer when tiktoken can load it, else about 4 characters per token."""
+    global _encoding, _encoding_failed
+    if not text:
+        return 0
+    if _encoding is None and not _encoding_failed and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            # encoding files not cached and no network: fall back to the estimate
+            _encoding_failed = True
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def truncate_tokens(text: str, max_tokens: int, keep: str = "start", marker: str = " ...") -> str:
+    """
+    text cut to at most max_tokens, keeping its start (keep="start", marker appended) or its
+    end (keep="end", marker prepended).
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    # cut proportionally, then tighten until it fits
+    cut = len(text) * max_tokens // max(count_tokens(text), 1)
+    while cut > 0 and count_tokens(text[:cut] if keep == "start" else text[len(text) - cut:]) > max_tokens:
+        cut = int(cut * 0.9)
+    return text[:cut] + marker if keep == "start" else marker + text[len(text) - cut:]
+
+
+class ContextBudget:
+    """
+    Keeps tool observations in the agent scratchpad within a token budget.
+
+    Only what the model sees is changed; intermediate steps returned to the page keep the
+    full observations.  Each observation is compacted, then capped:
+
+        - JSON (e.g. MCP neighborhood features): raw OSM `tags` and other drop_keys are
+          removed, floats rounded to `digits` significant digits, lists longer than
+          max_items cut with a count of the omitted items;
+        - row lists in SQLDatabase.run format ("[(...), (...)]"): the first max_rows rows
+          and the number of rows left out;
+        - any text: long decimals rounded, then cut to max_tokens with a note.
+
+    Per-turn token counts (raw vs. sent) are kept for reporting.  A turn's observations
+    are re-sent on every model call of the loop, so counts are summed over calls.
+
+    Example:
+        budget = ContextBudget(max_tokens=800)
+        agent = create_tool_calling_agent(llm, tools, prompt, message_formatter=budget.message_formatter())
+    """
+
+    _LONG_DECIMAL_RE = re.compile(r"(?<![\w.])-?\d+\.\d{7,}")
+
+    def __init__(
+        self,
+        max_tokens: int = 800,
+        max_items: int = 20,
+        max_rows: int = 20,
+        digits: int = 7,
+        drop_keys: Sequence[str] = ("tags",),
+    ):
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_rows = max_rows
+        self.digits = digits
+        self.drop_keys = set(drop_keys)
+        self._memo: Dict[Tuple[str, int], Tuple[str, int, int]] = {}
+        self._lock = threading.Lock()
+        self.turn: Dict[str, int] = {}
+        self.history: List[Dict[str, int]] = []
+        self.begin_turn()
+
+    # ----------------------------
+    # Compaction
+    # ----------------------------
+    def compact(self, observation: Any, tool: str = "") -> str:
+        """Compacted, token-capped text of one observation."""
+        structured = observation if isinstance(observation, (dict, list)) else self._as_json(observation)
+        if structured is not None:
+            text = json.dumps(self._compact_value(structured), separators=(",", ":"), default=str)
+        else:
+            text = self._compact_rows(str(observation))
+            text = self._LONG_DECIMAL_RE.sub(lambda m: f"{float(m.group()):.{self.digits}g}", text)
+        return self._cap(text)
+
+    @staticmethod
+    def _as_json(text: Any) -> Optional[Any]:
+        if not isinstance(text, str):
+            return None
+        stripped = text.strip()
+        if not stripped or stripped[0] not in "[{":
+            return None
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            return None
+
+    def _compact_value(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {k: self._compact_value(v) for k, v in value.items() if k not in self.drop_keys}
+        if isinstance(value, list):
+            items = [self._compact_value(v) for v in value[: self.max_items]]
+            if len(value) > self.max_items:
+                items.append(f"... {len(value) - self.max_items} more items")
+            return items
+        if isinstance(value, float):
+            return float(f"{value:.{self.digits}g}")
+        return value
+
+    def _compact_rows(self, text: str) -> str:
+        stripped = text.strip()
+        if not (stripped.startswith("[(") and stripped.endswith(")]")):
+            return text
+        rows = stripped[2:-2].split("), (")
+        if len(rows) <= self.max_rows:
+            return text
+        kept = "[(" + "), (".join(rows[: self.max_rows]) + ")]"
+        return f"{kept}\n... {len(rows) - self.max_rows} more rows not shown (aggregate, filter or use LIMIT)"
+
+    def _cap(self, text: str) -> str:
+        return truncate_tokens(text, self.max_tokens, marker=f"\n... [truncated to {self.max_tokens} tokens]")
+
+    # ----------------------------
+    # Scratchpad formatting
+    # ----------------------------
+    def message_formatter(self, formatter=None):
+        """
+        A message_formatter for create_tool_calling_agent: compacts each step's observation,
+        then formats with `formatter` (default format_to_tool_messages).
+        """
+        if formatter is None:
+            from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+            formatter = format_to_tool_messages
+
+        def _format(intermediate_steps: List[Tuple[Any, Any]]):
+            steps = []
+            raw_total = sent_total = 0
+            for action, observation in intermediate_steps:
+                text, raw, sent = self._compact_cached(observation, getattr(action, "tool", ""))
+                steps.append((action, text))
+                raw_total += raw
+                sent_total += sent
+            with self._lock:
+                self.turn["model_calls"] += 1
+                self.turn["observation_tokens_raw"] += raw_total
+                self.turn["observation_tokens_sent"] += sent_total
+            return formatter(steps)
+
+        return _format
+
+    def _compact_cached(self, observation: Any, tool: str) -> Tuple[str, int, int]:
+        raw_text = observation if isinstance(observation, str) else json.dumps(observation, default=str)
+        key = (tool, hash(raw_text))
+        with self._lock:
+            hit = self._memo.get(key)
+        if hit is None:
+            text = self.compact(observation, tool)
+            hit = (text, count_tokens(raw_text), count_tokens(text))
+            with self._lock:
+                if len(self._memo) > 256:
+                    self._memo.clear()
+                self._memo[key] = hit
+        return hit
+
+    # ----------------------------
+    # Reporting
+    # ----------------------------
+    def begin_turn(self, **fields: int) -> None:
+        """Start counting a new turn; fields (e.g. system/user prompt tokens) are stored with it."""
+        with self._lock:
+            if self.turn.get("model_calls"):
+                self.history.append(self.turn)
+                self.history = self.history[-50:]
+            self.turn = {"model_calls": 0, "observation_tokens_raw": 0, "observation_tokens_sent": 0, **fields}
+
+    def report(self) -> str:
+        turns = [t for t in self.history + [self.turn] if t.get("model_calls")]
+        if not turns:
+            return "(no turns yet)"
+        lines = [f"{'turn':>4} {'calls':>5} {'obs raw':>8} {'obs sent':>8} {'prompt before':>13} {'prompt after':>12}"]
+        for n, t in enumerate(turns[-10:], 1):
+            # before: the static prompt was in every user message and observations went in verbatim
+            static = t.get("system_tokens", 0)
+            before = t["model_calls"] * (static + t.get("user_tokens", 0)) + t["observation_tokens_raw"]
+            after = t["model_calls"] * (static + t.get("user_tokens", 0)) + t["observation_tokens_sent"]
+            lines.append(f"{n:>4} {t['model_calls']:>5} {t['observation_tokens_raw']:>8} "
+                         f"{t['observation_tokens_sent']:>8} {before:>13} {after:>12}")
+        lines.append("The static system prompt is now a cacheable system-message prefix; "
+                     "'after' counts it in full.")
+        return "\n".join(lines)
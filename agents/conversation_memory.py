@@ -0,0 +1,210 @@
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, List, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from context_budget import count_tokens, truncate_tokens
+
+
+class ConversationMemory:
+    """
+    Bounded conversation memory for the tool-calling agent.
+
+    The history sent with each turn stays within max_tokens:
+
+        - schema facts discovered by earlier tool calls (dictionary hits, sql_db_schema
+          tables and columns, listed tables, stat function signatures), newest first, capped
+          at facts_tokens, so follow-up questions can skip the dictionary/schema tools;
+        - a rolling summary of older turns, capped at summary_tokens;
+        - the most recent turns verbatim (question and final answer), up to recent_turns.
+
+    Turns pushed out of the recent window are folded into the summary on a background
+    thread, by the LLM when one is given (one short call), otherwise by keeping each
+    question with the start of its answer.
+
+    Example:
+        memory = ConversationMemory(llm=llm, max_tokens=1500)
+        result = executor.invoke({"input": q, "history": memory.messages()})
+        memory.add_turn(q, result["output"], result["intermediate_steps"])
+    """
+
+    _DICT_RE = re.compile(r"table:\s*(\S+)\s*\ncolumn:\s*(\S+)\s*\ntext:\s*([^\n]*)", re.I)
+    _CREATE_RE = re.compile(r"CREATE TABLE\s+\"?(\w+)\"?\s*\((.*?)\n\)", re.I | re.S)
+    _COLUMN_RE = re.compile(r"^\s*\"?(\w+)\"?\s+([A-Za-z][\w ()\[\],]*?)\s*,?\s*$")
+    _FUNC_RE = re.compile(r"^(\w+)\.(\w+)\((.*)\) -> (.*)$", re.M)
+    _FOLLOW_UP_RE = re.compile(
+        r"^\s*(and|also|now|same|what about|how about|instead|then|but|only|just|compare|vs\.?|versus)\b"
+        r"|\b(it|that|those|these|them|this|same|previous|above|again)\b",
+        re.I,
+    )
+
+    def __init__(
+        self,
+        llm=None,
+        max_tokens: int = 1500,
+        recent_turns: int = 3,
+        summary_tokens: int = 300,
+        facts_tokens: int = 500,
+        answer_tokens: int = 250,
+    ):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_tokens = summary_tokens
+        self.facts_tokens = facts_tokens
+        self.answer_tokens = answer_tokens
+        self.summary = ""
+        self._recent: List[Tuple[str, str]] = []
+        self._pending: List[Tuple[str, str]] = []  # turns waiting to be folded into the summary
+        # fact key -> line, most recently confirmed last
+        self._facts: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._summarizing = False
+
+    # ----------------------------
+    # Recording
+    # ----------------------------
+    def add_turn(self, question: str, answer: str, steps: Sequence[Tuple[Any, Any]] = ()) -> None:
+        """Record a completed turn and the schema facts its tool calls returned."""
+        for action, observation in steps or ():
+            self._learn(getattr(action, "tool", ""), getattr(observation, "content", observation))
+        with self._lock:
+            self._recent.append((question, truncate_tokens(answer or "", self.answer_tokens)))
+            while len(self._recent) > self.recent_turns:
+                self._pending.append(self._recent.pop(0))
+            start = bool(self._pending) and not self._summarizing
+            self._summarizing = self._summarizing or start
+        if start:
+            threading.Thread(target=self._fold_pending, name="memory-summary", daemon=True).start()
+
+    def _learn(self, tool: str, observation: Any) -> None:
+        text = observation if isinstance(observation, str) else str(observation)
+        facts: List[Tuple[str, str]] = []
+        if tool == "database_column_descriptions":
+            for table, column, desc in self._DICT_RE.findall(text):
+                facts.append((f"col:{table}.{column}", f"{table}.{column}: {desc.strip()[:100]}"))
+        elif tool == "sql_db_schema":
+            for table, body in self._CREATE_RE.findall(text):
+                columns = []
+                for line in body.splitlines():
+                    m = self._COLUMN_RE.match(line)
+                    if m and m.group(1).upper() not in ("PRIMARY", "CONSTRAINT", "FOREIGN", "UNIQUE", "CHECK"):
+                        columns.append(f"{m.group(1)} {m.group(2).split()[0].lower()}")
+                shown = ", ".join(columns[:40]) + (f", ... ({len(columns)} columns)" if len(columns) > 40 else "")
+                facts.append((f"table:{table}", f"table {table}({shown})"))
+        elif tool == "sql_db_list_tables":
+            facts.append(("tables", "tables: " + text.strip()[:300]))
+        elif tool == "sql_db_list_statistical_functions":
+            for schema, name, args, returns in self._FUNC_RE.findall(text):
+                facts.append((f"func:{name}", f"function {schema}.{name}({args}) -> {returns}"))
+        if not facts:
+            return
+        with self._lock:
+            for key, line in facts:
+                self._facts.pop(key, None)
+                self._facts[key] = line
+
+    def _fold_pending(self) -> None:
+        while True:
+            with self._lock:
+                turns, self._pending = self._pending, []
+                summary = self.summary
+                if not turns:
+                    self._summarizing = False
+                    return
+            new_summary = self._summarize(summary, turns)
+            with self._lock:
+                self.summary = truncate_tokens(new_summary, self.summary_tokens, keep="end", marker="... ")
+
+    def _summarize(self, summary: str, turns: List[Tuple[str, str]]) -> str:
+        transcript = "\n".join(f"Q: {q}\nA: {a}" for q, a in turns)
+        if self.llm is not None:
+            try:
+                response = self.llm.invoke(
+                    "Update the running summary of a data analysis conversation. Keep the questions asked, "
+                    "measures/columns, filters, years and key numeric findings; drop pleasantries. "
+                    f"At most {self.summary_tokens * 3 // 4} words.\n\n"
+                    f"Summary so far:\n{summary or '(none)'}\n\nNew turns:\n{transcript}\n\nUpdated summary:"
+                )
+                return getattr(response, "content", str(response)).strip()
+            except Exception:
+                pass  # fall back to the extractive summary
+        lines = [summary] if summary else []
+        lines += [f"- Asked: {q.strip()[:150]} Answer began: {a.strip()[:150]}" for q, a in turns]
+        return "\n".join(lines)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.summary = ""
+            self._recent, self._pending = [], []
+            self._facts.clear()
+
+    # ----------------------------
+    # Prompt
+    # ----------------------------
+    def has_history(self) -> bool:
+        return bool(self._recent or self.summary)
+
+    def is_follow_up(self, question: str) -> bool:
+        """
+        Whether a question likely depends on earlier turns (and so must not come from the answer
+        cache or the fast path): it starts with a connector ("and", "what about") or refers back
+        with a pronoun ("it", "those", "same").  Length alone says nothing; short questions are
+        often complete ones.
+        """
+        return self.has_history() and bool(self._FOLLOW_UP_RE.search(question))
+
+    def facts_text(self) -> str:
+        with self._lock:
+            lines = list(reversed(self._facts.values()))
+        if not lines:
+            return ""
+        header = ("Known schema from earlier tool calls (reuse it; call database_column_descriptions or "
+                  "sql_db_schema only for columns not listed here):")
+        kept, used = [], count_tokens(header)
+        for line in lines:
+            used += count_tokens(line) + 1
+            if used > self.facts_tokens:
+                break
+            kept.append(line)
+        return header + "\n" + "\n".join(kept)
+
+    def messages(self) -> List[BaseMessage]:
+        """History messages for the prompt, within max_tokens (oldest verbatim turns dropped first)."""
+        with self._lock:
+            summary = self.summary
+            pending = list(self._pending)
+            recent = list(self._recent)
+        context = []
+        facts = self.facts_text()
+        if facts:
+            context.append(facts)
+        if summary:
+            context.append("Summary of earlier conversation:\n" + summary)
+        if pending:
+            # not folded into the summary yet
+            context.append("Earlier questions:\n" + "\n".join(f"- {q.strip()[:150]}" for q, _ in pending))
+        out: List[BaseMessage] = []
+        budget = self.max_tokens
+        if context:
+            text = truncate_tokens("\n\n".join(context), budget)
+            out.append(SystemMessage(content=text))
+            budget -= count_tokens(text)
+        turns: List[BaseMessage] = []
+        for question, answer in reversed(recent):
+            cost = count_tokens(question) + count_tokens(answer)
+            if cost > budget:
+                break
+            budget -= cost
+            turns = [HumanMessage(content=question), AIMessage(content=answer)] + turns
+        return out + turns
+
+    def report(self) -> str:
+        messages = self.messages()
+        tokens = sum(count_tokens(str(m.content)) for m in messages)
+        with self._lock:
+            n_recent, n_facts = len(self._recent), len(self._facts)
+        return (f"{tokens}/{self.max_tokens} tokens: {n_recent} recent turns, "
+                f"summary {count_tokens(self.summary)} tokens, {n_facts} schema facts")
@@ -86,6 +86,7 @@ class DictionaryLocalTool:
             document_prompt=self.doc_prompt,
             response_format=self.response_format,
         )
+        self.tool.metadata = {"stateful": False}  # read-only lookups may run concurrently
 
 
     def _to_document(self, item) -> Document:
@@ -189,6 +190,7 @@ class DictionaryLocalTool:
             document_prompt=self.doc_prompt,
             response_format=self.response_format,
         )
+        self.tool.metadata = {"stateful": False}  # read-only lookups may run concurrently
 
         self.persist_dir = pd
         return self.vectordb
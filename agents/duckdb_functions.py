@@ -0,0 +1,78 @@
+import math
+from typing import Optional
+
+from sqlalchemy import event
+
+
+def _betacf(a: float, b: float, x: float, max_iter: int = 200, eps: float = 3e-14) -> float:
+    """Continued fraction for the regularized incomplete beta function (Lentz's method)."""
+    tiny = 1e-300
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c, d = 1.0, 1.0 - qab * x / qap
+    d = 1.0 / (d if abs(d) > tiny else tiny)
+    h = d
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        aa = m * (b - m) * x / ((qam + m2) * (a + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        h *= d * c
+        aa = -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))
+        d = 1.0 + aa * d
+        d = 1.0 / (d if abs(d) > tiny else tiny)
+        c = 1.0 + aa / c
+        c = c if abs(c) > tiny else tiny
+        delta = d * c
+        h *= delta
+        if abs(delta - 1.0) < eps:
+            break
+    return h
+
+
+def _betainc(a: float, b: float, x: float) -> float:
+    """Regularized incomplete beta I_x(a, b)."""
+    if x <= 0.0:
+        return 0.0
+    if x >= 1.0:
+        return 1.0
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log1p(-x))
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _betacf(a, b, x) / a
+    return 1.0 - front * _betacf(b, a, 1.0 - x) / b
+
+
+def pearson_p_value(r: Optional[float], n: Optional[int]) -> Optional[float]:
+    """
+    Two-sided p-value for a Pearson correlation r over n pairs (t test with n - 2 degrees
+    of freedom), the value scipy.stats.pearsonr returns.
+    """
+    if r is None or n is None or n < 3 or math.isnan(r):
+        return None
+    if abs(r) >= 1.0:
+        return 0.0
+    df = n - 2.0
+    t2 = r * r * df / (1.0 - r * r)
+    return _betainc(df / 2.0, 0.5, df / (df + t2))
+
+
+def register_duckdb_functions(conn) -> None:
+    """
+    Register the Python UDFs the stat_* macros in the DuckDB database call.
+    `conn` is a duckdb connection (or the duckdb-engine DBAPI wrapper around one).
+    """
+    conn.create_function("pearson_p_value", pearson_p_value, ["DOUBLE", "BIGINT"], "DOUBLE",
+                         null_handling="special")
+
+
+def install_duckdb_hooks(engine) -> None:
+    """
+    Register the UDFs on every connection the engine opens.  Connections already in
+    the pool (e.g. the one SQLDatabase used for reflection) are discarded first.
+    """
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, _record):
+        register_duckdb_functions(dbapi_conn)
+
+    engine.dispose()
@@ -0,0 +1,371 @@
+import copy
+import json
+import re
+import statistics
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.agents import AgentAction
+
+
+class FastPathPlanner:
+    """
+    Answers common question shapes without the agent loop.
+
+    Recognized shapes (case-insensitive; years anywhere in the question filter the data):
+
+        average|mean|avg <measure> by|per|for each|across state|year   [in 2019 | 2017-2020 | 2015 and 2019]
+        correlation of|between <measure> and|with|vs <measure> over|by|across years
+
+    The shape must cover the whole question: only year filters, request wording ("show me a
+    chart of", "with a line chart") and punctuation may surround it, and a measure phrase may
+    not carry a condition ("in Ohio", "excluding", "with population over").  Anything else
+    is no_match and goes to the agent.  Only "-", "to", "through" and "between ... and" make a
+    year range; other years are a list (year IN (...)), and a range mixed with other years is
+    no_match.
+
+    Measure phrases are resolved to numeric columns of `table` with the dictionary index
+    (the same FAISS search database_column_descriptions uses).  A question is answered here
+    only when every phrase resolves with relevance >= min_score and beats the next candidate
+    column by at least min_margin; the parameterized query then runs through SQLTools.run_query
+    (validator, rollup router, result store) and the chart is filled from a code template, so
+    the whole turn takes no LLM round trip.  Anything else, or any failure, returns None and
+    the caller runs the full agent.
+
+    stats counts questions by outcome; record_agent_turn() takes the duration of full agent
+    turns so report() can estimate the latency saved (agent median - fast path duration).
+
+    Example:
+        planner = FastPathPlanner(sql_tools, dictionary, chart_tool=chart_tool)
+        result = planner.run("average uninsured rate by state for 2019") or agent.run(question)
+    """
+
+    # matched against the whole question after _core() removes year filters, request wording
+    # ("show me a chart of", "with a bar chart") and punctuation; anything left over (another
+    # grouping, a state filter, a condition) means the question is not one of these shapes
+    _AVG_RE = re.compile(
+        r"(?:average|mean|avg)\s+(?:of\s+|the\s+)*(?P<measure>.+?)\s+(?:by|per|for each|across)\s+"
+        r"(?:the\s+)?(?P<group>state|year)s?",
+        re.I,
+    )
+    _CORR_RE = re.compile(
+        r"correlation\s+(?:of|between)\s+(?P<x>.+?)\s+(?:and|with|vs\.?|versus)\s+(?P<y>.+?)\s+"
+        r"(?:(?:over|by|across|per|for each|in each)\s+(?:the\s+)?years?|over\s+time|each\s+year)",
+        re.I,
+    )
+    _YEAR_FILTER_RE = re.compile(
+        r"(?:\b(?:in|for|from|during|between|over)\s+(?:the\s+)?(?:years?\s+)?)?\b(?:19|20)\d{2}\b"
+        r"(?:\s*(?:-|–|to|through|thru|and)\s*(?:19|20)\d{2}\b)?",
+        re.I,
+    )
+    _PREFIX_RE = re.compile(
+        r"^(?:(?:please|can you|could you|show(?:\s+me)?|chart|plot|graph|display|give\s+me|compute|calculate"
+        r"|what(?:'s|\s+is|\s+was|\s+are|\s+were))\s+)*(?:(?:a|an|the)\s+)?(?:(?:line|bar)\s+)?"
+        r"(?:(?:chart|plot|graph)\s+(?:of\s+)?)?(?:the\s+)?",
+        re.I,
+    )
+    _SUFFIX_RE = re.compile(
+        r"\s*(?:,?\s*(?:with|as|in|on)\s+(?:a|an)\s+(?:(?:line|bar)\s+)?(?:chart|plot|graph)|,?\s*please)?$",
+        re.I,
+    )
+    # a filter or a second measure inside a measure phrase
+    _CONDITION_RE = re.compile(
+        r"\b(?:in|for|where|excluding|except|without|with|only|among|and|or|by|per|over|across|than|not"
+        r"|between|within|who|which|that|above|below|under)\b|[,;]",
+        re.I,
+    )
+    # explicit ranges only: "2015-2019", "from 2015 to 2019", "2015 through 2019", "between 2015 and 2019"
+    _YEAR_RANGE_RE = re.compile(
+        r"\bbetween\s+(?:the\s+)?(?:years?\s+)?((?:19|20)\d{2})\s+and\s+((?:19|20)\d{2})\b"
+        r"|\b((?:19|20)\d{2})\s*(?:-|–|to|through|thru)\s*((?:19|20)\d{2})\b",
+        re.I,
+    )
+    _YEAR_RE = re.compile(r"\b(?:19|20)\d{2}\b")
+    _FILLER_RE = re.compile(r"\b(?:in|for|from|during|between|of|the)\s*$|\b(?:19|20)\d{2}\b", re.I)
+
+    def __init__(
+        self,
+        sql_tools,
+        dictionary,
+        chart_tool=None,
+        table: str = "sdoh_surveys",
+        min_score: float = 0.6,
+        min_margin: float = 0.02,
+        search_k: int = 6,
+    ):
+        self.sql_tools = sql_tools
+        self.dictionary = dictionary
+        self.chart_tool = chart_tool
+        self.table = table
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.search_k = search_k
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"questions": 0, "fast_path": 0, "no_match": 0,
+                                      "low_confidence": 0, "failed": 0}
+        self._fast_s: deque = deque(maxlen=200)
+        self._agent_s: deque = deque(maxlen=200)
+
+    def bind(self, sql_tools, chart_tool) -> "FastPathPlanner":
+        """A planner for one session's SQL and chart tools, sharing the metrics."""
+        bound = copy.copy(self)
+        bound.sql_tools, bound.chart_tool = sql_tools, chart_tool
+        return bound
+
+    # ----------------------------
+    # Planning
+    # ----------------------------
+    def plan(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        The plan for question, or None when it is not a recognized shape.  A plan has "shape"
+        ("avg" or "corr"), "group", "phrases", "years" (None, ("=", year), ("between", start, end)
+        or ("in", year, ...)) and, when resolved, "columns" [(column, description, score)] and
+        "confident".
+        """
+        years = self._years(question)
+        if years is False:
+            return None
+        core = self._core(question)
+        m = self._AVG_RE.fullmatch(core)
+        if m:
+            plan = {"shape": "avg", "group": m.group("group").lower(), "phrases": [self._clean(m.group("measure"))]}
+        else:
+            m = self._CORR_RE.fullmatch(core)
+            if not m:
+                return None
+            plan = {"shape": "corr", "group": "year", "phrases": [self._clean(m.group("x")), self._clean(m.group("y"))]}
+        if not all(plan["phrases"]) or any(self._CONDITION_RE.search(p) for p in plan["phrases"]):
+            return None
+        plan["years"] = years
+        plan["columns"] = [self._resolve(p) for p in plan["phrases"]]
+        resolved = [c for c in plan["columns"] if c is not None]
+        plan["confident"] = (len(resolved) == len(plan["phrases"])
+                             and len({c[0] for c in resolved}) == len(resolved))
+        return plan
+
+    def _years(self, question: str):
+        """
+        The year filter of question: None (no years), ("=", year), ("between", start, end) or
+        ("in", year, ...); False when the years cannot all be expressed as one filter.
+        """
+        found = [int(y) for y in self._YEAR_RE.findall(question)]
+        ranges = list(self._YEAR_RANGE_RE.finditer(question))
+        if ranges:
+            bounds = [int(y) for y in ranges[0].groups() if y]
+            # one range, and no year outside it
+            if len(ranges) > 1 or len(found) != 2:
+                return False
+            start, end = sorted(bounds)
+            return ("between", start, end)
+        years = sorted(set(found))
+        if not years:
+            return None
+        return ("=", years[0]) if len(years) == 1 else ("in",) + tuple(years)
+
+    def _core(self, question: str) -> str:
+        """The question without year filters, request wording and punctuation."""
+        core = re.sub(r"\s+", " ", self._YEAR_FILTER_RE.sub(" ", question)).strip(" ?.!,;:'\"")
+        core = self._SUFFIX_RE.sub("", self._PREFIX_RE.sub("", core, count=1), count=1)
+        return core.strip(" ?.!,;:'\"")
+
+    def _clean(self, phrase: str) -> str:
+        phrase = phrase.strip(" ?.,;:'\"")
+        previous = None
+        while phrase != previous:
+            previous = phrase
+            phrase = self._FILLER_RE.sub("", phrase).strip(" ?.,;:'\"")
+        return phrase
+
+    def _resolve(self, phrase: str) -> Optional[Tuple[str, str, float]]:
+        """(column, description, relevance) of the numeric measure column phrase refers to, or None."""
+        vectordb = getattr(self.dictionary, "vectordb", None)
+        if vectordb is None:
+            return None
+        columns = self.sql_tools.numeric_columns(self.table)
+        candidates: List[Tuple[str, str, float]] = []
+        for doc, score in vectordb.similarity_search_with_relevance_scores(phrase, k=self.search_k):
+            meta = doc.metadata or {}
+            column = meta.get("column")
+            if meta.get("table") != self.table or not columns.get(column) or column in ("year", "county_fips"):
+                continue
+            if all(c[0] != column for c in candidates):
+                candidates.append((column, meta.get("text") or "", float(score)))
+        if not candidates or candidates[0][2] < self.min_score:
+            return None
+        if len(candidates) > 1 and candidates[0][2] - candidates[1][2] < self.min_margin:
+            return None
+        return candidates[0]
+
+    # ----------------------------
+    # Execution
+    # ----------------------------
+    def run(self, question: str, trace=None) -> Optional[Dict[str, Any]]:
+        """
+        Answer question on the fast path: {"output", "intermediate_steps", "fast_path": plan},
+        or None to run the agent.  trace (a TraceCallbackHandler) receives one span per step.
+        """
+        t_start = time.perf_counter()
+        with self._lock:
+            self.stats["questions"] += 1
+        try:
+            t0 = time.perf_counter()
+            plan = self.plan(question)
+            if plan is None:
+                return self._outcome("no_match")
+            steps = [(AgentAction("database_column_descriptions", ", ".join(plan["phrases"]), "fast path\n"),
+                      "\n\n".join(f"table: {self.table}\ncolumn: {c[0]}\ntext: {c[1]}"
+                                  for c in plan["columns"] if c is not None))]
+            self._span(trace, "database_column_descriptions", t0)
+            if not plan["confident"]:
+                return self._outcome("low_confidence")
+
+            t0 = time.perf_counter()
+            sql = self._sql(plan)
+            observation = self.sql_tools.run_query(sql)
+            self._span(trace, "sql_db_query", t0)
+            handle = re.search(r'Pass "(res_\d+)"', observation)
+            if observation.startswith("Error") or handle is None:
+                return self._outcome("failed")
+            steps.append((AgentAction("sql_db_query", sql, "fast path\n"), observation))
+            data = self.sql_tools.result_store.to_columns(handle.group(1))
+            if not data or not next(iter(data.values()), None):
+                return self._outcome("failed")
+
+            if self.chart_tool is not None:
+                t0 = time.perf_counter()
+                chart = self._chart(plan, data)
+                self.chart_tool._latest_result = chart
+                steps.append((AgentAction("generate_chart", {"user_input": question, "handle": handle.group(1)},
+                                          "fast path\n"), json.dumps(chart, default=str)))
+                self._span(trace, "generate_chart", t0)
+        except Exception:
+            return self._outcome("failed")
+
+        with self._lock:
+            self.stats["fast_path"] += 1
+            self._fast_s.append(time.perf_counter() - t_start)
+        return {"output": self._answer(plan, data), "intermediate_steps": steps, "fast_path": plan}
+
+    def _outcome(self, kind: str) -> None:
+        with self._lock:
+            self.stats[kind] += 1
+        return None
+
+    @staticmethod
+    def _span(trace, name: str, start: float) -> None:
+        if trace is not None:
+            trace.add_span("tool", name, start, time.perf_counter(), fast_path=True)
+
+    def _sql(self, plan: Dict[str, Any]) -> str:
+        where = ""
+        years = plan["years"]
+        if years and years[0] == "=":
+            where = f"\nWHERE year = {years[1]}"
+        elif years and years[0] == "between":
+            where = f"\nWHERE year BETWEEN {years[1]} AND {years[2]}"
+        elif years:
+            where = f"\nWHERE year IN ({', '.join(str(y) for y in years[1:])})"
+        group = plan["group"]
+        if plan["shape"] == "avg":
+            column = plan["columns"][0][0]
+            return (f'SELECT {group}, AVG("{column}") AS avg_{column}\nFROM {self.table}{where}\n'
+                    f"GROUP BY {group}\nORDER BY {group}")
+        x, y = plan["columns"][0][0], plan["columns"][1][0]
+        return (f'SELECT year, CORR("{x}", "{y}") AS correlation, COUNT("{x}") AS n\nFROM {self.table}{where}\n'
+                "GROUP BY year\nORDER BY year")
+
+    # ----------------------------
+    # Answer and chart templates
+    # ----------------------------
+    def _answer(self, plan: Dict[str, Any], data: Dict[str, List[Any]]) -> str:
+        keys, values = self._series(data)
+        pairs = [(k, v) for k, v in zip(keys, values) if v is not None]
+        used = "; ".join(f"`{c[0]}` ({c[1][:80]})" for c in plan["columns"])
+        span = ""
+        years = plan["years"]
+        if years and years[0] == "=":
+            span = f" in {years[1]}"
+        elif years and years[0] == "between":
+            span = f", {years[1]}-{years[2]}"
+        elif years:
+            span = f" in {', '.join(str(y) for y in years[1:-1])} and {years[-1]}"
+        if not pairs:
+            return f"No data found for {used}{span}."
+        if plan["shape"] == "avg" and plan["group"] == "state":
+            ranked = sorted(pairs, key=lambda p: p[1], reverse=True)
+            top = ", ".join(f"{k} ({v:.3g})" for k, v in ranked[:3])
+            bottom = ", ".join(f"{k} ({v:.3g})" for k, v in ranked[-3:])
+            text = (f"Average by state{span} for {used} across {len(pairs)} states: highest {top}; "
+                    f"lowest {bottom}.")
+        else:
+            label = "Average" if plan["shape"] == "avg" else "Correlation"
+            (k0, v0), (k1, v1) = pairs[0], pairs[-1]
+            lo, hi = min(pairs, key=lambda p: p[1]), max(pairs, key=lambda p: p[1])
+            text = (f"{label} by year{span} for {used}: {v0:.3g} in {k0} and {v1:.3g} in {k1} "
+                    f"(range {lo[1]:.3g} in {lo[0]} to {hi[1]:.3g} in {hi[0]}).")
+        return text + " The chart below shows every value."
+
+    @staticmethod
+    def _series(data: Dict[str, List[Any]]) -> Tuple[List[Any], List[Optional[float]]]:
+        names = list(data)
+        values = [None if v is None else float(v) for v in data[names[1]]]
+        return list(data[names[0]]), values
+
+    def _chart(self, plan: Dict[str, Any], data: Dict[str, List[Any]]) -> Dict[str, Any]:
+        keys, values = self._series(data)
+        pairs = [(k, v) for k, v in zip(keys, values) if v is not None]
+        measure = " vs ".join(c[0] for c in plan["columns"])
+        if plan["group"] == "state":
+            pairs.sort(key=lambda p: p[1])
+            code = (
+                "import matplotlib.pyplot as plt\n"
+                f"states = {json.dumps([k for k, _ in pairs])}\n"
+                f"values = {json.dumps([round(v, 6) for _, v in pairs])}\n"
+                "fig, ax = plt.subplots(figsize=(8, max(4, 0.22 * len(states))))\n"
+                "ax.barh(states, values, color='tab:blue')\n"
+                f"ax.set_xlabel({json.dumps('Average ' + measure)})\n"
+                f"ax.set_title({json.dumps('Average ' + measure + ' by state')})\n"
+                "ax.tick_params(axis='y', labelsize=7)\n"
+                "plt.tight_layout()"
+            )
+        else:
+            label = ("Average " if plan["shape"] == "avg" else "Correlation of ") + measure
+            code = (
+                "import matplotlib.pyplot as plt\n"
+                f"years = {json.dumps([int(k) for k, _ in pairs])}\n"
+                f"values = {json.dumps([round(v, 6) for _, v in pairs])}\n"
+                "fig, ax = plt.subplots(figsize=(8, 4))\n"
+                "ax.plot(years, values, marker='o', color='tab:blue')\n"
+                "ax.set_xticks(years)\n"
+                "ax.set_xlabel('Year')\n"
+                f"ax.set_ylabel({json.dumps(label)})\n"
+                f"ax.set_title({json.dumps(label + ' by year')})\n"
+                "plt.tight_layout()"
+            )
+        return {"code_block": code, "explanation": f"Chart of {measure} by {plan['group']} from the query result.",
+                "status": "success", "data": {"keys": [k for k, _ in pairs], "values": [v for _, v in pairs]}}
+
+    # ----------------------------
+    # Metrics
+    # ----------------------------
+    def record_agent_turn(self, seconds: float) -> None:
+        """Duration of a turn the full agent answered, the baseline for the latency saved."""
+        with self._lock:
+            self._agent_s.append(seconds)
+
+    def report(self) -> str:
+        with self._lock:
+            s, fast, agent = dict(self.stats), list(self._fast_s), list(self._agent_s)
+        rate = s["fast_path"] / s["questions"] if s["questions"] else 0.0
+        lines = [f"fast path {s['fast_path']}/{s['questions']} ({rate:.0%}); fell back: no match {s['no_match']}, "
+                 f"low confidence {s['low_confidence']}, failed {s['failed']}"]
+        if fast:
+            lines.append(f"fast path median {statistics.median(fast):.2f} s")
+        if agent:
+            lines.append(f"agent median {statistics.median(agent):.2f} s over {len(agent)} turns")
+        if fast and agent:
+            saved = sum(max(0.0, statistics.median(agent) - f) for f in fast)
+            lines.append(f"estimated latency saved {saved:.1f} s")
+        return "\n".join(lines)
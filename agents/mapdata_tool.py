@@ -31,9 +31,9 @@ class Location(BaseModel):
 
 class MapDataToolInput(BaseModel):
     # Accept common mistakes/aliases and fix them in a pre-validator
-    center: Location = Field(
-        ...,
-        description="Required map center (name, latitude, longitude)",
+    center: Optional[Location] = Field(
+        None,
+        description="Map center (name, latitude, longitude). Required unless handle is given, then it defaults to the middle of the features",
         validation_alias=AliasChoices(
             "center",
             '"center"',
@@ -43,7 +43,7 @@ class MapDataToolInput(BaseModel):
         ),
     )
     features: List[Location] = Field(
-        ...,
+        default_factory=list,
         description="List of points of interest to display",
         validation_alias=AliasChoices(
             "features",
@@ -55,6 +55,10 @@ class MapDataToolInput(BaseModel):
             "markers",
         ),
     )
+    handle: Optional[str] = Field(
+        None,
+        description="Optional result handle from sql_db_query (e.g. 'res_3') whose rows have name, latitude/lat, longitude/lon and optional feature_group, feature_subgroup columns",
+    )
 
     @model_validator(mode="before")
     def _normalize(cls, values: Dict[str, Any]) -> Dict[str, Any]:
@@ -111,20 +115,52 @@ class MapDataTool:
     Stores the latest result in self._latest_result so your Streamlit layer can pop it once.
     """
 
-    def __init__(self):
+    def __init__(self, result_store=None):
         self._latest_result: Optional[Dict[str, Any]] = None
+        self.result_store = result_store
 
         self.tool = StructuredTool.from_function(
             func=self._run,
             name="mapdata_tool",
             description=(
-                "Transform geographic features from neighborhood tools into a structure suitable for displaying a map. Features have (name, latitude, longitude, 'feature_group', feature_subgroup')"
+                "Transform geographic features from neighborhood tools into a structure suitable for displaying a map. Features have (name, latitude, longitude, 'feature_group', feature_subgroup'). "
+                "Features can also come from a sql_db_query result handle."
             ),
             args_schema=MapDataToolInput,
             return_direct=True,  # terminate the chain after tool call
+            metadata={"stateful": True},  # keeps _latest_result for the page
         )
 
-    def _run(self, center: Location, features: List[Location]) -> str:
+    def _handle_features(self, handle: str) -> List[Location]:
+        """Locations from the rows of a result handle; rows without valid coordinates are skipped."""
+        if self.result_store is None:
+            raise ValueError("Result handles are not enabled in this session.")
+        resolved = self.result_store.resolve(handle)
+        if resolved is None:
+            raise ValueError(f"{handle!r} is not a result handle.")
+        locations = []
+        for rec in self.result_store.to_records(resolved[0]):
+            try:
+                locations.append(Location.model_validate({k: v for k, v in rec.items() if v is not None}))
+            except ValueError:
+                continue
+        return locations
+
+    def _run(self, center: Optional[Location] = None, features: Optional[List[Location]] = None, handle: Optional[str] = None) -> str:
+        features = list(features or [])
+        if handle:
+            try:
+                features += self._handle_features(handle)
+            except (KeyError, ValueError) as e:
+                return e.args[0] if e.args else str(e)
+        if center is None:
+            if not features:
+                return "No map center or features were given."
+            center = Location(
+                name="Center",
+                latitude=sum(f.latitude for f in features) / len(features),
+                longitude=sum(f.longitude for f in features) / len(features),
+            )
         result = {
             "center": center.model_dump(),
             "features": [loc.model_dump() for loc in features],
@@ -35,6 +35,7 @@ class McpTool:
                             description=t.description,
                             func=sync_func,
                             args_schema=t.args_schema,
+                            metadata={"stateful": False},
                         )
             return None
 
@@ -16,6 +16,7 @@ class MeanStatisticalTool(BaseStatisticalTool):
         "Input must be a single text string in the format: 'LIST: <numbers>'. "
         "The numbers can be comma-separated, space-separated, or a JSON array. "
         "Example: 'LIST: 1, 2, 3, 4, 5' or 'LIST: [1, 2, 3, 4, 5]'. "
+        "A sql_db_query result column can be passed by handle: 'LIST: res_3.avg'. "
         "Note: The 'MATRIX:' input is ignored for this tool."
     )
     def _run(self, matrix, vector):
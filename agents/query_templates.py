@@ -0,0 +1,219 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+
+class QueryTemplates:
+    """
+    Normalizes agent SQL into a template plus literal parameters, keeps per-template
+    counts and latency, and runs hot templates as server-side prepared statements.
+
+    Literals are replaced by $1, $2, ... only where a bind parameter means the same thing:
+    string and integer literals in WHERE, HAVING, JOIN ... ON, LIMIT and OFFSET.  Decimal and
+    exponent literals (PostgreSQL would type their parameter from the compared column, e.g.
+    integer), select-list constants, ORDER BY / GROUP BY positions, typed literals
+    (DATE '2020-01-01') and type modifiers (numeric(10,2)) stay in the template.  Comments are dropped and whitespace collapsed,
+    so the same question asked for another state or year maps to the same template.
+
+    Once a template has been seen prepare_after times it is PREPAREd on each pooled
+    connection that runs it (tracked in the connection's info dict, oldest DEALLOCATEd past
+    max_prepared) and run with EXECUTE name(<original literals>).  If the prepared form
+    fails (e.g. a parameter type PostgreSQL infers differently) the template is marked
+    unpreparable and the original SQL runs instead.
+
+    Statistics are kept for at most max_templates templates, least recently run dropped first.
+
+    Example:
+        templates = QueryTemplates()
+        columns, rows = templates.execute(conn, "SELECT county FROM sdoh_surveys WHERE state = 'Ohio'")
+        print(templates.report())
+    """
+
+    _TOKEN_RE = re.compile(
+        r"""
+        (?P<ws>\s+)
+      | (?P<comment>--[^\n]*|/\*.*?\*/)
+      | (?P<string>[eE]?'(?:[^']|'')*')
+      | (?P<ident>"(?:[^"]|"")*")
+      | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+      | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+      | (?P<cast>::)
+      | (?P<op>[(),;]|[<>=!~+\-*/%^|&]+|.)
+        """,
+        re.X | re.S,
+    )
+    # clauses whose literals are parameterized
+    _PARAM_CLAUSES = {"where", "having", "on", "limit", "offset"}
+    _CLAUSE_WORDS = {"select", "from", "where", "group", "having", "order", "limit", "offset", "on",
+                     "join", "union", "intersect", "except", "window", "returning", "values"}
+    # words after which a literal is an operand (anything else, e.g. DATE '...', is a typed literal)
+    _OPERAND_WORDS = {"and", "or", "not", "in", "like", "ilike", "between", "when", "then", "else",
+                      "where", "having", "on", "limit", "offset", "similar", "to", "is", "any", "all", "escape"}
+
+    def __init__(self, prepare_after: int = 3, max_prepared: int = 50, dialects: Sequence[str] = ("postgresql",),
+                 max_templates: int = 1000):
+        self.prepare_after = prepare_after
+        self.max_prepared = max_prepared
+        self.dialects = set(dialects)
+        self.max_templates = max_templates
+        self._stats: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    # ----------------------------
+    # Normalization
+    # ----------------------------
+    def normalize(self, sql: str) -> Tuple[str, List[str]]:
+        """Return (template with $n placeholders, literal texts in placeholder order)."""
+        out: List[str] = []
+        params: List[str] = []
+        clause_stack = ["select"]   # clause at each parenthesis depth
+        type_parens: List[bool] = []  # whether each open parenthesis holds type modifiers
+        prev = ""        # previous significant token (lower-cased)
+        prev_kind = ""
+        before_prev = ""
+        for m in self._TOKEN_RE.finditer(sql or ""):
+            kind, text = m.lastgroup, m.group()
+            if kind in ("ws", "comment"):
+                if out and out[-1] != " ":
+                    out.append(" ")
+                continue
+
+            in_type = any(type_parens)
+            if kind in ("string", "number") and not in_type:
+                clause = clause_stack[-1]
+                operand = prev_kind != "word" or prev in self._OPERAND_WORDS
+                # a string right after a word that is not an operator keyword is a typed literal;
+                # decimals stay in the text: a $n compared with an integer column is typed integer,
+                # so EXECUTE would round 2.5 to 3
+                decimal = kind == "number" and any(ch in text for ch in ".eE")
+                if (clause in self._PARAM_CLAUSES and operand and not decimal
+                        and not (kind == "string" and text[:1] in "eE")):
+                    params.append(text)
+                    out.append(f"${len(params)}")
+                    before_prev, prev, prev_kind = prev, text, kind
+                    continue
+
+            if kind == "word":
+                lw = text.lower()
+                if lw in self._CLAUSE_WORDS:
+                    clause_stack[-1] = "select" if lw == "union" else lw
+                    if lw == "join":
+                        clause_stack[-1] = "from"
+                out.append(text)
+                before_prev, prev, prev_kind = prev, lw, kind
+                continue
+
+            if kind == "op" and text == "(":
+                # type modifiers: ::numeric(10,2) or CAST(x AS numeric(10,2))
+                is_type = prev_kind == "word" and before_prev in ("::", "as")
+                type_parens.append(is_type)
+                clause_stack.append(clause_stack[-1])
+            elif kind == "op" and text == ")":
+                if type_parens:
+                    type_parens.pop()
+                if len(clause_stack) > 1:
+                    clause_stack.pop()
+
+            out.append(text)
+            before_prev, prev, prev_kind = prev, text.lower(), kind
+
+        template = "".join(out).strip()
+        return template.rstrip(";").rstrip(), params
+
+    @staticmethod
+    def statement_name(template: str) -> str:
+        return "q_" + hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
+
+    # ----------------------------
+    # Execution
+    # ----------------------------
+    def execute(self, conn, sql: str, template: Optional[Tuple[str, List[str]]] = None):
+        """
+        Run sql on a SQLAlchemy connection and return (column names, rows), recording the
+        template's latency.  template: an already computed normalize(sql) result.
+        """
+        template_sql, params = template or self.normalize(sql)
+        with self._lock:
+            st = self._stats.get(template_sql)
+            if st is None:
+                st = self._stats[template_sql] = {"count": 0, "total_ms": 0.0, "prepared_runs": 0, "preparable": True}
+                while len(self._stats) > self.max_templates:
+                    self._stats.popitem(last=False)
+            else:
+                self._stats.move_to_end(template_sql)
+            st["count"] += 1
+            use_prepared = (st["preparable"] and st["count"] >= self.prepare_after
+                            and conn.dialect.name in self.dialects)
+
+        t0 = time.perf_counter()
+        fetched = None
+        if use_prepared:
+            try:
+                fetched = self._execute_prepared(conn, template_sql, params)
+            except Exception:
+                conn.rollback()
+                with self._lock:
+                    st["preparable"] = False
+        if fetched is None:
+            fetched = self._fetch(conn, sql)
+            use_prepared = False
+        elapsed = (time.perf_counter() - t0) * 1000.0
+
+        with self._lock:
+            st["total_ms"] += elapsed
+            if use_prepared:
+                st["prepared_runs"] += 1
+        return fetched
+
+    @staticmethod
+    def _fetch(conn, sql: str):
+        result = conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+        if not result.returns_rows:
+            return [], []
+        return list(result.keys()), result.fetchall()
+
+    def _execute_prepared(self, conn, template: str, params: List[str]):
+        name = self.statement_name(template)
+        # prepared statements belong to the DBAPI connection; its info dict lives as long as it does
+        prepared: "OrderedDict[str, bool]" = conn.connection.info.setdefault("prepared_templates", OrderedDict())
+        if name in prepared:
+            prepared.move_to_end(name)
+        else:
+            conn.exec_driver_sql(f"PREPARE {name} AS {template}", execution_options={"no_parameters": True})
+            prepared[name] = True
+            while len(prepared) > self.max_prepared:
+                old, _ = prepared.popitem(last=False)
+                conn.exec_driver_sql(f"DEALLOCATE {old}", execution_options={"no_parameters": True})
+        args = f" ({', '.join(params)})" if params else ""
+        return self._fetch(conn, f"EXECUTE {name}{args}")
+
+    # ----------------------------
+    # Reporting
+    # ----------------------------
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-template count, mean latency and prepared runs, most frequent first."""
+        with self._lock:
+            rows = [
+                {"template": t, "count": s["count"], "mean_ms": s["total_ms"] / s["count"] if s["count"] else 0.0,
+                 "prepared_runs": s["prepared_runs"], "preparable": s["preparable"]}
+                for t, s in self._stats.items()
+            ]
+        return sorted(rows, key=lambda r: (-r["count"], -r["mean_ms"]))
+
+    def report(self, top: int = 20, width: int = 90) -> str:
+        """Text table of the most frequent templates."""
+        rows = self.stats()[:top]
+        if not rows:
+            return "(no queries yet)"
+        lines = [f"{'count':>6} {'mean ms':>9} {'prepared':>9}  template"]
+        for r in rows:
+            template = r["template"] if len(r["template"]) <= width else r["template"][: width - 3] + "..."
+            lines.append(f"{r['count']:>6} {r['mean_ms']:>9.2f} {r['prepared_runs']:>9}  {template}")
+        return "\n".join(lines)
+
+
+# Process-wide registry so template counts survive Streamlit reruns.
+SHARED_TEMPLATES = QueryTemplates()
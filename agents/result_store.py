@@ -0,0 +1,182 @@
+import csv
+import io
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+
+
+class ResultStore:
+    """
+    Per-session store of query results as Arrow tables, addressed by short handles.
+
+    sql_db_query registers each result and returns the handle plus a few preview rows,
+    so large results never pass through the LLM.  generate_chart, mapdata_tool and the
+    statistics tools accept the handle ("res_3", or "res_3.column" for one column) and
+    read the full table from here.
+
+    Tables are kept in least-recently-used order and evicted once the total size passes
+    max_bytes; the newest table is always kept, even when it alone is larger.
+
+    Example:
+        store = ResultStore(max_bytes=64 * 1024 * 1024)
+        handle = store.put(ResultStore.table_from_rows(["year", "value"], rows), source=sql)
+        columns = store.to_columns(handle)
+    """
+
+    HANDLE_RE = re.compile(r"^\s*[\"']?(res_\d+)(?:\.\"?([A-Za-z_][A-Za-z0-9_]*)\"?)?[\"']?\s*$")
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, preview_rows: int = 10, max_cell_chars: int = 80):
+        self.max_bytes = max_bytes
+        self.preview_rows = preview_rows
+        self.max_cell_chars = max_cell_chars
+        self._tables: "OrderedDict[str, Tuple[pa.Table, str]]" = OrderedDict()
+        self._next_id = 1
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"puts": 0, "hits": 0, "misses": 0, "evictions": 0}
+
+    # ----------------------------
+    # Building tables
+    # ----------------------------
+    @staticmethod
+    def table_from_rows(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> pa.Table:
+        """Columnar table from DB-API rows; a column Arrow cannot type is stored as strings."""
+        names = _unique_names(columns)
+        arrays = []
+        for i in range(len(names)):
+            values = [r[i] for r in rows]
+            try:
+                arrays.append(pa.array(values))
+            except (pa.ArrowInvalid, pa.ArrowTypeError, OverflowError):
+                arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=names)
+
+    # ----------------------------
+    # Store / lookup
+    # ----------------------------
+    def put(self, table: pa.Table, source: str = "") -> str:
+        """Register a table and return its handle, evicting least recently used tables over max_bytes."""
+        with self._lock:
+            handle = f"res_{self._next_id}"
+            self._next_id += 1
+            self._tables[handle] = (table, source)
+            self._bytes += table.nbytes
+            self.stats["puts"] += 1
+            while self._bytes > self.max_bytes and len(self._tables) > 1:
+                _, (old, _) = self._tables.popitem(last=False)
+                self._bytes -= old.nbytes
+                self.stats["evictions"] += 1
+            return handle
+
+    def get(self, handle: str) -> pa.Table:
+        """Table for a handle (marks it recently used). Raises KeyError for unknown or evicted handles."""
+        with self._lock:
+            entry = self._tables.get(handle)
+            if entry is None:
+                self.stats["misses"] += 1
+                raise KeyError(f"Result {handle} is not available (unknown or evicted); run the query again.")
+            self._tables.move_to_end(handle)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def source(self, handle: str) -> str:
+        with self._lock:
+            entry = self._tables.get(handle)
+            return entry[1] if entry else ""
+
+    def resolve(self, text: Optional[str]) -> Optional[Tuple[str, Optional[str]]]:
+        """Parse "res_3" or "res_3.column" into (handle, column); None if text is not a handle."""
+        if not isinstance(text, str):
+            return None
+        m = self.HANDLE_RE.match(text)
+        return (m.group(1), m.group(2)) if m else None
+
+    def column(self, text: str) -> List[Any]:
+        """Values of one column, addressed as "res_3.column" (or "res_3" for a single-column result)."""
+        handle, name = self.resolve(text) or (None, None)
+        if handle is None:
+            raise ValueError(f"{text!r} is not a result handle.")
+        table = self.get(handle)
+        if name is None:
+            if table.num_columns != 1:
+                raise ValueError(f"{handle} has columns {table.column_names}; use {handle}.<column>.")
+            return table.column(0).to_pylist()
+        if name not in table.column_names:
+            raise ValueError(f"{handle} has no column {name!r}; columns are {table.column_names}.")
+        return table.column(name).to_pylist()
+
+    def to_columns(self, handle: str, max_rows: Optional[int] = None) -> Dict[str, List[Any]]:
+        """Column-oriented dict of a result, optionally truncated to max_rows."""
+        table = self.get(handle)
+        if max_rows is not None and table.num_rows > max_rows:
+            table = table.slice(0, max_rows)
+        return table.to_pydict()
+
+    def to_records(self, handle: str) -> List[Dict[str, Any]]:
+        return self.get(handle).to_pylist()
+
+    # ----------------------------
+    # Text for the agent
+    # ----------------------------
+    def describe(self, handle: str) -> str:
+        table = self.get(handle)
+        return f"{handle}: {table.num_rows} rows x {table.num_columns} columns ({', '.join(table.column_names)})"
+
+    def preview(self, handle: str, rows: Optional[int] = None) -> str:
+        """First rows of a result as CSV, long cells truncated."""
+        table = self.get(handle)
+        rows = self.preview_rows if rows is None else rows
+        head = table.slice(0, rows).to_pylist()
+        out = io.StringIO()
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(table.column_names)
+        for rec in head:
+            writer.writerow([self._cell(v) for v in rec.values()])
+        return out.getvalue().rstrip("\n")
+
+    def summary(self, handle: str) -> str:
+        """Handle, shape and preview: what sql_db_query returns to the agent."""
+        table = self.get(handle)
+        if table.num_rows <= self.preview_rows:
+            rows_note = f"All {table.num_rows} rows (CSV):"
+        else:
+            rows_note = f"First {self.preview_rows} of {table.num_rows} rows (CSV):"
+        return (
+            f"Result {self.describe(handle)}.\n"
+            f'Pass "{handle}" as handle to generate_chart or mapdata_tool (or "{handle}.<column>" to the '
+            "statistics tools) instead of copying rows.\n"
+            f"{rows_note}\n{self.preview(handle)}"
+        )
+
+    def _cell(self, value: Any) -> Any:
+        if value is None:
+            return ""
+        if isinstance(value, float):
+            return f"{value:.6g}"
+        text = str(value)
+        return text if len(text) <= self.max_cell_chars else text[: self.max_cell_chars - 3] + "..."
+
+    @property
+    def nbytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+
+def _unique_names(columns: Sequence[str]) -> List[str]:
+    """Arrow tables allow duplicate names but lookups by name do not; suffix repeats (avg, avg_2)."""
+    seen: Dict[str, int] = {}
+    names = []
+    for c in columns:
+        c = str(c)
+        if c in seen:
+            seen[c] += 1
+            names.append(f"{c}_{seen[c]}")
+        else:
+            seen[c] = 1
+            names.append(c)
+    return names
@@ -0,0 +1,448 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import text
+
+from sql_validator import DIALECTS, exp
+
+
+class RollupRouter:
+    """
+    Rewrites simple aggregate queries over sdoh_surveys to read the materialized rollups
+    built by the ETL (etl_notebooks/sdoh_load.build_rollups).
+
+    Recognized shape (case-insensitive, one table, no alias):
+
+        SELECT [state,] [year,] AVG(col) [AS a], COUNT(col) [AS n], ...
+        FROM sdoh_surveys
+        [WHERE state = '..' | state IN ('..', ..) | year = 2020 | year >= 2018
+               | year BETWEEN 2018 AND 2020 | year IN (..)  joined by AND]
+        GROUP BY state | year | state, year
+        [ORDER BY <group column | alias | position | aggregate> [ASC|DESC]]
+        [LIMIT n]
+
+    The rollups keep n_counties and sum_value per (state, year, measure), so any coarser
+    grouping is re-aggregated exactly (AVG = SUM(sum_value) / SUM(n_counties)).
+    Anything else (COUNT(*), HAVING, joins, expressions) returns None and runs unchanged.
+
+    Given the sqlglot tree SQLValidator already built (ValidatedQuery.ast), the shape is read
+    from the tree instead of re-parsing the text, and routing decisions are cached by the
+    query fingerprint until the rollup measures change.  The regex parser covers queries
+    sqlglot could not parse (or when it is not installed).
+
+    Example:
+        router = RollupRouter(engine)
+        vq = validator.validate(query)
+        sql = router.route(vq.sql, ast=vq.ast, key=vq.fingerprint) or vq.sql
+    """
+
+    _QUERY_RE = re.compile(
+        r"^\s*select\s+(?P<select>.+?)\s+from\s+(?:public\.)?\"?(?P<table>[a-z_][a-z0-9_]*)\"?"
+        r"(?:\s+where\s+(?P<where>.+?))?"
+        r"\s+group\s+by\s+(?P<group>.+?)"
+        r"(?:\s+order\s+by\s+(?P<order>.+?))?"
+        r"(?:\s+limit\s+(?P<limit>\d+))?\s*;?\s*$",
+        re.I | re.S,
+    )
+    _KEY_RE = re.compile(r'^"?(state|year)"?$', re.I)
+    _AGG_RE = re.compile(
+        r'^(?P<func>avg|count)\s*\(\s*"?(?P<col>[a-z_][a-z0-9_]*)"?\s*\)'
+        r'(?:\s+(?:as\s+)?"?(?P<alias>[a-z_][a-z0-9_]*)"?)?$',
+        re.I,
+    )
+    _STATE_LIT = r"'((?:[^']|'')*)'"
+    _CONDITIONS = (
+        ("state_eq", re.compile(r'"?state"?\s*=\s*' + _STATE_LIT, re.I)),
+        ("state_in", re.compile(r'"?state"?\s+in\s*\(\s*(' + _STATE_LIT + r"(?:\s*,\s*" + _STATE_LIT + r")*)\s*\)", re.I)),
+        ("year_between", re.compile(r'"?year"?\s+between\s+(\d{4})\s+and\s+(\d{4})', re.I)),
+        ("year_in", re.compile(r'"?year"?\s+in\s*\(\s*(\d{4}(?:\s*,\s*\d{4})*)\s*\)', re.I)),
+        ("year_cmp", re.compile(r'"?year"?\s*(=|>=|<=|>|<)\s*(\d{4})', re.I)),
+    )
+    _AND_RE = re.compile(r"\s+and\s+", re.I)
+    _ORDER_ITEM_RE = re.compile(r"^(?P<expr>.+?)(?P<dir>\s+(?:asc|desc))?(?P<nulls>\s+nulls\s+(?:first|last))?$", re.I | re.S)
+
+    def __init__(
+        self,
+        engine,
+        source_table: str = "sdoh_surveys",
+        state_rollup: str = "sdoh_rollup_state_year",
+        nation_rollup: str = "sdoh_rollup_nation_year",
+        measures_ttl: float = 300.0,
+        cache_size: int = 512,
+    ):
+        self.engine = engine
+        self.source_table = source_table
+        self.state_rollup = state_rollup
+        self.nation_rollup = nation_rollup
+        self.measures_ttl = measures_ttl
+        self._measures: Optional[Set[str]] = None
+        self._measures_at = 0.0
+        self.dialect = DIALECTS.get(engine.dialect.name, engine.dialect.name)
+        self.cache_size = cache_size
+        self._routes: "OrderedDict[str, Optional[str]]" = OrderedDict()  # fingerprint -> rollup SQL or None
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"routed": 0, "passed": 0, "fallback": 0}
+
+    # ----------------------------
+    # Rollup availability
+    # ----------------------------
+    def measures(self) -> Set[str]:
+        """Measures present in the rollups; empty when the rollups do not exist. Cached for measures_ttl seconds."""
+        now = time.monotonic()
+        if self._measures is None or now - self._measures_at > self.measures_ttl:
+            try:
+                with self.engine.connect() as conn:
+                    found = {r[0] for r in conn.execute(text(f'SELECT DISTINCT measure FROM "{self.nation_rollup}"'))}
+            except Exception:
+                # rollups not built (or not reachable): route nothing until the next check
+                found = set()
+            if found != self._measures:
+                with self._lock:
+                    self._routes.clear()
+            self._measures, self._measures_at = found, now
+        return self._measures
+
+    # ----------------------------
+    # Parsing
+    # ----------------------------
+    @staticmethod
+    def _split_top_level(s: str) -> List[str]:
+        """Split on commas outside parentheses and quotes."""
+        parts, depth, quoted, buf = [], 0, False, []
+        for ch in s:
+            if ch == "'":
+                quoted = not quoted
+            elif not quoted and ch == "(":
+                depth += 1
+            elif not quoted and ch == ")":
+                depth -= 1
+            if ch == "," and depth == 0 and not quoted:
+                parts.append("".join(buf).strip())
+                buf = []
+            else:
+                buf.append(ch)
+        parts.append("".join(buf).strip())
+        return parts
+
+    def _parse_where(self, where: str) -> Optional[List[Tuple[str, tuple]]]:
+        """Parse an AND-joined list of state/year filters; None if anything else is present."""
+        conditions, pos, where = [], 0, where.strip()
+        while pos < len(where):
+            for kind, pattern in self._CONDITIONS:
+                m = pattern.match(where, pos)
+                if m:
+                    break
+            else:
+                return None
+            if kind == "state_in":
+                values = tuple(v.replace("''", "'") for v in re.findall(self._STATE_LIT, m.group(1)))
+            elif kind == "state_eq":
+                values = (m.group(1).replace("''", "'"),)
+            elif kind == "year_in":
+                values = tuple(int(y) for y in re.split(r"\s*,\s*", m.group(1)))
+            else:
+                values = m.groups()
+            conditions.append((kind, values))
+            pos = m.end()
+            if pos < len(where):
+                sep = self._AND_RE.match(where, pos)
+                if not sep:
+                    return None
+                pos = sep.end()
+        return conditions
+
+    # ----------------------------
+    # Rewriting
+    # ----------------------------
+    @staticmethod
+    def _literal(value: str) -> str:
+        return "'" + str(value).replace("'", "''") + "'"
+
+    def route(self, query: str, ast: Any = None, key: Optional[str] = None) -> Optional[str]:
+        """
+        Return the equivalent rollup query, or None when the query does not match a rollup shape.
+        ast: the validator's sqlglot tree of query; key: its fingerprint, caching the decision.
+        """
+        self.measures()  # refresh first, so a change of measures empties the cache
+        with self._lock:
+            cached = key is not None and key in self._routes
+            if cached:
+                self._routes.move_to_end(key)
+                sql = self._routes[key]
+        if not cached:
+            sql = self._rewrite(query, ast)
+            if key is not None:
+                with self._lock:
+                    self._routes[key] = sql
+                    while len(self._routes) > self.cache_size:
+                        self._routes.popitem(last=False)
+        self.stats["routed" if sql else "passed"] += 1
+        return sql
+
+    def parse(self, query: str, ast: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        Parse a query of the recognized shape over source_table, or return None.
+        With ast (a sqlglot tree of query) the tree is read and the text is not parsed again.
+
+        Returns {"select": output names in order, "items": [("key"|"agg", index)] in select order,
+        "keys": selected state/year columns,
+        "aggs": [(func, measure, output name)], "group": group columns,
+        "conditions": [(kind, values)], "order": [(output name, direction suffix)], "limit": int or None}.
+        Also used by the approximate query path in SQLTools.
+        """
+        if ast is not None and exp is not None:
+            return self._parse_ast(ast)
+        m = self._QUERY_RE.match(query or "")
+        if not m or m.group("table").lower() != self.source_table:
+            return None
+
+        # SELECT list: key columns and AVG/COUNT of single measure columns
+        keys: List[str] = []
+        aggs: List[Tuple[str, str, str]] = []  # (func, measure, output name)
+        select: List[str] = []
+        items: List[Tuple[str, int]] = []  # ("key", index in keys) or ("agg", index in aggs)
+        for item in self._split_top_level(m.group("select")):
+            key = self._KEY_RE.match(item)
+            if key:
+                keys.append(key.group(1).lower())
+                select.append(keys[-1])
+                items.append(("key", len(keys) - 1))
+                continue
+            agg = self._AGG_RE.match(item)
+            if not agg:
+                return None
+            func, col = agg.group("func").lower(), agg.group("col").lower()
+            if col in ("state", "county", "year"):
+                return None
+            aggs.append((func, col, (agg.group("alias") or func).lower()))
+            select.append(aggs[-1][2])
+            items.append(("agg", len(aggs) - 1))
+        if not aggs:
+            return None
+
+        # GROUP BY must be exactly the selected key columns
+        group = []
+        for item in self._split_top_level(m.group("group")):
+            key = self._KEY_RE.match(item)
+            if not key:
+                return None
+            group.append(key.group(1).lower())
+        if set(group) != set(keys) or len(group) != len(set(group)):
+            return None
+
+        # WHERE: only state / year filters
+        conditions = self._parse_where(m.group("where")) if m.group("where") else []
+        if conditions is None:
+            return None
+
+        # ORDER BY: key columns, aliases, positions, or aggregates from the SELECT list
+        order: List[Tuple[str, str]] = []
+        if m.group("order"):
+            agg_texts = {f"{f}({c})": a for f, c, a in aggs}
+            aliases = {a for _, _, a in aggs}
+            for item in self._split_top_level(m.group("order")):
+                o = self._ORDER_ITEM_RE.match(item)
+                expr = o.group("expr").strip().strip('"').lower()
+                suffix = (o.group("dir") or "") + (o.group("nulls") or "")
+                norm = re.sub(r'[\s"]+', "", expr)
+                if expr in keys or expr in aliases:
+                    order.append((expr, suffix))
+                elif expr.isdigit() and 1 <= int(expr) <= len(select):
+                    order.append((select[int(expr) - 1], suffix))
+                elif norm in agg_texts:
+                    order.append((agg_texts[norm], suffix))
+                else:
+                    return None
+
+        limit = int(m.group("limit")) if m.group("limit") else None
+        return {"select": select, "items": items, "keys": keys, "aggs": aggs, "group": group,
+                "conditions": conditions, "order": order, "limit": limit}
+
+    # ----------------------------
+    # Parsing the validator's tree
+    # ----------------------------
+    _AST_CMP = {"EQ": "=", "GTE": ">=", "LTE": "<=", "GT": ">", "LT": "<"}
+
+    @staticmethod
+    def _ast_key(node) -> Optional[str]:
+        """'state' or 'year' for an unqualified column reference, else None."""
+        if isinstance(node, exp.Column) and not node.table and node.name.lower() in ("state", "year"):
+            return node.name.lower()
+        return None
+
+    @staticmethod
+    def _ast_agg(node) -> Optional[Tuple[str, str]]:
+        """(func, column) for AVG(col) / COUNT(col) of an unqualified column, else None."""
+        if not isinstance(node, (exp.Avg, exp.Count)) or not isinstance(node.this, exp.Column) or node.this.table:
+            return None
+        return ("avg" if isinstance(node, exp.Avg) else "count"), node.this.name.lower()
+
+    @staticmethod
+    def _ast_int(node) -> Optional[int]:
+        if isinstance(node, exp.Literal) and node.is_int:
+            return int(node.this)
+        return None
+
+    def _parse_ast(self, ast) -> Optional[Dict[str, Any]]:
+        if not isinstance(ast, exp.Select):
+            return None
+        for arg in ("with", "joins", "having", "distinct", "offset", "qualify", "windows", "laterals", "into"):
+            if ast.args.get(arg):
+                return None
+        source = ast.args.get("from") or ast.args.get("from_")
+        table = source.this if source is not None else None
+        if (not isinstance(table, exp.Table) or table.alias or table.catalog
+                or table.db.lower() not in ("", "public") or table.name.lower() != self.source_table):
+            return None
+
+        keys: List[str] = []
+        aggs: List[Tuple[str, str, str]] = []
+        select: List[str] = []
+        items: List[Tuple[str, int]] = []
+        for item in ast.expressions:
+            key = self._ast_key(item)
+            if key:
+                keys.append(key)
+                select.append(key)
+                items.append(("key", len(keys) - 1))
+                continue
+            alias = item.alias if isinstance(item, exp.Alias) else ""
+            agg = self._ast_agg(item.this if isinstance(item, exp.Alias) else item)
+            if agg is None or agg[1] in ("state", "county", "year"):
+                return None
+            aggs.append((agg[0], agg[1], (alias or agg[0]).lower()))
+            select.append(aggs[-1][2])
+            items.append(("agg", len(aggs) - 1))
+        if not aggs:
+            return None
+
+        grouping = ast.args.get("group")
+        group = [self._ast_key(g) for g in (grouping.expressions if grouping is not None else [])]
+        if not group or None in group or set(group) != set(keys) or len(group) != len(set(group)):
+            return None
+
+        conditions: List[Tuple[str, tuple]] = []
+        where = ast.args.get("where")
+        if where is not None:
+            for cond in where.this.flatten() if isinstance(where.this, exp.And) else [where.this]:
+                parsed = self._ast_condition(cond)
+                if parsed is None:
+                    return None
+                conditions.append(parsed)
+
+        order: List[Tuple[str, str]] = []
+        ordering = ast.args.get("order")
+        if ordering is not None:
+            aliases = {a for _, _, a in aggs}
+            by_agg = {(f, c): a for f, c, a in aggs}
+            for o in ordering.expressions:
+                expr = o.this
+                position = self._ast_int(expr)
+                if self._ast_key(expr) in keys:
+                    name = self._ast_key(expr)
+                elif isinstance(expr, exp.Column) and not expr.table and expr.name.lower() in aliases:
+                    name = expr.name.lower()
+                elif position is not None and 1 <= position <= len(select):
+                    name = select[position - 1]
+                elif self._ast_agg(expr) in by_agg:
+                    name = by_agg[self._ast_agg(expr)]
+                else:
+                    return None
+                # direction and NULLS as the dialect writes them (NULLS only when not the default)
+                ordered = o.sql(dialect=self.dialect)
+                order.append((name, ordered[len(expr.sql(dialect=self.dialect)):]))
+
+        limit = None
+        limit_node = ast.args.get("limit")
+        if limit_node is not None:
+            limit = self._ast_int(limit_node.expression) if isinstance(limit_node, exp.Limit) else None
+            if limit is None:
+                return None
+        return {"select": select, "items": items, "keys": keys, "aggs": aggs, "group": group,
+                "conditions": conditions, "order": order, "limit": limit}
+
+    def _ast_condition(self, cond) -> Optional[Tuple[str, tuple]]:
+        """One state/year filter as (kind, values) like _parse_where, or None."""
+        key = self._ast_key(cond.this) if isinstance(cond, (exp.Predicate, exp.Binary)) else None
+        if key == "state":
+            if isinstance(cond, exp.EQ) and isinstance(cond.expression, exp.Literal) and cond.expression.is_string:
+                return "state_eq", (cond.expression.this,)
+            if (isinstance(cond, exp.In) and cond.expressions and not cond.args.get("query")
+                    and all(isinstance(v, exp.Literal) and v.is_string for v in cond.expressions)):
+                return "state_in", tuple(v.this for v in cond.expressions)
+        elif key == "year":
+            if isinstance(cond, exp.Between):
+                low, high = self._ast_int(cond.args.get("low")), self._ast_int(cond.args.get("high"))
+                if low is not None and high is not None:
+                    return "year_between", (str(low), str(high))
+            elif isinstance(cond, exp.In) and cond.expressions and not cond.args.get("query"):
+                years = [self._ast_int(v) for v in cond.expressions]
+                if None not in years:
+                    return "year_in", tuple(years)
+            elif type(cond).__name__ in self._AST_CMP and self._ast_int(cond.expression) is not None:
+                return "year_cmp", (self._AST_CMP[type(cond).__name__], str(self._ast_int(cond.expression)))
+        return None
+
+    def filter_sql(self, conditions: List[Tuple[str, tuple]]) -> List[str]:
+        """SQL predicates for parsed state/year conditions."""
+        where_sql = []
+        for kind, values in conditions:
+            if kind == "state_eq":
+                where_sql.append(f"state = {self._literal(values[0])}")
+            elif kind == "state_in":
+                where_sql.append("state IN (" + ", ".join(self._literal(v) for v in values) + ")")
+            elif kind == "year_between":
+                where_sql.append(f"year BETWEEN {int(values[0])} AND {int(values[1])}")
+            elif kind == "year_in":
+                where_sql.append("year IN (" + ", ".join(str(y) for y in values) + ")")
+            else:
+                where_sql.append(f"year {values[0]} {int(values[1])}")
+        return where_sql
+
+    @staticmethod
+    def order_limit_sql(parsed: Dict[str, Any]) -> str:
+        sql = ""
+        if parsed["order"]:
+            sql += " ORDER BY " + ", ".join(f'"{name}"{suffix}' for name, suffix in parsed["order"])
+        if parsed["limit"] is not None:
+            sql += f" LIMIT {parsed['limit']}"
+        return sql
+
+    def _rewrite(self, query: str, ast: Any = None) -> Optional[str]:
+        parsed = self.parse(query, ast)
+        if parsed is None:
+            return None
+        aggs, group = parsed["aggs"], parsed["group"]
+
+        # every measure must exist in the rollups
+        available = self.measures()
+        if not available or any(col not in available for _, col, _ in aggs):
+            return None
+
+        select_sql = []
+        for kind, i in parsed["items"]:
+            if kind == "key":
+                select_sql.append(parsed["keys"][i])
+                continue
+            func, col, alias = aggs[i]
+            if func == "avg":
+                expr = (f"SUM(sum_value) FILTER (WHERE measure = {self._literal(col)}) / "
+                        f"NULLIF(SUM(n_counties) FILTER (WHERE measure = {self._literal(col)}), 0)")
+            else:
+                expr = f"COALESCE(SUM(n_counties) FILTER (WHERE measure = {self._literal(col)}), 0)::bigint"
+            select_sql.append(f'{expr} AS "{alias}"')
+
+        uses_state = "state" in group or any(kind.startswith("state") for kind, _ in parsed["conditions"])
+        rollup = self.state_rollup if uses_state else self.nation_rollup
+        where_sql = ["measure IN (" + ", ".join(sorted({self._literal(c) for _, c, _ in aggs})) + ")"]
+        where_sql += self.filter_sql(parsed["conditions"])
+
+        return (
+            "SELECT " + ", ".join(select_sql)
+            + f' FROM "{rollup}" WHERE ' + " AND ".join(where_sql)
+            + " GROUP BY " + ", ".join(group)
+            + self.order_limit_sql(parsed)
+        )
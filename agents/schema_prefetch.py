@@ -0,0 +1,282 @@
+import copy
+import re
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain.tools import StructuredTool
+
+from sql_tool import DataVersion
+
+
+class SchemaPrefetcher:
+    """
+    Prefetches what the agent usually asks for after a dictionary lookup.
+
+    When database_column_descriptions returns hits, two background jobs start for each
+    table in the hits while the model decides its next call:
+
+        - the table's schema (the text sql_db_schema returns for it);
+        - per-year statistics of the numeric hit columns: non-null count, min, max and mean,
+          one GROUP BY year query per table through SQLTools (read-only, query templates).
+
+    wrap_tools() replaces the dictionary tool with one that schedules the prefetch and
+    sql_db_schema with one answered from the cache (waiting up to `wait` seconds for a
+    prefetch still running, the same work the call would do).  Its output starts with the
+    statistics of the columns this session's last dictionary lookups returned, so the agent
+    sees which years have data and the value ranges without an exploratory query.
+
+    Caches are shared by all sessions and emptied when version_fn() changes (the data load
+    version); bind() gives a session its own list of recent hits over the shared caches.
+
+    Example:
+        prefetcher = SchemaPrefetcher(sql_tools, version_fn=sql_tools.data_version).bind()
+        tools = prefetcher.wrap_tools(sql_tools.get_tools() + [dictionary_tool])
+    """
+
+    _DICT_RE = re.compile(r"table:\s*(\S+)\s*\ncolumn:\s*(\S+)", re.I)
+
+    def __init__(
+        self,
+        sql_tools,
+        version_fn: Optional[Callable[[], str]] = None,
+        dictionary_name: str = "database_column_descriptions",
+        schema_name: str = "sql_db_schema",
+        year_column: str = "year",
+        workers: int = 2,
+        wait: float = 5.0,
+        max_entries: int = 256,
+        recent_hits: int = 12,
+        version_ttl: float = 60.0,
+    ):
+        self.sql_tools = sql_tools
+        self.version_fn = version_fn
+        self.dictionary_name = dictionary_name
+        self.schema_name = schema_name
+        self.year_column = year_column
+        self.wait = wait
+        self.max_entries = max_entries
+        self.version_ttl = version_ttl
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="schema-prefetch")
+        self._lock = threading.Lock()
+        self._schemas: "OrderedDict[str, str]" = OrderedDict()
+        self._stats: "OrderedDict[Tuple[str, str], List[Tuple[Any, ...]]]" = OrderedDict()
+        self._pending: Dict[Any, Future] = {}  # cache key -> running prefetch
+        self._version = DataVersion(version_fn, ttl=version_ttl) if version_fn is not None else None
+        self._hits: "deque[Tuple[str, str]]" = deque(maxlen=recent_hits)
+        self.stats: Dict[str, int] = {"lookups": 0, "prefetched": 0, "schema_hits": 0, "schema_waits": 0,
+                                      "schema_misses": 0, "errors": 0, "invalidations": 0}
+
+    def bind(self) -> "SchemaPrefetcher":
+        """A copy sharing the caches, pool and metrics with its own recent dictionary hits (one per session)."""
+        bound = copy.copy(self)
+        bound._hits = deque(maxlen=self._hits.maxlen)
+        return bound
+
+    # ----------------------------
+    # Scheduling
+    # ----------------------------
+    def prefetch(self, hits: Iterable[Tuple[str, str]]) -> None:
+        """Start fetching schema and column statistics for (table, column) dictionary hits."""
+        self._check_version()
+        by_table: Dict[str, List[str]] = {}
+        with_year = set()
+        for table, column in hits:
+            if not table or not column:
+                continue
+            columns = self.sql_tools.numeric_columns(table)
+            if not columns:
+                continue  # table not in this database
+            by_table.setdefault(table, [])
+            if self.year_column in columns:
+                with_year.add(table)
+            if columns.get(column) and column != self.year_column:
+                self._hits.append((table, column))
+                by_table[table].append(column)
+        with self._lock:
+            self.stats["lookups"] += 1
+            for table, columns in by_table.items():
+                if table not in self._schemas and table not in self._pending:
+                    self._pending[table] = self._pool.submit(self._fetch_schema, table)
+                missing = [c for c in dict.fromkeys(columns)
+                           if (table, c) not in self._stats and (table, c) not in self._pending]
+                if missing and table in with_year:
+                    future = self._pool.submit(self._fetch_stats, table, missing)
+                    for column in missing:
+                        self._pending[(table, column)] = future
+
+    def _fetch_schema(self, table: str) -> None:
+        try:
+            info = self.sql_tools.db.get_table_info_no_throw([table])
+            with self._lock:
+                if not info.startswith("Error"):
+                    self._put(self._schemas, table, info)
+                    self.stats["prefetched"] += 1
+        finally:
+            with self._lock:
+                self._pending.pop(table, None)
+
+    def _fetch_stats(self, table: str, columns: Sequence[str]) -> None:
+        try:
+            quote = self.sql_tools._get_engine().dialect.identifier_preparer.quote
+            year = quote(self.year_column)
+            aggregates = ", ".join(
+                f"COUNT({quote(c)}), MIN({quote(c)}), MAX({quote(c)}), AVG({quote(c)})" for c in columns)
+            sql = f"SELECT {year}, {aggregates} FROM {quote(table)} GROUP BY {year} ORDER BY {year}"
+            _, rows = self.sql_tools._fetch(sql)
+            with self._lock:
+                for i, column in enumerate(columns):
+                    self._put(self._stats, (table, column), [(r[0],) + tuple(r[1 + 4 * i:5 + 4 * i]) for r in rows])
+                self.stats["prefetched"] += 1
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+        finally:
+            with self._lock:
+                for column in columns:
+                    self._pending.pop((table, column), None)
+
+    def _put(self, cache: OrderedDict, key: Any, value: Any) -> None:
+        cache.pop(key, None)
+        cache[key] = value
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def _check_version(self) -> None:
+        if self._version is not None and self._version.changed():
+            self.sql_tools.forget_columns()
+            with self._lock:
+                self._schemas.clear()
+                self._stats.clear()
+                self.stats["invalidations"] += 1
+
+    # ----------------------------
+    # Lookups
+    # ----------------------------
+    def _cached(self, cache: OrderedDict, key: Any) -> Tuple[Optional[Any], bool]:
+        """Cached value for key, waiting for its prefetch if one is running; (value, waited)."""
+        with self._lock:
+            if key in cache:
+                cache.move_to_end(key)
+                return cache[key], False
+            future = self._pending.get(key)
+        if future is None:
+            return None, False
+        try:
+            future.result(timeout=self.wait)
+        except Exception:
+            return None, True
+        with self._lock:
+            return cache.get(key), True
+
+    def schema(self, tables: Sequence[str]) -> Optional[str]:
+        """Schema text for tables, as sql_db_schema formats it, or None if any table is not prefetched."""
+        infos, waited = [], False
+        for table in tables:
+            info, w = self._cached(self._schemas, table)
+            waited = waited or w
+            if info is None:
+                with self._lock:
+                    self.stats["schema_misses"] += 1
+                return None
+            infos.append(info)
+        with self._lock:
+            self.stats["schema_waits" if waited else "schema_hits"] += 1
+        return "\n\n".join(infos)
+
+    def column_stats(self, table: str, column: str) -> Optional[List[Tuple[Any, ...]]]:
+        """Rows of (year, non-null count, min, max, mean) for a prefetched column, or None."""
+        return self._cached(self._stats, (table, column))[0]
+
+    def stats_text(self, tables: Sequence[str]) -> str:
+        """Per-year statistics of this session's recent dictionary hits in tables."""
+        lines = []
+        for table, column in dict.fromkeys(reversed(self._hits)):
+            if table not in tables:
+                continue
+            rows = self.column_stats(table, column)
+            if not rows:
+                continue
+            per_year = "; ".join(
+                f"{r[0]}: n={r[1]}" + (f" min={_num(r[2])} max={_num(r[3])} mean={_num(r[4])}" if r[1] else "")
+                for r in rows)
+            lines.append(f"{table}.{column} by {self.year_column}: {per_year}")
+        if not lines:
+            return ""
+        return "Column statistics (non-null count, min, max, mean) for recent dictionary hits:\n" + "\n".join(lines)
+
+    # ----------------------------
+    # Tools
+    # ----------------------------
+    def wrap_tools(self, tools: List[Any]) -> List[Any]:
+        """Replace the dictionary and sql_db_schema tools (by name) with prefetching versions."""
+        wrapped = []
+        for tool in tools:
+            if tool.name == self.dictionary_name:
+                tool = self._dictionary_tool(tool)
+            elif tool.name == self.schema_name:
+                tool = self._schema_tool(tool)
+            wrapped.append(tool)
+        return wrapped
+
+    def _dictionary_tool(self, tool):
+        """The retriever tool, scheduling a prefetch of its hits before returning them."""
+        response_format = getattr(tool, "response_format", "content")
+
+        def lookup(query: str):
+            result = tool.func(query)
+            content, docs = result if response_format == "content_and_artifact" else (result, None)
+            if docs is not None:
+                hits = [(d.metadata.get("table"), d.metadata.get("column")) for d in docs]
+            else:
+                hits = self._DICT_RE.findall(str(content))
+            try:
+                self.prefetch(hits)
+            except Exception:
+                with self._lock:
+                    self.stats["errors"] += 1
+            return result
+
+        return StructuredTool.from_function(
+            func=lookup,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            response_format=response_format,
+            metadata=tool.metadata,
+        )
+
+    def _schema_tool(self, tool):
+        """sql_db_schema answered from the prefetch cache, led by the recent hits' statistics."""
+        def schema(table_names: str) -> str:
+            tables = [t.strip() for t in table_names.split(",") if t.strip()]
+            info = self.schema(tables) if tables else None
+            if info is None:
+                info = tool.invoke({"table_names": table_names})
+            stats = self.stats_text(tables)
+            return stats + "\n\n" + info if stats else info
+
+        return StructuredTool.from_function(
+            func=schema,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            metadata=tool.metadata,
+        )
+
+    def report(self) -> str:
+        with self._lock:
+            s = dict(self.stats)
+            n_schemas, n_stats, n_pending = len(self._schemas), len(self._stats), len(self._pending)
+        calls = s["schema_hits"] + s["schema_waits"] + s["schema_misses"]
+        served = s["schema_hits"] + s["schema_waits"]
+        rate = served / calls if calls else 0.0
+        return (f"sql_db_schema from cache {served}/{calls} ({rate:.0%}, {s['schema_waits']} waited), "
+                f"{s['lookups']} dictionary lookups, {s['prefetched']} prefetches, {s['errors']} errors, "
+                f"{s['invalidations']} invalidations; cached {n_schemas} tables, {n_stats} columns, "
+                f"{n_pending} running")
+
+
+def _num(value: Any) -> str:
+    return f"{value:.4g}" if isinstance(value, float) else str(value)
@@ -24,6 +24,7 @@ class SearchTool(BaseTool):
         "Returns a single most-likely short fact string (for RAG ingestion)."
     )
     max_results: int = 5  # <- declare as a field so Pydantic accepts it
+    metadata: Optional[dict] = {"stateful": False}  # independent web lookups may run concurrently
 
     # private runtime-only attribute (not a model field)
     _client: Any = PrivateAttr()
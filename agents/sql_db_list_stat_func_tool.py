@@ -22,7 +22,8 @@ class SQLDBListStatFuncTool(BaseTool):
     def __init__(self, parent, schema: str = "public", prefix: str = "stat", limit: Optional[int] = None, **kwargs):
         # initialize BaseTool
         super().__init__(name="sql_db_list_statistical_functions", 
-                        description="List statistical functions defined in the database."
+                        description="List statistical functions defined in the database.",
+                        metadata={"stateful": False},
                         )
         self._parent = parent
         self._schema = schema
@@ -59,6 +60,25 @@ class SQLDBListStatFuncTool(BaseTool):
             params["limit"] = int(self._limit)
 
         eng = self._get_engine()
+        if eng.dialect.name == "duckdb":
+            # the ETL's DuckDB file defines the stat_* functions as macros
+            sql = """
+            SELECT
+                schema_name,
+                function_name AS func_name,
+                array_to_string(parameters, ', ') AS args,
+                CASE WHEN function_type = 'table_macro' THEN 'TABLE' ELSE coalesce(return_type, '') END AS returns,
+                coalesce(description, '') AS comment
+            FROM duckdb_functions()
+            WHERE NOT internal
+              AND function_type IN ('macro', 'table_macro')
+              AND lower(function_name) LIKE :prefix_like
+            ORDER BY function_name, len(parameters)
+            """
+            if self._limit:
+                sql += " LIMIT :limit"
+            params.pop("schema")
+
         with eng.connect() as conn:
             result = conn.execute(text(sql), params)
             # use Result.mappings() to get dict-like rows (works across SQLAlchemy versions)
@@ -1,7 +1,20 @@
-from langchain_community.utilities.sql_database import SQLDatabase
+from langchain_community.utilities.sql_database import SQLDatabase, truncate_word
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from typing import Callable, List, Any
-import re
+from langchain.tools import StructuredTool
+from typing import Any, Callable, Dict, List, Optional
+import copy
+import hashlib
+import threading
+import time
+
+from sqlalchemy import inspect, text
+from sqlalchemy.types import Float, Integer, Numeric
+
+from rollup_router import RollupRouter
+from duckdb_functions import install_duckdb_hooks
+from approximate_query import ApproximateQuery
+from query_templates import SHARED_TEMPLATES
+from sql_validator import SQLValidator, SQLPolicyError
 
 class SQLTools:
     """
@@ -15,62 +28,98 @@ class SQLTools:
         - ListSQLDatabaseTool → list available tables.
     and it wires these tools to the SQLDatabase and LLM.
 
+    With use_rollups=True the query tool first offers each query to a RollupRouter: simple
+    state/year aggregates (AVG, COUNT of a column) over sdoh_surveys are answered from the
+    materialized rollups built by the ETL.  Other queries, or a failed routed query, run unchanged.
+
+    db_uri may also point at the DuckDB file the ETL builds (duckdb:////workspace/data/sdoh.duckdb,
+    requires duckdb-engine).  It is opened read-only, and the Python UDFs its stat_* macros call are
+    registered on each connection, so the agent's SQL runs unchanged on either engine.
+
+    With a ResultStore, sql_db_query registers each result as an Arrow table and returns its
+    handle plus a short preview; generate_chart, mapdata_tool and the statistics tools read the
+    full result by handle.
+
+    Queries run through a QueryTemplates registry (process-wide by default): literals are
+    normalized out, per-template counts and latency are recorded, and hot templates run as
+    server-side prepared statements on each pooled connection.
+
+    Every query is validated once by a SQLValidator before it runs (sqlglot AST, cached by query
+    hash): a single read-only statement, explicit columns (no SELECT * or alias.*), and a LIMIT of
+    at most max_rows.  The rollup router and the approximate path read the validator's parsed
+    tree rather than the text (the router caches its decision by the query fingerprint), and
+    the template normalization is passed on to QueryTemplates.execute.
+    On PostgreSQL the query connections are also set to read-only transactions.
+
+    approximate=True adds sql_db_query_approximate: AVG aggregates by state/year estimated from
+    the stratified sample built by the ETL, with standard errors and 95% confidence intervals.
+
     Example:
         sql_tools = SQLTools(db_uri="sqlite:///example.db", llm=my_llm)
         tools = sql_tools.get_tools() + [my_other_tool]
         agent = initialize_agent(tools, my_llm, ...)
     """
-    def __init__(self, db_uri: str, llm=None):
+    def __init__(self, db_uri: str, llm=None, use_rollups: bool = True, result_store=None, approximate: bool = False,
+                 templates=None, max_rows: int = 1000):
         """
         Initialize the SQLTools helper.
 
         Args:
-            db_uri (str): The SQLite database URI, e.g., 'sqlite:///example.db'
+            db_uri (str): The database URI, e.g., 'postgresql://...', 'duckdb:////workspace/data/sdoh.duckdb'
+                or 'sqlite:///example.db'
             llm: The LLM to pass to the toolkit. Required for tools that auto-generate SQL.
+            use_rollups (bool): Route matching aggregate queries to the materialized rollups.
+            result_store: Optional per-session ResultStore; query results are returned as handles.
+            approximate (bool): Add the opt-in approximate (sampled) aggregate query tool.
+            templates: QueryTemplates registry; defaults to the process-wide SHARED_TEMPLATES.
+            max_rows (int): Largest LIMIT a query may have; queries without one get LIMIT max_rows.
         """
         # disable sample rows in the table info to avoid sending sample data into prompts
-        self.db = SQLDatabase.from_uri(db_uri, sample_rows_in_table_info=0)
+        if db_uri.startswith("duckdb"):
+            # read-only so the ETL can swap in a rebuilt file while the assistant runs
+            self.db = SQLDatabase.from_uri(db_uri, sample_rows_in_table_info=0,
+                                           engine_args={"connect_args": {"read_only": True}})
+            install_duckdb_hooks(self._get_engine())
+        else:
+            self.db = SQLDatabase.from_uri(db_uri, sample_rows_in_table_info=0)
         self.llm = llm or ChatOpenAI()  # fallback if none provided
         self.toolkit = SQLDatabaseToolkit(db=self.db, llm=self.llm)
+        self.router = RollupRouter(self._get_engine()) if use_rollups else None
+        self.result_store = result_store
+        self.templates = templates or SHARED_TEMPLATES
+        self.validator = SQLValidator(dialect=self._get_engine().dialect.name, max_rows=max_rows,
+                                      templates=self.templates)
+        self.approximate = (
+            ApproximateQuery(self._get_engine(), self.router or RollupRouter(self._get_engine()))
+            if approximate else None
+        )
+        self._column_types: Dict[str, Dict[str, bool]] = {}  # table -> {column: numeric}, shared by bind()
+        self._lock = threading.Lock()
    
-    def _reject_select_star_wrapper(self, original_fn: Callable) -> Callable:
-        def wrapped(**kwargs):
-            # Accept common key names used by different tools
-            query_key = None
-            if "query" in kwargs:
-                query_key = "query"
-            elif "sql" in kwargs:
-                query_key = "sql"
-
-            if query_key:
-                q = (kwargs.get(query_key) or "").strip()
-                if _SELECT_STAR_RE.search(q):
-                    raise ValueError(
-                        "Queries containing SELECT * or alias.* are not allowed. "
-                        "Please specify explicit columns in the SELECT clause."
-                    )
-            return original_fn(**kwargs)
-
-        return wrapped
+    def bind(self, result_store) -> "SQLTools":
+        """
+        A copy sharing this instance's engine, toolkit, router, templates and validator but
+        writing results to another (per-session) ResultStore.
+        """
+        bound = copy.copy(self)
+        bound.result_store = result_store
+        return bound
 
     def get_tools(self):
         tools = self.toolkit.get_tools()
 
         for tool in tools:
+            # reads only; results go to the (locked) ResultStore, so calls may run concurrently
+            tool.metadata = {**(tool.metadata or {}), "stateful": False}
             if tool.name == "sql_db_query":
                 tool.description = "Run a detailed and valid SQL query against the database. DO NOT use SELECT * or alias.*; explicitly list the columns you need. "
-                try:
-                    tool.func = self._reject_select_star_wrapper(tool.func)
-                except Exception:
-                    # defensive: if we can't wrap, leave original function but keep description
-                    pass
+                if self.result_store is not None:
+                    tool.description += "Returns a result handle (e.g. res_3) with a preview of the rows; pass the handle to other tools instead of copying rows."
+                tools[tools.index(tool)] = self._routed_query_tool(tool)
 
             elif tool.name == "sql_db_query_checker":
                 tool.description = "Check if a given SQL query is syntactically valid before execution. This checker will reject queries containing SELECT * or alias.*; list explicit columns instead."
-                try:
-                    tool.func = self._reject_select_star_wrapper(tool.func)
-                except Exception:
-                    pass
+                tools[tools.index(tool)] = self._validated_checker_tool(tool)
 
             elif tool.name == "sql_db_list_tables":
                 tool.description = "List all available tables the database. Use this to discover which tables exist before querying."
@@ -78,8 +127,172 @@ class SQLTools:
             elif tool.name == "sql_db_schema":
                 tool.description = "Retrieve the schema and sample rows for specific tables.Input: comma-separated list of valid table names."
 
+        if self.approximate is not None:
+            tools.append(self._approximate_query_tool())
+
         return tools
+
+    def run_approximate_query(self, query: str) -> str:
+        """Run a query through the approximate (stratified sample) path and format the estimates."""
+        try:
+            validated = self.validator.validate(query)
+            columns, rows = self.approximate.run(validated.sql, ast=validated.ast)
+        except Exception as e:
+            # same shape as SQLDatabase.run_no_throw so the agent can correct the query
+            return f"Error: {e}"
+        header = ("Approximate result from a stratified sample of sdoh_surveys (state x year strata); "
+                  "each estimate has a standard error and 95% confidence interval.")
+        if self.result_store is not None:
+            handle = self.result_store.put(self.result_store.table_from_rows(columns, rows), source=query)
+            return header + "\n" + self.result_store.summary(handle)
+        return header + "\n" + ", ".join(columns) + "\n" + str([tuple(r) for r in rows])
+
+    def _approximate_query_tool(self):
+        def query(query: str) -> str:
+            """A detailed and correct SQL query."""
+            return self.run_approximate_query(query)
+
+        return StructuredTool.from_function(
+            func=query,
+            name="sql_db_query_approximate",
+            description=(
+                "Approximate version of sql_db_query for AVG(column) over sdoh_surveys grouped by state and/or year "
+                "(optional state/year filters, ORDER BY, LIMIT). Answers from a stratified sample and returns each "
+                "estimate with std_error, ci95_low, ci95_high and sample_n. Use it for quick exploration of broad "
+                "trends. Use sql_db_query (exact) when the user asks for exact values, a single county or a few "
+                "counties, counts, rankings whose confidence intervals overlap, or values for a report."
+            ),
+            metadata={"stateful": False},
+        )
+
+    def run_query(self, query: str) -> str:
+        """
+        Validate a query, then run it, answering it from the rollups when the router recognizes it.
+        A routed query that fails falls back to the original query.
+        With a result store the rows are registered and the handle summary is returned;
+        otherwise rows are formatted like SQLDatabase.run.
+        """
+        try:
+            validated = self.validator.validate(query)
+        except SQLPolicyError as e:
+            return f"Error: {e}"
+        routed = (self.router.route(validated.sql, ast=validated.ast, key=validated.fingerprint)
+                  if self.router is not None else None)
+        fetched = None
+        if routed:
+            try:
+                fetched = self._fetch(routed)
+            except Exception:
+                self.router.stats["fallback"] += 1
+        if fetched is None:
+            try:
+                fetched = self._fetch(validated.sql, template=validated.template)
+            except Exception as e:
+                # same shape as SQLDatabase.run_no_throw so the agent can correct the query
+                return f"Error: {e}"
+        columns, rows = fetched
+        if not columns or (not rows and self.result_store is None):
+            return ""
+        note = ""
+        if validated.notes and len(rows) >= self.validator.max_rows:
+            note = (f"Note: results are limited to {self.validator.max_rows} rows; aggregate or filter "
+                    "to see the rest.\n")
+        if self.result_store is not None:
+            handle = self.result_store.put(self.result_store.table_from_rows(columns, rows), source=validated.sql)
+            return note + self.result_store.summary(handle)
+        max_len = getattr(self.db, "_max_string_length", 300)
+        return note + str([tuple(truncate_word(c, length=max_len) for c in r) for r in rows])
+
+    def _fetch(self, sql: str, template=None):
+        """Execute sql as-is (no bind parameter parsing) through the template registry; return (column names, rows)."""
+        with self._get_engine().connect() as conn:
+            self._set_read_only(conn)
+            return self.templates.execute(conn, sql, template=template)
+
+    @staticmethod
+    def _set_read_only(conn) -> None:
+        """Make every later transaction on this PostgreSQL connection read-only (once per pooled connection)."""
+        if conn.dialect.name != "postgresql":
+            return
+        info = conn.connection.info
+        if not info.get("read_only"):
+            conn.exec_driver_sql("SET SESSION CHARACTERISTICS AS TRANSACTION READ ONLY")
+            conn.commit()
+            info["read_only"] = True
+
+    def _routed_query_tool(self, tool):
+        """Replace the toolkit's query tool with one that calls run_query, keeping its name, description and input schema."""
+        def query(query: str) -> str:
+            return self.run_query(query)
+
+        return StructuredTool.from_function(
+            func=query,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            metadata=tool.metadata,
+        )
     
+    def _validated_checker_tool(self, tool):
+        """Wrap the toolkit's LLM query checker so policy violations are reported without an LLM call."""
+        def query(query: str) -> str:
+            error = self.validator.check(query)
+            if error is not None:
+                return f"Error: {error}"
+            return tool.invoke({"query": query})
+
+        return StructuredTool.from_function(
+            func=query,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            metadata=tool.metadata,
+        )
+
+    def data_version(self, table: str = "sdoh_surveys") -> str:
+        """
+        Short identifier of the loaded data: a hash of the ETL's per-year checksums
+        (etl_load_years), or of the row count and latest year when that table does not exist.
+        Changes whenever the survey data is reloaded.
+        """
+        engine = self._get_engine()
+        rows = []
+        try:
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    text("SELECT year, checksum FROM etl_load_years WHERE table_name = :t ORDER BY year"),
+                    {"t": table},
+                ).fetchall()
+        except Exception:
+            pass  # no load state table (e.g. the DuckDB file)
+        if not rows:
+            with engine.connect() as conn:
+                rows = conn.execute(text(f'SELECT COUNT(*), MAX(year) FROM "{table}"')).fetchall()
+        return hashlib.sha1(repr([tuple(r) for r in rows]).encode("utf-8")).hexdigest()[:16]
+
+    def numeric_columns(self, table: str) -> Dict[str, bool]:
+        """
+        {column: is numeric} for table, read from the database once and cached (shared by bind()).
+        Empty, and not cached, when the table cannot be inspected (unknown table, database down).
+        """
+        with self._lock:
+            if table in self._column_types:
+                return self._column_types[table]
+        try:
+            columns = inspect(self._get_engine()).get_columns(table)
+        except Exception:
+            return {}
+        # Float is not a Numeric subclass in SQLAlchemy 2.1 (REAL / DOUBLE PRECISION columns)
+        types = {c["name"]: isinstance(c["type"], (Integer, Numeric, Float)) for c in columns}
+        with self._lock:
+            self._column_types[table] = types
+        return types
+
+    def forget_columns(self) -> None:
+        """Drop the cached column types, e.g. after the data version changed."""
+        with self._lock:
+            self._column_types.clear()
+
     def _get_engine(self):
         """
         Obtain the underlying SQLAlchemy engine from the SQLDatabase instance.
@@ -92,3 +305,37 @@ class SQLTools:
         if callable(get_eng):
             return get_eng()
         raise RuntimeError("Could not find SQLAlchemy engine on SQLDatabase instance.")
+
+
+class DataVersion:
+    """
+    Watches a data version function (e.g. SQLTools.data_version) for caches that must be emptied
+    when the data is reloaded.  version_fn is called at most every ttl seconds; while it fails
+    (database unreachable) the last known version is kept.
+
+    Example:
+        version = DataVersion(sql_tools.data_version)
+        if version.changed():
+            cache.clear()
+    """
+    def __init__(self, version_fn: Callable[[], str], ttl: float = 60.0):
+        self.version_fn = version_fn
+        self.ttl = ttl
+        self.current: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self) -> bool:
+        """True once each time version_fn() returns a different version than the last one seen."""
+        now = time.monotonic()
+        with self._lock:
+            if self.current is not None and now - self._checked_at < self.ttl:
+                return False
+            self._checked_at = now  # one caller refreshes; the others keep the current version
+        try:
+            version = self.version_fn()
+        except Exception:
+            return False
+        with self._lock:
+            previous, self.current = self.current, version
+        return previous is not None and version != previous
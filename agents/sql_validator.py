@@ -0,0 +1,273 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import sqlglot  # type: ignore
+    from sqlglot import exp  # type: ignore
+except Exception:
+    sqlglot = None  # type: ignore
+    exp = None  # type: ignore
+
+
+class SQLPolicyError(ValueError):
+    """A query the agent may not run; the message tells the agent how to fix it."""
+
+
+# Fallback checks used when sqlglot is not installed or cannot parse the query.
+# Strings, quoted identifiers and comments are blanked out before these run.
+_SELECT_STAR_RE = re.compile(r'(?:\bselect\s+(?:distinct\s+)?|,\s*)(?:[A-Za-z_]\w*\.|"[^"]*"\.)?\*(?![\w*])', re.I)
+_WRITE_RE = re.compile(
+    r"\b(insert|update|delete|merge|create|drop|alter|truncate|grant|revoke|copy|call|do|vacuum|reindex"
+    r"|cluster|refresh|lock|comment|security|attach|detach|install|load|pragma|into)\b",
+    re.I,
+)
+_LEADING_RE = re.compile(r"^\s*\(*\s*(select|with|from)\b", re.I)
+_TAIL_LIMIT_RE = re.compile(r"\blimit\s+(\d+|all)(\s+offset\s+\d+)?\s*$", re.I)
+# SQL standard row limit; without a count it fetches one row
+_TAIL_FETCH_RE = re.compile(r"\bfetch\s+(?:first|next)\s+(\d+)?\s*rows?\s+only\s*$", re.I)
+_MASK_RE = re.compile(r"--[^\n]*|/\*.*?\*/|[eE]?'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"", re.S)
+
+# Functions with side effects on the server (PostgreSQL / DuckDB); lower-case names.
+_BLOCKED_FUNCTIONS = {
+    "pg_sleep", "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "set_config",
+    "pg_read_file", "pg_read_binary_file", "pg_ls_dir", "pg_stat_file", "lo_import", "lo_export",
+    "dblink", "dblink_exec", "nextval", "setval", "pg_advisory_lock", "read_text", "read_blob",
+}
+_WRITE_NODES = ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "AlterTable",
+                "TruncateTable", "Command", "Into", "Copy", "Grant", "Revoke", "Set", "Pragma", "Use")
+
+# SQLAlchemy dialect name -> sqlglot dialect
+DIALECTS = {"postgresql": "postgres", "duckdb": "duckdb", "sqlite": "sqlite"}
+
+
+class ValidatedQuery:
+    """
+    A query that passed SQLValidator.
+
+    sql: what to execute (the original text, or with a LIMIT added or lowered).
+    ast: the sqlglot tree of sql (None when sqlglot is unavailable); shared through the
+        cache, so later stages must treat it as read-only.
+    template: QueryTemplates.normalize(sql), passed on to QueryTemplates.execute.
+    fingerprint: stable hash of the executed statement, for result caches.
+    notes: policy changes made to the query, reported back to the agent.
+    """
+
+    __slots__ = ("sql", "original", "ast", "template", "fingerprint", "notes")
+
+    def __init__(self, sql: str, original: str, ast: Any, template: Tuple[str, List[str]], notes: List[str]):
+        self.sql = sql
+        self.original = original
+        self.ast = ast
+        self.template = template
+        self.fingerprint = hashlib.sha1(sql.encode("utf-8")).hexdigest()
+        self.notes = notes
+
+
+class SQLValidator:
+    """
+    Parses agent SQL once and enforces the query policy before anything runs:
+
+        - exactly one statement;
+        - read-only: a SELECT / WITH / set operation, no DML or DDL anywhere in the tree
+          (including data-modifying CTEs and SELECT ... INTO), no side-effecting functions;
+        - explicit columns: no SELECT * or alias.* (COUNT(*) is fine);
+        - a LIMIT of at most max_rows on the outermost query (added when missing, lowered when larger);
+          FETCH FIRST n ROWS ONLY counts as the LIMIT and is lowered the same way.
+
+    Parsing uses sqlglot when it is installed.  Without it, or when sqlglot cannot parse a
+    dialect-specific query, the same policies are checked with conservative text rules and
+    the database reports syntax errors as before.
+
+    Results (accepted or rejected) are cached by a hash of the query text, so a query the
+    agent repeats, or sends to sql_db_query_checker and then sql_db_query, is parsed once.
+    The ValidatedQuery carries the AST and the template normalization for later stages.
+
+    Example:
+        validator = SQLValidator(dialect="postgresql", templates=SHARED_TEMPLATES)
+        vq = validator.validate("SELECT state, AVG(acs_pct_uninsured) FROM sdoh_surveys GROUP BY state")
+        columns, rows = templates.execute(conn, vq.sql, template=vq.template)
+    """
+
+    def __init__(self, dialect: str = "postgresql", max_rows: int = 1000, cache_size: int = 512, templates=None):
+        self.dialect = DIALECTS.get(dialect, dialect)
+        self.max_rows = max_rows
+        self.cache_size = cache_size
+        self.templates = templates
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "rejected": 0, "limited": 0, "fallback_parses": 0}
+
+    def validate(self, sql: str) -> ValidatedQuery:
+        """Return the ValidatedQuery for sql, or raise SQLPolicyError."""
+        key = hashlib.sha1((sql or "").encode("utf-8")).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self.stats["hits"] += 1
+            else:
+                self.stats["misses"] += 1
+        if cached is None:
+            try:
+                cached = self._validate(sql or "")
+            except SQLPolicyError as e:
+                cached = e
+            with self._lock:
+                self._cache[key] = cached
+                if isinstance(cached, SQLPolicyError):
+                    self.stats["rejected"] += 1
+                elif cached.notes:
+                    self.stats["limited"] += 1
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        if isinstance(cached, SQLPolicyError):
+            raise cached
+        return cached
+
+    def check(self, sql: str) -> Optional[str]:
+        """Policy error message for sql, or None when it is allowed."""
+        try:
+            self.validate(sql)
+        except SQLPolicyError as e:
+            return str(e)
+        return None
+
+    # ----------------------------
+    # Validation
+    # ----------------------------
+    def _validate(self, sql: str) -> ValidatedQuery:
+        if not sql.strip():
+            raise SQLPolicyError("Empty query.")
+        ast = self._parse(sql)
+        if ast is None:
+            out, notes = self._validate_text(sql)
+        else:
+            out, notes, ast = self._validate_ast(sql, ast)
+        template = self.templates.normalize(out) if self.templates is not None else (out, [])
+        return ValidatedQuery(out, sql, ast, template, notes)
+
+    def _parse(self, sql: str):
+        if sqlglot is None:
+            return None
+        try:
+            statements = [s for s in sqlglot.parse(sql, read=self.dialect) if s is not None]
+        except sqlglot.errors.SqlglotError:
+            with self._lock:
+                self.stats["fallback_parses"] += 1
+            return None
+        if len(statements) > 1:
+            raise SQLPolicyError("Only one SQL statement per call is allowed; run the statements separately.")
+        if not statements:
+            raise SQLPolicyError("Empty query.")
+        return statements[0]
+
+    def _validate_ast(self, sql: str, ast) -> Tuple[str, List[str], Any]:
+        query_type = getattr(exp, "Query", None) or (exp.Select, exp.Union)
+        if not isinstance(ast, query_type):
+            raise SQLPolicyError("Only read-only SELECT queries are allowed.")
+        write_nodes = tuple(getattr(exp, n) for n in _WRITE_NODES if hasattr(exp, n))
+        if ast.find(*write_nodes) is not None:
+            raise SQLPolicyError("Only read-only SELECT queries are allowed (no INSERT/UPDATE/DELETE/DDL or SELECT INTO).")
+        for func in ast.find_all(exp.Func):
+            name = (func.name if isinstance(func, exp.Anonymous) else func.sql_name()).lower()
+            if name in _BLOCKED_FUNCTIONS:
+                raise SQLPolicyError(f"Function {name}() is not allowed.")
+        for star in ast.find_all(exp.Star):
+            if not isinstance(star.parent, exp.Count):
+                raise SQLPolicyError(
+                    "Queries containing SELECT * or alias.* are not allowed. "
+                    "Please specify explicit columns in the SELECT clause."
+                )
+
+        # the LIMIT is applied to the tree as well, so the executed text never needs a second parse
+        limit = ast.args.get("limit")
+        if limit is None:
+            return self._append_limit(sql), [f"LIMIT {self.max_rows} added"], ast.limit(self.max_rows)
+        limited = ast.copy()
+        if isinstance(limit, exp.Fetch):
+            # FETCH FIRST [n] ROWS ONLY is stored as the limit with a `count` (None means 1 row)
+            value = limit.args.get("count") or exp.Literal.number(1)
+            options = limit.args.get("limit_options")
+            exact = options is None or not (options.args.get("percent") or options.args.get("with_ties"))
+            if exact and isinstance(value, exp.Literal) and value.is_int and int(value.this) <= self.max_rows:
+                return sql, [], ast
+            if exact:
+                limited.args["limit"].set("count", exp.Literal.number(self.max_rows))
+            else:
+                # PERCENT / WITH TIES can return more rows than the count: use a plain LIMIT
+                limited.set("limit", exp.Limit(expression=exp.Literal.number(self.max_rows)))
+            out = (self._lower_tail_limit(sql) if exact else None) or limited.sql(dialect=self.dialect)
+            return out, [f"FETCH FIRST lowered to {self.max_rows} rows"], limited
+        value = limit.args.get("expression")
+        if isinstance(value, exp.Literal) and value.is_int and int(value.this) <= self.max_rows:
+            return sql, [], ast
+        limited.args["limit"].set("expression", exp.Literal.number(self.max_rows))
+        # keep the agent's text where the LIMIT is at the end; regenerate only otherwise
+        out = self._lower_tail_limit(sql) or limited.sql(dialect=self.dialect)
+        return out, [f"LIMIT lowered to {self.max_rows}"], limited
+
+    def _validate_text(self, sql: str) -> Tuple[str, List[str]]:
+        masked = _MASK_RE.sub(_blank, sql)
+        body = masked.rstrip().rstrip(";").rstrip()
+        if ";" in body:
+            raise SQLPolicyError("Only one SQL statement per call is allowed; run the statements separately.")
+        if not _LEADING_RE.match(body) or _WRITE_RE.search(body):
+            raise SQLPolicyError("Only read-only SELECT queries are allowed.")
+        for name in re.findall(r"\b([A-Za-z_]\w*)\s*\(", body):
+            if name.lower() in _BLOCKED_FUNCTIONS:
+                raise SQLPolicyError(f"Function {name.lower()}() is not allowed.")
+        if _SELECT_STAR_RE.search(body):
+            raise SQLPolicyError(
+                "Queries containing SELECT * or alias.* are not allowed. "
+                "Please specify explicit columns in the SELECT clause."
+            )
+        fetch = _TAIL_FETCH_RE.search(body)
+        if fetch is None and re.search(r"\bfetch\s+(?:first|next)\b", body, re.I):
+            # PERCENT / WITH TIES, or not at the end: the row cap cannot be checked without a parse
+            raise SQLPolicyError(f"Use LIMIT n (at most {self.max_rows}) instead of this FETCH clause.")
+        if fetch is not None:
+            if int(fetch.group(1) or 1) <= self.max_rows:
+                return sql, []
+            return self._lower_tail_limit(sql), [f"FETCH FIRST lowered to {self.max_rows} rows"]
+        m = _TAIL_LIMIT_RE.search(body)
+        if m is None:
+            return self._append_limit(sql), [f"LIMIT {self.max_rows} added"]
+        if m.group(1).isdigit() and int(m.group(1)) <= self.max_rows:
+            return sql, []
+        return self._lower_tail_limit(sql), [f"LIMIT lowered to {self.max_rows}"]
+
+    def _lower_tail_limit(self, sql: str) -> Optional[str]:
+        """
+        sql with its trailing LIMIT n or FETCH FIRST n ROWS ONLY lowered to max_rows, or None
+        when it does not end in one.
+        """
+        body = _MASK_RE.sub(_blank, sql).rstrip().rstrip(";").rstrip()
+        m = _TAIL_LIMIT_RE.search(body)
+        if m is not None:
+            start, end = m.span(1)
+            return sql[:start] + str(self.max_rows) + sql[end:]
+        m = _TAIL_FETCH_RE.search(body)
+        if m is None:
+            return None
+        if m.group(1) is not None:
+            start, end = m.span(1)
+            return sql[:start] + str(self.max_rows) + sql[end:]
+        # FETCH FIRST ROWS ONLY (one row) is within any cap; insert the count for completeness
+        start = body.lower().index("row", m.start())
+        return sql[:start] + f"{self.max_rows} " + sql[start:]
+
+    def _append_limit(self, sql: str) -> str:
+        # newline so a trailing line comment cannot swallow the LIMIT
+        return sql.rstrip().rstrip(";").rstrip() + f"\nLIMIT {self.max_rows}"
+
+
+def _blank(m) -> str:
+    """Blank out a comment, string or quoted identifier, keeping offsets (and the quotes)."""
+    text = m.group()
+    if text.startswith(("--", "/*")):
+        return " " * len(text)
+    quote = "'" if text[-1] == "'" else '"'
+    return quote + " " * (len(text) - 2) + quote
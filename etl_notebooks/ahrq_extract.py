@@ -0,0 +1,592 @@
+##################################
+#
+#       Extract pipeline for AHRQ county SDOH workbooks.
+#       Used by extract_transform_ahrq.ipynb.  Downloads run concurrently on a
+#       shared session with retries; openpyxl parsing runs in a process pool.
+#       Parsed and column-pruned years are cached as Parquet keyed by the
+#       workbook content hash and the column-selection parameters.
+#
+##################################
+
+import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import resource
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+COUNTY_URL_TEMPLATE = "https://www.ahrq.gov/sites/default/files/wysiwyg/sdoh/SDOH_{yr}_COUNTY_1_0.xlsx"
+LOCAL_PATH_TEMPLATE = "./ahrq{yr}.xlsx"
+
+# Tract and zip files are much larger; use the streaming reader (iter_workbook_chunks) for these.
+TRACT_URL_TEMPLATE = "https://www.ahrq.gov/sites/default/files/wysiwyg/sdoh/SDOH_{yr}_TRACT_1_0.xlsx"
+ZIPCODE_URL_TEMPLATE = "https://www.ahrq.gov/sites/default/files/wysiwyg/sdoh/SDOH_{yr}_ZIPCODE_1_0.xlsx"
+
+# Bump when the parse/prune logic changes so old cache entries are not reused.
+CACHE_VERSION = 2
+
+# Leading columns dropped from each county workbook (year, FIPS codes, region, territory).
+DROP_COLUMN_POSITIONS = [0, 1, 2, 5, 6]
+
+# Source key columns kept by name on the lean read path; YEAR is added from the file's year.
+KEY_SOURCE_COLUMNS = ("STATE", "COUNTY")
+TRACT_KEY_COLUMNS = ("STATE", "COUNTY", "TRACTFIPS")
+ZIPCODE_KEY_COLUMNS = ("STATE", "ZIPCODE")
+
+BROWSER_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+                   "AppleWebKit/537.36 (KHTML, like Gecko) "
+                   "Chrome/120.0.0.0 Safari/537.36"),
+    "Accept": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    # "Referer": "https://www.ahrq.gov/sdoh/index.html",
+}
+
+
+def make_session(retries: int = 3, backoff: float = 1.0, pool_size: int = 8) -> requests.Session:
+    """
+    Shared requests session with browser-like headers and a retry policy for
+    transient failures (connection errors, 429 and 5xx responses).
+    """
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(["GET"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    s = requests.Session()
+    s.headers.update(BROWSER_HEADERS)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def download_excel_with_browser_headers(url: str, out_path: str = None, session: requests.Session = None, timeout: int = 30) -> bytes:
+    """
+    If we are running in a container, download can get CloudFront 403 meaning the site
+    is blocking "non-browser" clients.  Send browser-like headers.
+    """
+    s = session or requests.Session()
+    r = s.get(url, headers=BROWSER_HEADERS, timeout=timeout)
+    r.raise_for_status()
+    content = r.content
+    if out_path:
+        with open(out_path, "wb") as f:
+            f.write(content)
+    return content
+
+
+def _is_remote(source: str) -> bool:
+    return source.startswith(("http://", "https://"))
+
+
+def fetch_workbook(yr: str, source_template: str, out_template: str, session: requests.Session,
+                   timeout: int = 60, reuse_downloads: bool = False) -> str:
+    """
+    Make the workbook for `yr` available on disk and return its path.
+    A local `source_template` (e.g. fixture workbooks) is used in place without downloading.
+    With `reuse_downloads` an existing file at `out_template` is used instead of downloading again.
+    """
+    source = source_template.format(yr=yr)
+    if not _is_remote(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(source)
+        return source
+    out_path = out_template.format(yr=yr)
+    if reuse_downloads and os.path.exists(out_path):
+        return out_path
+    download_excel_with_browser_headers(source, out_path=out_path, session=session, timeout=timeout)
+    return out_path
+
+
+def parse_workbook(path: str, yr: str, sheet_name: str = "Data") -> pd.DataFrame:
+    """
+    Parse one county workbook, drop the leading id columns and tag rows with YEAR.
+    Top-level so it can run in a worker process.
+    """
+    df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl")
+    df = df.drop(df.columns[DROP_COLUMN_POSITIONS], axis=1)
+    df["YEAR"] = yr
+    return df
+
+
+# ----------------------------
+# Parquet cache
+# ----------------------------
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(path: str, surveys: Optional[Sequence[str]], questions: Optional[Sequence[str]], lean: bool = True) -> str:
+    """Key for a pruned year: workbook bytes + column-selection parameters + cache version."""
+    params = json.dumps({
+        "surveys": list(surveys or []),
+        "questions": list(questions or []),
+        "lean": bool(lean),
+        "drop": DROP_COLUMN_POSITIONS,
+        "version": CACHE_VERSION,
+    }, sort_keys=True)
+    h = hashlib.sha256(file_sha256(path).encode("ascii"))
+    h.update(params.encode("utf-8"))
+    return h.hexdigest()[:24]
+
+
+def cache_path(cache_dir: str, yr: str, key: str) -> str:
+    return os.path.join(cache_dir, f"ahrq{yr}_{key}.parquet")
+
+
+def read_cached_year(path: str, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+    """Read a cached year, projecting only `columns` when given."""
+    return pd.read_parquet(path, columns=list(columns) if columns else None)
+
+
+def _write_cache(df: pd.DataFrame, cache_dir: str, yr: str, key: str) -> str:
+    os.makedirs(cache_dir, exist_ok=True)
+    target = cache_path(cache_dir, yr, key)
+    tmp = f"{target}.{os.getpid()}.tmp"
+    df.to_parquet(tmp, index=False)
+    os.replace(tmp, target)
+    # drop entries for the same year built from older bytes or parameters
+    for old in glob.glob(os.path.join(cache_dir, f"ahrq{yr}_*.parquet")):
+        if old != target:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+    return target
+
+
+def process_workbook(
+    path: str,
+    yr: str,
+    surveys: Optional[Sequence[str]] = None,
+    questions: Optional[Sequence[str]] = None,
+    cache_dir: Optional[str] = None,
+    columns: Optional[Sequence[str]] = None,
+    lean: bool = True,
+) -> Tuple[pd.DataFrame, bool]:
+    """
+    Parse one year.  Without `surveys`/`questions` this is the raw parse.  With
+    them the year is cleaned and pruned to the SDOH columns, and when `cache_dir`
+    is set the pruned frame is read from / written to the Parquet cache.
+    `lean` selects lean_transform_workbook() instead of the full parse + clean + select.
+
+    Returns (DataFrame, cache_hit).  Top-level so it can run in a worker process.
+    """
+    if surveys is None and questions is None:
+        return parse_workbook(path, yr), False
+
+    key = cache_key(path, surveys, questions, lean) if cache_dir else None
+    if key:
+        cached = cache_path(cache_dir, yr, key)
+        if os.path.exists(cached):
+            return read_cached_year(cached, columns), True
+
+    if lean:
+        df = lean_transform_workbook(path, yr, surveys or [], questions or [])
+    else:
+        df = parse_workbook(path, yr)
+        df = clean_county_frame(df)
+        df = select_sdoh_columns(df, surveys or [], questions or [])
+    if key:
+        _write_cache(df, cache_dir, yr, key)
+    if columns:
+        df = df[list(columns)]
+    return df, False
+
+
+def extract_years(
+    years: Sequence[str],
+    source_template: str = COUNTY_URL_TEMPLATE,
+    out_template: str = LOCAL_PATH_TEMPLATE,
+    session: Optional[requests.Session] = None,
+    download_workers: int = 4,
+    parse_workers: Optional[int] = None,
+    surveys: Optional[Sequence[str]] = None,
+    questions: Optional[Sequence[str]] = None,
+    cache_dir: Optional[str] = None,
+    reuse_downloads: bool = False,
+    lean: bool = True,
+    verbose: bool = True,
+) -> Tuple[pd.DataFrame, List[Tuple[str, str]]]:
+    """
+    Download and parse the county workbook for each year and concatenate once.
+
+    Downloads run on a thread pool sharing one session.  Each workbook is handed
+    to a process pool for parsing as soon as its download finishes, so parsing
+    overlaps with the remaining downloads.  The parse workers are spawned, not
+    forked, since forking while the download threads hold locks can deadlock.
+
+    When `surveys`/`questions` are given each year is cleaned and pruned in the
+    worker (see process_workbook), and `cache_dir` enables the Parquet cache.
+    `lean` uses the projected read and downcast dtypes for that step.
+    `reuse_downloads` skips the download when the workbook is already on disk.
+
+    Returns (DataFrame, failed_years) where failed_years is [(year, error), ...].
+    Years are concatenated in the order given, whatever order they finish in.
+    """
+    years = [str(y) for y in years]
+    session = session or make_session(pool_size=max(1, download_workers))
+    parse_workers = parse_workers or min(len(years), os.cpu_count() or 1) or 1
+
+    frames: Dict[str, pd.DataFrame] = {}
+    failed_years: List[Tuple[str, str]] = []
+    spawn = multiprocessing.get_context("spawn")
+
+    with ThreadPoolExecutor(max_workers=max(1, download_workers)) as downloads, \
+            ProcessPoolExecutor(max_workers=parse_workers, mp_context=spawn) as parsers:
+        fetches = {
+            downloads.submit(fetch_workbook, yr, source_template, out_template, session,
+                             reuse_downloads=reuse_downloads): yr
+            for yr in years
+        }
+        parses = {}
+        for fut in as_completed(fetches):
+            yr = fetches[fut]
+            try:
+                path = fut.result()
+            except Exception as e:
+                failed_years.append((yr, str(e)))
+                if verbose:
+                    print(f"Failed to download year {yr}: {e}")
+                continue
+            parses[parsers.submit(process_workbook, path, yr, surveys, questions, cache_dir, None, lean)] = yr
+
+        for fut in as_completed(parses):
+            yr = parses[fut]
+            try:
+                frames[yr], hit = fut.result()
+                if verbose:
+                    source = " from cache" if hit else ""
+                    print(f"Loaded year {yr} ({len(frames[yr])} rows){source}.")
+            except Exception as e:
+                failed_years.append((yr, str(e)))
+                if verbose:
+                    print(f"Failed to load year {yr}: {e}")
+
+    ordered = [frames[yr] for yr in years if yr in frames]
+    df = pd.concat(ordered, ignore_index=True) if ordered else pd.DataFrame()
+    if lean and not df.empty and surveys is not None:
+        # per-year categoricals with different categories concatenate as object
+        df = categorize_keys(df)
+    if failed_years and verbose:
+        print("Some years failed to load:", failed_years)
+    return df, failed_years
+
+
+# ----------------------------
+# Transform
+# ----------------------------
+def normalize_colname(name: str) -> str:
+    """
+    1) lower-case
+    2) replace any non-alphanumeric character with underscore
+    3) collapse multiple underscores
+    4) strip leading/trailing underscores
+    5) if starts with digit -> prefix with 'col_'
+    """
+    if name is None:
+        return name
+    s = str(name).lower()
+    # replace non-alphanumeric with underscore
+    s = re.sub(r'[^a-z0-9]', '_', s)
+    # collapse multiple underscores
+    s = re.sub(r'_+', '_', s)
+    s = s.strip('_')
+    # if empty after cleaning
+    if not s:
+        s = 'col'
+    # prefix if starts with digit
+    if re.match(r'^[0-9]', s):
+        s = 'col_' + s
+    return s
+
+
+def clean_county_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert to numeric, forcing non-convertible values to NaN and remove county from names.
+    """
+    # replace the columns rather than set values in place: pandas 3 will not put numbers in a str column
+    measures = df.columns[3:]
+    df[measures] = df[measures].apply(pd.to_numeric, errors="coerce")
+    df["COUNTY"] = df["COUNTY"].str.replace(" County", "")
+    return df
+
+
+def select_sdoh_columns(df: pd.DataFrame, surveys: Sequence[str], questions: Sequence[str]) -> pd.DataFrame:
+    """
+    Keep the key columns, every column from the SDOH surveys and the extra questions.
+    A question missing from a year's workbook becomes an all-NaN column so years
+    can be pruned separately and still concatenate.
+    YEAR is converted to int to remove formatting issues.
+    """
+    keys = df[["STATE", "COUNTY", "YEAR"]]
+    by_survey = df[df.columns[pd.Series(df.columns).str.startswith(tuple(surveys))]]
+    extra = df.reindex(columns=list(questions))
+    out = pd.concat([keys, by_survey, extra], axis=1)
+    out["YEAR"] = pd.to_numeric(out["YEAR"])
+    return out
+
+
+def build_county_sdoh(
+    years: Sequence[str],
+    surveys: Sequence[str],
+    questions: Sequence[str],
+    **extract_kwargs,
+) -> Tuple[pd.DataFrame, List[Tuple[str, str]]]:
+    """
+    Full extract + transform for the county SDOH table.  Each year is cleaned and
+    pruned in a worker process (and cached when `cache_dir` is passed).  Pass
+    lean=False for the previous full-read transform.
+    Returns (DataFrame, failed_years).
+    """
+    return extract_years(years, surveys=surveys, questions=questions, **extract_kwargs)
+
+
+# ----------------------------
+# Lean transform
+# ----------------------------
+def _selected_columns(columns: Sequence[str], surveys: Sequence[str], questions: Sequence[str],
+                      key_columns: Sequence[str] = KEY_SOURCE_COLUMNS) -> List[str]:
+    """Sheet columns to read: key columns, survey-prefixed columns and the extra questions."""
+    prefixes = tuple(surveys)
+    wanted = set(questions)
+    return [c for c in columns
+            if c in key_columns or (prefixes and str(c).startswith(prefixes)) or c in wanted]
+
+
+def coerce_numeric_block(block: pd.DataFrame) -> pd.DataFrame:
+    """
+    Convert every non-numeric column of `block` to float in one pass over the
+    object values, forcing non-convertible values to NaN.
+    """
+    obj_cols = [c for c in block.columns if not pd.api.types.is_numeric_dtype(block[c])]
+    if not obj_cols:
+        return block
+    values = pd.to_numeric(block[obj_cols].to_numpy(dtype=object).ravel(), errors="coerce")
+    converted = pd.DataFrame(
+        np.asarray(values, dtype=np.float64).reshape(len(block), len(obj_cols)),
+        columns=obj_cols,
+        index=block.index,
+    )
+    out = block.copy(deep=False)
+    out[obj_cols] = converted
+    return out
+
+
+def _smallest_int_dtype(lo: float, hi: float) -> str:
+    for name, info in (("Int8", np.iinfo(np.int8)), ("Int16", np.iinfo(np.int16)), ("Int32", np.iinfo(np.int32))):
+        if lo >= info.min and hi <= info.max:
+            return name
+    return "Int64"
+
+
+def downcast_measures(block: pd.DataFrame) -> pd.DataFrame:
+    """
+    Downcast numeric measures where it is lossless:
+      - whole-number columns -> smallest nullable integer (Int8/16/32/64)
+      - columns whose values survive a float32 round trip -> float32
+      - everything else stays float64
+    This only saves memory: the loaders store every measure as a floating-point
+    column (sdoh_load.pg_column_types, duckdb_export.build_duckdb).
+    """
+    if block.empty:
+        return block
+    arr = block.to_numpy(dtype=np.float64)
+    nan = np.isnan(arr)
+    has_value = (~nan).any(axis=0)
+    with np.errstate(invalid="ignore", over="ignore"):
+        f32_ok = ((arr.astype(np.float32).astype(np.float64) == arr) | nan).all(axis=0)
+        int_ok = ((np.floor(arr) == arr) | nan).all(axis=0) & has_value & np.isfinite(np.where(nan, 0, arr)).all(axis=0)
+
+    out = {}
+    for j, col in enumerate(block.columns):
+        values = arr[:, j]
+        if int_ok[j]:
+            dtype = _smallest_int_dtype(np.nanmin(values), np.nanmax(values))
+            # NaN becomes <NA> in the nullable integer dtype
+            out[col] = pd.Series(values, index=block.index).astype(dtype)
+        elif f32_ok[j]:
+            out[col] = values.astype(np.float32)
+        else:
+            out[col] = values
+    return pd.DataFrame(out, index=block.index)
+
+
+def categorize_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """Store STATE and COUNTY as categoricals."""
+    for col in KEY_SOURCE_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    return df
+
+
+def lean_transform_workbook(path: str, yr: str, surveys: Sequence[str], questions: Sequence[str],
+                            sheet_name: str = "Data") -> pd.DataFrame:
+    """
+    Memory-lean equivalent of parse_workbook + clean_county_frame + select_sdoh_columns.
+
+    Only the needed columns are read from the sheet, non-numeric measures are
+    converted in one pass, measures are downcast where lossless and STATE/COUNTY
+    are stored as categoricals.
+    """
+    df = pd.read_excel(path, sheet_name=sheet_name, engine="openpyxl",
+                       usecols=lambda c: bool(_selected_columns([c], surveys, questions)))
+    county = df["COUNTY"].str.replace(" County", "")
+    measures = [c for c in df.columns if c not in KEY_SOURCE_COLUMNS]
+    block = downcast_measures(coerce_numeric_block(df[measures]))
+    keys = pd.DataFrame({
+        "STATE": df["STATE"],
+        "COUNTY": county,
+        "YEAR": pd.array(np.full(len(df), int(yr)), dtype="Int16"),
+    }, index=df.index)
+    del df
+
+    # same column order as select_sdoh_columns: keys, survey columns in sheet order, then questions
+    prefixes = tuple(surveys)
+    by_survey = [c for c in measures if prefixes and str(c).startswith(prefixes)]
+    extra = [q for q in questions if q not in by_survey]
+    out = pd.concat([keys, block.reindex(columns=by_survey + extra)], axis=1)
+    return categorize_keys(out)
+
+
+def _measure_transform(path: str, yr: str, surveys: Sequence[str], questions: Sequence[str], lean: bool) -> Dict[str, float]:
+    """Run one transform path in this (fresh) process and report wall time and memory."""
+    base_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df, _ = process_workbook(path, yr, surveys, questions, cache_dir=None, lean=lean)
+    seconds = time.perf_counter() - t0
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": seconds,
+        "peak_rss_mb": (peak_rss - base_rss) / 1024.0,  # ru_maxrss is KiB on Linux
+        "traced_peak_mb": traced_peak / (1024.0 * 1024.0),
+        "frame_mb": df.memory_usage(deep=True).sum() / (1024.0 * 1024.0),
+        "columns": float(df.shape[1]),
+    }
+
+
+def compare_transform_paths(path: str, yr: str, surveys: Sequence[str], questions: Sequence[str]) -> Dict[str, Dict[str, float]]:
+    """
+    Run the previous full-read transform and the lean transform on one workbook,
+    each in a fresh spawned process so peak RSS is not shared, and print the results.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    results: Dict[str, Dict[str, float]] = {}
+    for name, lean in (("current", False), ("lean", True)):
+        with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as pool:
+            results[name] = pool.submit(_measure_transform, path, yr, list(surveys), list(questions), lean).result()
+    print(f"{'path':<10}{'wall s':>10}{'peak RSS MB':>14}{'traced MB':>12}{'frame MB':>10}")
+    for name, r in results.items():
+        print(f"{name:<10}{r['seconds']:>10.2f}{r['peak_rss_mb']:>14.1f}{r['traced_peak_mb']:>12.1f}{r['frame_mb']:>10.1f}")
+    return results
+
+
+# ----------------------------
+# Streaming reader
+# ----------------------------
+def _chunk_frame(rows: List[list], header: List[str], yr: str, key_columns: Sequence[str],
+                 measure_columns: List[str], normalize: bool) -> pd.DataFrame:
+    """Build one chunk with a fixed column set and dtypes: keys, YEAR, float64 measures."""
+    raw = pd.DataFrame(rows, columns=header)
+    keys = {}
+    for col in key_columns:
+        values = raw[col] if col in raw.columns else pd.Series(None, index=raw.index, dtype=object)
+        if col == "COUNTY":
+            values = values.astype("string").str.replace(" County", "")
+        keys[col] = values
+    keys["YEAR"] = np.full(len(raw), int(yr), dtype=np.int32)
+    present = [c for c in measure_columns if c in raw.columns]
+    block = coerce_numeric_block(raw[present]).astype(np.float64).reindex(columns=measure_columns)
+    out = pd.concat([pd.DataFrame(keys, index=raw.index), block], axis=1)
+    if normalize:
+        out.columns = [normalize_colname(c) for c in out.columns]
+    return out
+
+
+def iter_workbook_chunks(
+    path: str,
+    yr: str,
+    surveys: Sequence[str],
+    questions: Sequence[str],
+    key_columns: Sequence[str] = KEY_SOURCE_COLUMNS,
+    chunk_rows: int = 5000,
+    sheet_name: str = "Data",
+    normalize: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Stream a workbook with openpyxl's read-only iter_rows and yield DataFrame
+    chunks of at most `chunk_rows` rows, so memory stays flat whatever the file size.
+
+    Each chunk holds the key columns, YEAR and the survey/question measures as
+    float64, always with the same columns in the same order, with names passed
+    through normalize_colname().  Chunks can go straight to sdoh_load.copy_load_chunks().
+    """
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb[sheet_name].iter_rows(values_only=True)
+        header = [str(h) if h is not None else "" for h in next(rows, ())]
+        selected = _selected_columns(header, surveys, questions, key_columns)
+        positions = [header.index(c) for c in selected]
+        prefixes = tuple(surveys)
+        by_survey = [c for c in selected if c not in key_columns and prefixes and c.startswith(prefixes)]
+        measure_columns = by_survey + [q for q in questions if q not in by_survey]
+
+        buf: List[list] = []
+        for row in rows:
+            buf.append([row[i] if i < len(row) else None for i in positions])
+            if len(buf) >= chunk_rows:
+                yield _chunk_frame(buf, selected, yr, key_columns, measure_columns, normalize)
+                buf = []
+        if buf:
+            yield _chunk_frame(buf, selected, yr, key_columns, measure_columns, normalize)
+    finally:
+        wb.close()
+
+
+def iter_years_chunks(
+    years: Sequence[str],
+    surveys: Sequence[str],
+    questions: Sequence[str],
+    source_template: str = TRACT_URL_TEMPLATE,
+    out_template: str = "./ahrq_tract{yr}.xlsx",
+    key_columns: Sequence[str] = TRACT_KEY_COLUMNS,
+    chunk_rows: int = 5000,
+    session: Optional[requests.Session] = None,
+    reuse_downloads: bool = True,
+    verbose: bool = True,
+) -> Iterator[pd.DataFrame]:
+    """
+    Fetch each year's workbook in turn and yield its streamed chunks.
+    Only one chunk is held in memory at a time.
+    """
+    session = session or make_session()
+    for yr in [str(y) for y in years]:
+        path = fetch_workbook(yr, source_template, out_template, session, reuse_downloads=reuse_downloads)
+        n = 0
+        for chunk in iter_workbook_chunks(path, yr, surveys, questions, key_columns, chunk_rows):
+            n += len(chunk)
+            yield chunk
+        if verbose:
+            print(f"Streamed year {yr} ({n} rows).")
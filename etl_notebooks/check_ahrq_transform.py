@@ -0,0 +1,127 @@
+"""
+Check that the three county transform paths in ahrq_extract produce the same frame.
+
+Runs build_county_sdoh() with lean=False (the original parse + clean + select),
+build_county_sdoh() with lean=True (projected read, downcast dtypes) and
+iter_workbook_chunks() (streamed, in chunks of a few rows) over small fixture
+workbooks laid out like the AHRQ county files, and compares the results after
+normalizing dtypes (keys as text, YEAR as int, measures as float64).  The fixtures
+cover a missing question in one year, blank cells, suppressed values ("*") and
+a survey that is not selected.
+
+Usage:
+    python check_ahrq_transform.py                     # compare, exit 1 on a mismatch
+    python check_ahrq_transform.py --rebuild-fixtures  # rewrite fixtures/*.xlsx first
+"""
+
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+import pandas as pd
+
+import ahrq_extract
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+FIXTURE_TEMPLATE = os.path.join(FIXTURE_DIR, "SDOH_{yr}_COUNTY_fixture.xlsx")
+FIXTURE_YEARS = ["2019", "2020"]
+SURVEYS = ["ACS", "SAIPE", "CEN"]
+QUESTIONS = ["CHR_PCT_FOOD", "CHR_SEGREG_BLACK"]
+
+
+def write_fixtures(template: str = FIXTURE_TEMPLATE) -> List[str]:
+    """Write one small county workbook per fixture year; CHR_SEGREG_BLACK only exists in 2020."""
+    counties = [
+        ("01001", "01", "Alabama", "Autauga County"),
+        ("01003", "01", "Alabama", "Baldwin County"),
+        ("39049", "39", "Ohio", "Franklin County"),
+        ("39061", "39", "Ohio", "Hamilton County"),
+        ("19153", "19", "Iowa", "Polk County"),
+    ]
+    paths = []
+    for k, yr in enumerate(FIXTURE_YEARS):
+        rows = []
+        for i, (fips, state_fips, state, county) in enumerate(counties):
+            row = {
+                "YEAR": int(yr), "COUNTYFIPS": fips, "STATEFIPS": state_fips, "STATE": state,
+                "COUNTY": county, "REGION": "South" if state == "Alabama" else "Midwest", "TERRITORY": 0,
+                "ACS_TOT_POP_WT": 50000 + 137 * i + 11 * k,
+                "ACS_PCT_UNINSURED": round(6.5 + 1.37 * i + 0.21 * k, 2),
+                "ACS_MEDIAN_HH_INC": "*" if i == 3 else 52000 + 1500 * i,  # suppressed value
+                "ACS_GINI_INDEX": None if i == 1 else 0.4312 + 0.0107 * i,  # blank cell
+                "SAIPE_PCT_POV": 12.0 + i / 3.0,  # not exact in float32
+                "CEN_AIAN_NH_IND": int(i == 4),
+                "HIFLD_DIST_UC": 3.5 * (i + 1),  # survey not selected
+                "CHR_PCT_FOOD": 0.1 + 0.01 * i,
+            }
+            if yr != "2019":
+                row["CHR_SEGREG_BLACK"] = 40 + 2 * i
+            rows.append(row)
+        path = template.format(yr=yr)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        pd.DataFrame(rows).to_excel(path, sheet_name="Data", index=False, engine="openpyxl")
+        paths.append(path)
+    return paths
+
+
+def comparable(df: pd.DataFrame) -> pd.DataFrame:
+    """df with STATE/COUNTY as str, YEAR as int64 and every measure as float64."""
+    out = {}
+    for j, col in enumerate(df.columns):
+        values = df.iloc[:, j]
+        if col in ahrq_extract.KEY_SOURCE_COLUMNS:
+            out[j] = values.astype(object).astype(str)
+        elif col == "YEAR":
+            out[j] = values.astype("int64")
+        else:
+            out[j] = values.astype("float64")
+    frame = pd.DataFrame(out)
+    frame.columns = list(df.columns)
+    return frame.reset_index(drop=True)
+
+
+def chunked_frame(template: str, chunk_rows: int = 2) -> pd.DataFrame:
+    """The streamed path over every fixture year, concatenated."""
+    chunks = []
+    for yr in FIXTURE_YEARS:
+        chunks += list(ahrq_extract.iter_workbook_chunks(
+            template.format(yr=yr), yr, SURVEYS, QUESTIONS, chunk_rows=chunk_rows, normalize=False))
+    return pd.concat(chunks, ignore_index=True)
+
+
+def check(template: str = FIXTURE_TEMPLATE) -> bool:
+    """Compare the lean and chunked paths with the original transform; print and return the outcome."""
+    frames = {}
+    for name, lean in (("original", False), ("lean", True)):
+        df, failed = ahrq_extract.build_county_sdoh(
+            FIXTURE_YEARS, SURVEYS, QUESTIONS, source_template=template, lean=lean, verbose=False)
+        if failed:
+            print(f"{name}: failed years {failed}")
+            return False
+        frames[name] = df
+    frames["chunked"] = chunked_frame(template)
+
+    expected = comparable(frames["original"])
+    ok = True
+    for name in ("lean", "chunked"):
+        try:
+            pd.testing.assert_frame_equal(comparable(frames[name]), expected)
+            print(f"{name}: same as original ({expected.shape[0]} rows, {expected.shape[1]} columns)")
+        except AssertionError as e:
+            print(f"{name}: differs from original\n{e}")
+            ok = False
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check the lean and chunked AHRQ transforms against the original.")
+    parser.add_argument("--rebuild-fixtures", action="store_true", help="rewrite the fixture workbooks first")
+    args = parser.parse_args(argv)
+    if args.rebuild_fixtures or not all(os.path.exists(FIXTURE_TEMPLATE.format(yr=yr)) for yr in FIXTURE_YEARS):
+        write_fixtures()
+    return 0 if check() else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,294 @@
+"""
+Export the SDOH tables to Parquet (partitioned by year) and a DuckDB database.
+
+The assistant can run against either engine: set DB_URI to the PostgreSQL URI or to
+duckdb:////workspace/data/sdoh.duckdb.  The DuckDB file holds the same tables the
+PostgreSQL load builds (sdoh_surveys, sdoh_measures_long, the summary view and the
+rollups) and DuckDB macros with the same names and arguments as the PostgreSQL stat_*
+functions, so the SQL the agent writes runs unchanged on either engine.
+"""
+
+import os
+import shutil
+import time
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+import sdoh_load
+
+DUCKDB_PATH = "/workspace/data/sdoh.duckdb"
+PARQUET_DIR = "/workspace/data/parquet"
+
+_DUCKDB_INTEGER_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                         "UINTEGER", "UBIGINT")
+_DUCKDB_NUMERIC_TYPES = ("TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT", "USMALLINT",
+                         "UINTEGER", "UBIGINT", "FLOAT", "REAL", "DOUBLE")
+
+_RANK_CORRELATED_BODY = (
+    "SELECT o.measure, corr(o.value, t.value) AS correlation, COUNT(*) AS n\n"
+    f"    FROM {sdoh_load.LONG_TABLE_NAME} t\n"
+    f"    JOIN {sdoh_load.LONG_TABLE_NAME} o ON o.year = t.year AND o.state = t.state AND o.county = t.county "
+    "AND o.measure <> t.measure\n"
+    "    WHERE t.measure = target_measure AND ({year} IS NULL OR t.year = {year})\n"
+    "    GROUP BY o.measure\n"
+    "    HAVING COUNT(*) >= 3 AND corr(o.value, t.value) IS NOT NULL\n"
+    "    ORDER BY abs(corr(o.value, t.value)) DESC\n"
+    "    LIMIT {top_n}"
+)
+
+# Macros mirroring db_build/init_db/pearson.sql and sdoh_load.build_long_table().
+# DuckDB macro defaults must be passed by name, so the optional arguments of
+# stat_rank_correlated_measures are overloads to keep positional calls working.
+# Each overload body is parenthesized: otherwise "LIMIT 20,\n (...)" parses as LIMIT offset, count.
+# stat_pearson_correlation_with_p needs pearson_p_value(r, n), a Python UDF the
+# assistant registers on each connection (agents/duckdb_functions.py).
+STAT_MACROS: Sequence[str] = (
+    "CREATE OR REPLACE MACRO stat_pearson_correlation(x, y) AS\n"
+    "CASE WHEN len(x) <> len(y) OR len(x) < 2 THEN NULL ELSE\n"
+    "    (len(x) * list_dot_product(x::DOUBLE[], y::DOUBLE[]) - list_sum(x::DOUBLE[]) * list_sum(y::DOUBLE[]))\n"
+    "    / sqrt((len(x) * list_dot_product(x::DOUBLE[], x::DOUBLE[]) - list_sum(x::DOUBLE[]) ^ 2)\n"
+    "         * (len(y) * list_dot_product(y::DOUBLE[], y::DOUBLE[]) - list_sum(y::DOUBLE[]) ^ 2))\n"
+    "END",
+    "CREATE OR REPLACE MACRO stat_pearson_correlation_with_p(x, y) AS TABLE\n"
+    "SELECT r AS correlation, pearson_p_value(r, len(x)) AS p_value\n"
+    "FROM (SELECT stat_pearson_correlation(x, y) AS r)",
+    "CREATE OR REPLACE MACRO stat_rank_correlated_measures\n"
+    "    (target_measure) AS TABLE (" + _RANK_CORRELATED_BODY.format(year="NULL", top_n="20") + "),\n"
+    "    (target_measure, target_year) AS TABLE (" + _RANK_CORRELATED_BODY.format(year="target_year", top_n="20") + "),\n"
+    "    (target_measure, target_year, top_n) AS TABLE ("
+    + _RANK_CORRELATED_BODY.format(year="target_year", top_n="top_n") + ")",
+)
+
+STAT_MACRO_COMMENTS: Dict[str, str] = {
+    "MACRO stat_pearson_correlation": (
+        "Calculates Pearson correlation coefficient between two float arrays. Returns NULL if arrays are different "
+        "lengths or have fewer than 2 elements. Returns correlation value between -1 (perfect negative) and 1 "
+        "(perfect positive)."
+    ),
+    "MACRO TABLE stat_pearson_correlation_with_p": (
+        "Calculates Pearson correlation coefficient and p-value between two float arrays. Returns a table with "
+        "correlation and p_value columns. P-value tests the null hypothesis that the correlation is zero."
+    ),
+    "MACRO TABLE stat_rank_correlated_measures": (
+        "Ranks every measure (column of sdoh_surveys) by absolute Pearson correlation with target_measure across "
+        "counties, optionally for one year. Returns measure, correlation and number of county-years. "
+        "Example: SELECT measure, correlation FROM stat_rank_correlated_measures('acs_pct_uninsured', 2019, 10)"
+    ),
+}
+
+
+def _require_duckdb():
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("duckdb is required for the DuckDB export: pip install duckdb duckdb-engine") from e
+    return duckdb
+
+
+def export_parquet(
+    df: pd.DataFrame,
+    out_dir: str = PARQUET_DIR,
+    table_name: str = sdoh_load.TABLE_NAME,
+    year_col: str = "year",
+    verbose: bool = True,
+) -> str:
+    """
+    Write df as Parquet partitioned by year (out_dir/<table>/year=2019/...).
+    The new files are written next to the old ones and swapped in when complete.
+    Returns the table directory.
+    """
+    target = os.path.join(out_dir, table_name)
+    staging = target + ".tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(out_dir, exist_ok=True)
+
+    t0 = time.perf_counter()
+    df.to_parquet(staging, engine="pyarrow", partition_cols=[year_col], index=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(staging, target)
+
+    if verbose:
+        years = sorted(df[year_col].dropna().unique().tolist())
+        print(f"Wrote {len(df)} rows to {target} partitioned by {year_col} {years} "
+              f"in {time.perf_counter() - t0:.2f}s.")
+    return target
+
+
+def _measure_columns(con, table_name: str, key_columns: Sequence[str]) -> List[str]:
+    rows = con.execute(
+        "SELECT column_name, data_type FROM information_schema.columns WHERE table_name = ? ORDER BY ordinal_position",
+        [table_name],
+    ).fetchall()
+    return [name for name, dtype in rows
+            if name not in key_columns and (dtype.upper() in _DUCKDB_NUMERIC_TYPES or dtype.upper().startswith("DECIMAL"))]
+
+
+def build_duckdb(
+    parquet_table_dir: str,
+    db_path: str = DUCKDB_PATH,
+    table_name: str = sdoh_load.TABLE_NAME,
+    columns: Optional[Sequence[str]] = None,
+    year_col: str = "year",
+    weight_measure: str = sdoh_load.WEIGHT_MEASURE,
+    sample_fraction: float = 0.1,
+    sample_min_per_stratum: int = 5,
+    sample_seed: str = "sdoh",
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Build the DuckDB database from the partitioned Parquet written by export_parquet().
+
+    Creates sdoh_surveys (sorted by year, state, county so DuckDB's zone maps prune
+    year/state filters), sdoh_measures_long, the sdoh_measure_year_summary view, the
+    state/nation rollups, the stratified sample (see sdoh_load.build_sample) and the
+    stat_* macros.  The database is built in a temporary
+    file and moved over db_path, so a running assistant (read-only) keeps the old file
+    until it reconnects.
+
+    columns: column order of the wide table (hive partitioning moves the year column
+    last); defaults to the Parquet order with year moved back after county.
+    """
+    duckdb = _require_duckdb()
+    q = sdoh_load._quote
+    long_table = sdoh_load.LONG_TABLE_NAME
+    staging = db_path + ".tmp"
+    if os.path.exists(staging):
+        os.remove(staging)
+
+    t0 = time.perf_counter()
+    con = duckdb.connect(staging)
+    try:
+        source = f"read_parquet({sdoh_load._quote_literal(os.path.join(parquet_table_dir, '**', '*.parquet'))}, hive_partitioning = true)"
+        found = {r[0]: r[1] for r in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()}
+        if columns is None:
+            columns = [c for c in found if c != year_col]
+            columns.insert(columns.index("county") + 1 if "county" in columns else 0, year_col)
+
+        def _select(c: str) -> str:
+            if c == year_col:
+                return f"CAST({q(c)} AS INTEGER) AS {q(c)}"
+            if c not in sdoh_load.KEY_COLUMNS and found.get(c, "").upper() in _DUCKDB_INTEGER_TYPES:
+                # whole-number measures downcast in memory are stored as DOUBLE, as in PostgreSQL
+                return f"CAST({q(c)} AS DOUBLE) AS {q(c)}"
+            return q(c)
+
+        select_list = ", ".join(_select(c) for c in columns)
+        con.execute(f"CREATE TABLE {q(table_name)} AS SELECT {select_list} FROM {source} ORDER BY {q(year_col)}, state, county")
+        con.execute(f"COMMENT ON TABLE {q(table_name)} IS {sdoh_load._quote_literal(sdoh_load.TABLE_COMMENT)}")
+
+        measures = _measure_columns(con, table_name, sdoh_load.KEY_COLUMNS)
+        casts = ", ".join(f"CAST({q(m)} AS DOUBLE) AS {q(m)}" for m in measures)
+        con.execute(
+            f"CREATE TABLE {q(long_table)} AS\n"
+            "SELECT state::VARCHAR AS state, county::VARCHAR AS county, year, measure, value FROM (\n"
+            f"    UNPIVOT (SELECT state, county, year, {casts} FROM {q(table_name)}\n"
+            "             WHERE state IS NOT NULL AND county IS NOT NULL AND year IS NOT NULL)\n"
+            f"    ON {', '.join(q(m) for m in measures)} INTO NAME measure VALUE value)\n"
+            "ORDER BY measure, year, state, county"
+        )
+        con.execute(
+            "CREATE VIEW sdoh_measure_year_summary AS\n"
+            "SELECT measure, year, COUNT(*) AS n_counties, AVG(value) AS mean_value, STDDEV_SAMP(value) AS stddev_value, "
+            f"MIN(value) AS min_value, MAX(value) AS max_value FROM {q(long_table)} GROUP BY measure, year"
+        )
+
+        con.execute(
+            f"CREATE TABLE {q(sdoh_load.STATE_ROLLUP_NAME)} AS\n"
+            "SELECT g.state, g.year, m.measure,\n"
+            "       COUNT(l.value) AS n_counties,\n"
+            "       SUM(l.value) AS sum_value,\n"
+            "       AVG(l.value) AS mean_value,\n"
+            "       SUM(w.value) FILTER (WHERE l.value IS NOT NULL) AS weight_total,\n"
+            "       SUM(l.value * w.value) / NULLIF(SUM(w.value) FILTER (WHERE l.value IS NOT NULL), 0) AS weighted_mean_value\n"
+            f"FROM (SELECT DISTINCT state::VARCHAR AS state, year FROM {q(table_name)} WHERE state IS NOT NULL AND year IS NOT NULL) g\n"
+            f"CROSS JOIN (SELECT DISTINCT measure FROM {q(long_table)}) m\n"
+            f"LEFT JOIN {q(long_table)} l ON l.measure = m.measure AND l.year = g.year AND l.state = g.state\n"
+            f"LEFT JOIN {q(long_table)} w ON w.measure = ? AND w.year = l.year AND w.state = l.state AND w.county = l.county\n"
+            "GROUP BY g.state, g.year, m.measure\n"
+            "ORDER BY m.measure, g.year, g.state",
+            [weight_measure],
+        )
+        con.execute(
+            f"CREATE TABLE {q(sdoh_load.NATION_ROLLUP_NAME)} AS\n"
+            "SELECT year, measure,\n"
+            "       SUM(n_counties) AS n_counties,\n"
+            "       SUM(sum_value) AS sum_value,\n"
+            "       SUM(sum_value) / NULLIF(SUM(n_counties), 0) AS mean_value,\n"
+            "       SUM(weight_total) AS weight_total,\n"
+            "       SUM(weighted_mean_value * weight_total) / NULLIF(SUM(weight_total), 0) AS weighted_mean_value\n"
+            f"FROM {q(sdoh_load.STATE_ROLLUP_NAME)} GROUP BY year, measure ORDER BY measure, year"
+        )
+
+        con.execute(
+            f"CREATE TABLE {q(sdoh_load.SAMPLE_TABLE_NAME)} AS\n"
+            "WITH strata AS (\n"
+            "    SELECT state, year, COUNT(*) AS n_h,\n"
+            f"           LEAST(COUNT(*), GREATEST(?, CEIL(COUNT(*) * ?)::BIGINT)) AS k_h\n"
+            f"    FROM {q(table_name)} WHERE state IS NOT NULL AND year IS NOT NULL GROUP BY state, year\n"
+            "), ranked AS (\n"
+            "    SELECT t.*, row_number() OVER (PARTITION BY t.state, t.year ORDER BY md5(coalesce(t.county::VARCHAR, '') || ?)) AS rn\n"
+            f"    FROM {q(table_name)} t\n"
+            ")\n"
+            f"SELECT {', '.join('s.' + q(c) for c in columns)}, st.n_h::INTEGER AS stratum_size, st.k_h::INTEGER AS stratum_sample_size\n"
+            "FROM ranked s JOIN strata st ON st.state = s.state AND st.year = s.year\n"
+            "WHERE s.rn <= st.k_h",
+            [int(sample_min_per_stratum), float(sample_fraction), sample_seed],
+        )
+
+        for ddl in STAT_MACROS:
+            con.execute(ddl)
+        for target, comment in STAT_MACRO_COMMENTS.items():
+            con.execute(f"COMMENT ON {target} IS {sdoh_load._quote_literal(comment)}")
+
+        counts = {
+            name: con.execute(f"SELECT COUNT(*) FROM {q(name)}").fetchone()[0]
+            for name in (table_name, long_table, sdoh_load.STATE_ROLLUP_NAME, sdoh_load.NATION_ROLLUP_NAME,
+                         sdoh_load.SAMPLE_TABLE_NAME)
+        }
+        con.execute("CHECKPOINT")
+    finally:
+        con.close()
+
+    os.replace(staging, db_path)
+    seconds = time.perf_counter() - t0
+    if verbose:
+        print(f"Built {db_path} {counts} in {seconds:.2f}s.")
+    return {"seconds": seconds, **counts}
+
+
+def duckdb_engine(db_path: str = DUCKDB_PATH, read_only: bool = True):
+    """SQLAlchemy engine for the DuckDB file (requires duckdb-engine)."""
+    from sqlalchemy import create_engine
+
+    return create_engine(f"duckdb:///{db_path}", connect_args={"read_only": read_only})
+
+
+def engine_benchmark_queries(pg_engine) -> Dict[str, str]:
+    """Representative agent queries that run unchanged on both engines."""
+    queries = dict(sdoh_load.BENCHMARK_QUERIES)
+    layouts = sdoh_load.layout_benchmark_queries(pg_engine)
+    queries.update({f"wide_{k}": v for k, v in layouts["wide"].items()})
+    queries.update({f"long_{k}": v for k, v in layouts["long"].items()})
+    queries["rollup_state_year"] = (
+        f"SELECT state, year, mean_value, weighted_mean_value FROM {sdoh_load.STATE_ROLLUP_NAME} "
+        "WHERE measure = 'saipe_pct_pov' ORDER BY state, year"
+    )
+    return queries
+
+
+def compare_engines(pg_engine, duck_engine, queries: Optional[Dict[str, str]] = None, repeat: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Time the same queries on PostgreSQL and DuckDB (median ms) and print them side by side.
+    A query that fails on one engine is reported and skipped.
+    """
+    queries = queries or engine_benchmark_queries(pg_engine)
+    results: Dict[str, Dict[str, float]] = {"postgres": {}, "duckdb": {}}
+    for name, sql in queries.items():
+        for label, engine in (("postgres", pg_engine), ("duckdb", duck_engine)):
+            try:
+                results[label].update(sdoh_load.benchmark_queries(engine, {name: sql}, repeat=repeat))
+            except Exception as e:
+                print(f"{name} failed on {label}: {str(e).splitlines()[0]}")
+    sdoh_load.print_benchmark(results["postgres"], results["duckdb"], labels=("postgres", "duckdb"))
+    return results
@@ -0,0 +1,933 @@
+##################################
+#
+#       Load helpers for the SDOH survey table.
+#       Used by load_database.ipynb after the DataFrame is built.
+#
+##################################
+
+import hashlib
+import io
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+TABLE_NAME = "sdoh_surveys"
+
+# Key columns of the wide table.  One row per county per survey year.
+KEY_COLUMNS = ("state", "county", "year")
+
+# Secondary indexes for the filters the agent generates most often.  The primary
+# key already covers filters leading with state (and state + county).
+INDEX_COLUMNS = (("year",), ("county",), ("year", "state"))
+
+# Representative agent queries used to compare plans before and after provisioning.
+BENCHMARK_QUERIES: Dict[str, str] = {
+    "county_top_n": (
+        "SELECT county, acs_gini_index, acs_pct_unemploy FROM sdoh_surveys "
+        "WHERE state = 'Ohio' AND year = 2020 ORDER BY acs_gini_index DESC LIMIT 5"
+    ),
+    "state_trend": (
+        "SELECT year, AVG(acs_pct_uninsured) AS avg_uninsured FROM sdoh_surveys "
+        "WHERE state = 'Texas' GROUP BY year ORDER BY year"
+    ),
+    "single_county": (
+        "SELECT year, saipe_pct_pov, acs_median_hh_inc FROM sdoh_surveys "
+        "WHERE state = 'Ohio' AND county = 'Franklin' ORDER BY year"
+    ),
+    "year_by_state": (
+        "SELECT state, AVG(saipe_pct_pov) AS avg_poverty FROM sdoh_surveys "
+        "WHERE year = 2019 GROUP BY state ORDER BY avg_poverty DESC"
+    ),
+}
+
+
+# Narrow companion of the wide table: one row per (state, county, year, measure).
+LONG_TABLE_NAME = "sdoh_measures_long"
+
+# Materialized rollups of the long table, refreshed by the load step.
+STATE_ROLLUP_NAME = "sdoh_rollup_state_year"
+NATION_ROLLUP_NAME = "sdoh_rollup_nation_year"
+WEIGHT_MEASURE = "acs_tot_pop_wt"
+
+# Stratified sample of the wide table for the assistant's approximate query mode.
+SAMPLE_TABLE_NAME = "sdoh_surveys_sample"
+
+# Per-year checksums of what was loaded, used by incremental loads.
+LOAD_STATE_TABLE = "etl_load_years"
+
+TABLE_COMMENT = "Social Determinants of Health (SDOH) metrics from the Agency for Healthcare Research and Quality (AHRQ) surveys"
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def pg_column_types(df: pd.DataFrame, key_columns: Sequence[str] = KEY_COLUMNS) -> Dict[str, str]:
+    """
+    Map DataFrame dtypes to explicit PostgreSQL column types for the COPY loader.
+    Survey measures are floats, key columns are text/integer.  Integer measures (the
+    lean transform downcasts whole-number columns in memory) load as DOUBLE PRECISION,
+    so agent arithmetic on them is not integer arithmetic and a later year with
+    fractional values loads into the same column type.
+    """
+    types: Dict[str, str] = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            types[col] = "BOOLEAN"
+        elif pd.api.types.is_integer_dtype(dtype) and col not in key_columns:
+            types[col] = "DOUBLE PRECISION"
+        elif pd.api.types.is_integer_dtype(dtype):
+            size = getattr(dtype, "itemsize", 8)
+            types[col] = "SMALLINT" if size <= 2 else "INTEGER" if size == 4 else "BIGINT"
+        elif pd.api.types.is_float_dtype(dtype):
+            types[col] = "REAL" if str(dtype).lower() == "float32" else "DOUBLE PRECISION"
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            types[col] = "TIMESTAMP"
+        else:
+            types[col] = "TEXT"
+    return types
+
+
+def _iter_csv_chunks(df: pd.DataFrame, chunk_rows: int):
+    """Yield (row_count, StringIO) CSV chunks without header, NULLs as empty fields."""
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        buf = io.StringIO()
+        chunk.to_csv(buf, header=False, index=False, na_rep="")
+        buf.seek(0)
+        yield len(chunk), buf
+
+
+def _copy_frame(cur, table_name: str, df: pd.DataFrame, chunk_rows: int) -> int:
+    """COPY `df` into an existing table through `cur`; returns the row count."""
+    cols_list = ", ".join(_quote(c) for c in df.columns)
+    copy_sql = f"COPY {_quote(table_name)} ({cols_list}) FROM STDIN WITH (FORMAT csv, NULL '')"
+    rows = 0
+    for n, buf in _iter_csv_chunks(df, max(1, int(chunk_rows))):
+        cur.copy_expert(copy_sql, buf)
+        rows += n
+    return rows
+
+
+def copy_load(
+    engine: Engine,
+    df: pd.DataFrame,
+    table_name: str = TABLE_NAME,
+    column_types: Optional[Dict[str, str]] = None,
+    chunk_rows: int = 2000,
+    comment: Optional[str] = TABLE_COMMENT,
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Load `df` into `table_name` by streaming CSV chunks through COPY FROM STDIN.
+
+    Rows go into a staging table with explicit column types.  The old table is
+    dropped and the staging table renamed in the same transaction, so readers see
+    either the previous contents or the new contents, never an empty table.
+
+    Returns {"rows": int, "seconds": float, "rows_per_sec": float}.
+    """
+    types = dict(pg_column_types(df))
+    if column_types:
+        types.update(column_types)
+
+    staging = f"{table_name}__staging"
+    cols_ddl = ", ".join(f"{_quote(c)} {types[c]}" for c in df.columns)
+
+    t0 = time.perf_counter()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute(f"DROP TABLE IF EXISTS {_quote(staging)}")
+        cur.execute(f"CREATE TABLE {_quote(staging)} ({cols_ddl})")
+        rows = _copy_frame(cur, staging, df, chunk_rows)
+
+        # swap in one transaction
+        cur.execute(f"DROP TABLE IF EXISTS {_quote(table_name)} CASCADE")
+        cur.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(table_name)}")
+        if comment:
+            cur.execute(f"COMMENT ON TABLE {_quote(table_name)} IS %s", (comment,))
+        raw.commit()
+        cur.close()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    seconds = time.perf_counter() - t0
+    stats = {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else float("inf")}
+    if verbose:
+        print(f'COPY loaded {rows} rows into "{table_name}" in {seconds:.2f}s ({stats["rows_per_sec"]:.0f} rows/sec).')
+    return stats
+
+
+def copy_load_chunks(
+    engine: Engine,
+    chunks: Iterable[pd.DataFrame],
+    table_name: str,
+    column_types: Optional[Dict[str, str]] = None,
+    comment: Optional[str] = None,
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Streaming variant of copy_load for bounded-memory extraction.
+
+    The staging table is created from the first chunk's columns and dtypes;
+    later chunks are aligned to those columns (extra columns are dropped) and
+    COPYed as they arrive, then the table is swapped in as in copy_load.
+    """
+    staging = f"{table_name}__staging"
+    t0 = time.perf_counter()
+    rows = 0
+    columns: Optional[List[str]] = None
+    dropped: set = set()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        for chunk in chunks:
+            if columns is None:
+                columns = [str(c) for c in chunk.columns]
+                types = dict(pg_column_types(chunk))
+                if column_types:
+                    types.update(column_types)
+                cur.execute(f"DROP TABLE IF EXISTS {_quote(staging)}")
+                cur.execute(f"CREATE TABLE {_quote(staging)} ({', '.join(f'{_quote(c)} {types[c]}' for c in columns)})")
+            else:
+                dropped.update(c for c in chunk.columns if c not in columns)
+                chunk = chunk.reindex(columns=columns)
+            rows += _copy_frame(cur, staging, chunk, len(chunk) or 1)
+
+        if columns is None:
+            raise ValueError("No chunks to load.")
+        cur.execute(f"DROP TABLE IF EXISTS {_quote(table_name)} CASCADE")
+        cur.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(table_name)}")
+        if comment:
+            cur.execute(f"COMMENT ON TABLE {_quote(table_name)} IS %s", (comment,))
+        raw.commit()
+        cur.close()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    seconds = time.perf_counter() - t0
+    stats = {"rows": rows, "seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else float("inf")}
+    if verbose:
+        if dropped:
+            print(f"Dropped columns not present in the first chunk: {sorted(dropped)[:20]}")
+        print(f'COPY streamed {rows} rows into "{table_name}" in {seconds:.2f}s ({stats["rows_per_sec"]:.0f} rows/sec).')
+    return stats
+
+
+def to_sql_load(engine: Engine, df: pd.DataFrame, table_name: str = TABLE_NAME) -> Dict[str, float]:
+    """
+    The previous load path (DataFrame.to_sql with row-wise INSERTs), timed for comparison.
+    """
+    t0 = time.perf_counter()
+    df.to_sql(table_name, engine, if_exists="replace", index=False)
+    seconds = time.perf_counter() - t0
+    return {"rows": len(df), "seconds": seconds, "rows_per_sec": len(df) / seconds if seconds > 0 else float("inf")}
+
+
+def compare_load_paths(engine: Engine, df: pd.DataFrame, scratch_table: str = f"{TABLE_NAME}__bench") -> Dict[str, Dict[str, float]]:
+    """
+    Load `df` into a scratch table with both paths and print rows/sec for each.
+    The scratch table is dropped afterwards.
+    """
+    results = {
+        "to_sql": to_sql_load(engine, df, scratch_table),
+        "copy": copy_load(engine, df, scratch_table, comment=None, verbose=False),
+    }
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {_quote(scratch_table)}"))
+    for path, r in results.items():
+        print(f"{path:<8}{r['rows']:>8} rows {r['seconds']:>8.2f}s {r['rows_per_sec']:>10.0f} rows/sec")
+    return results
+
+
+def provision_indexes(
+    engine: Engine,
+    table_name: str = TABLE_NAME,
+    key_columns: Sequence[str] = KEY_COLUMNS,
+    index_columns: Sequence[Sequence[str]] = INDEX_COLUMNS,
+    verbose: bool = True,
+) -> Dict[str, object]:
+    """
+    Add the composite key, filter indexes and extended statistics to a freshly
+    loaded table, then ANALYZE it so the planner sees the new statistics.
+
+    The primary key is only added when the key columns are non-null and unique.
+    Otherwise a plain composite index is created instead and the problem rows
+    are reported, so a bad source year does not fail the whole load.
+
+    Returns a summary dict: {"primary_key": bool, "duplicates": int, "nulls": int, "indexes": [...]}.
+    """
+    qt = _quote(table_name)
+    key_list = ", ".join(_quote(c) for c in key_columns)
+    null_pred = " OR ".join(f"{_quote(c)} IS NULL" for c in key_columns)
+
+    summary: Dict[str, object] = {"primary_key": False, "duplicates": 0, "nulls": 0, "indexes": []}
+
+    with engine.begin() as conn:
+        has_pk = conn.execute(text(
+            "SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(:t) AND contype = 'p'"
+        ), {"t": qt}).first() is not None
+
+        if has_pk:
+            # incremental loads keep the key; new partitions pick it up on ATTACH
+            summary["primary_key"] = True
+        else:
+            nulls = conn.execute(text(f"SELECT COUNT(*) FROM {qt} WHERE {null_pred}")).scalar() or 0
+            duplicates = conn.execute(text(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM {qt} GROUP BY {key_list} HAVING COUNT(*) > 1) d"
+            )).scalar() or 0
+            summary["nulls"] = int(nulls)
+            summary["duplicates"] = int(duplicates)
+
+            if nulls == 0 and duplicates == 0:
+                conn.execute(text(f"ALTER TABLE {qt} ADD CONSTRAINT {_quote(table_name + '_pkey')} PRIMARY KEY ({key_list})"))
+                summary["primary_key"] = True
+            else:
+                if verbose:
+                    print(f'Warning: "{table_name}" has {nulls} rows with null keys and {duplicates} duplicate keys; '
+                          f"creating a non-unique index on ({', '.join(key_columns)}) instead of a primary key.")
+                ix = f"ix_{table_name}_{'_'.join(key_columns)}"
+                conn.execute(text(f"CREATE INDEX IF NOT EXISTS {_quote(ix)} ON {qt} ({key_list})"))
+                summary["indexes"].append(ix)
+
+        for cols in index_columns:
+            ix = f"ix_{table_name}_{'_'.join(cols)}"
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {_quote(ix)} ON {qt} ({', '.join(_quote(c) for c in cols)})"
+            ))
+            summary["indexes"].append(ix)
+
+        # county names repeat across states and are correlated with state, so tell the
+        # planner about the dependency instead of letting it multiply selectivities.
+        stats_name = f"st_{table_name}_geo"
+        conn.execute(text(f"DROP STATISTICS IF EXISTS {_quote(stats_name)}"))
+        conn.execute(text(
+            f"CREATE STATISTICS {_quote(stats_name)} (ndistinct, dependencies) ON {key_list} FROM {qt}"
+        ))
+
+    # ANALYZE after the DDL commits so the extended statistics are populated too.
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {qt}"))
+
+    if verbose:
+        pk = "primary key" if summary["primary_key"] else "no primary key"
+        print(f'Provisioned "{table_name}": {pk}, indexes {summary["indexes"]}, statistics analyzed.')
+    return summary
+
+
+def explain_queries(engine: Engine, queries: Optional[Dict[str, str]] = None, analyze: bool = True) -> Dict[str, str]:
+    """
+    Return the EXPLAIN (ANALYZE) plan text for each named query.
+    """
+    queries = queries or BENCHMARK_QUERIES
+    prefix = "EXPLAIN (ANALYZE, BUFFERS) " if analyze else "EXPLAIN "
+    plans: Dict[str, str] = {}
+    with engine.connect() as conn:
+        for name, sql in queries.items():
+            rows = conn.execute(text(prefix + sql)).fetchall()
+            plans[name] = "\n".join(r[0] for r in rows)
+    return plans
+
+
+def benchmark_queries(engine: Engine, queries: Optional[Dict[str, str]] = None, repeat: int = 5) -> Dict[str, float]:
+    """
+    Run each named query `repeat` times and return the median wall time in milliseconds.
+    """
+    queries = queries or BENCHMARK_QUERIES
+    timings: Dict[str, float] = {}
+    with engine.connect() as conn:
+        for name, sql in queries.items():
+            samples: List[float] = []
+            for _ in range(max(1, repeat)):
+                t0 = time.perf_counter()
+                conn.execute(text(sql)).fetchall()
+                samples.append((time.perf_counter() - t0) * 1000.0)
+            samples.sort()
+            timings[name] = samples[len(samples) // 2]
+    return timings
+
+
+def print_benchmark(before: Dict[str, float], after: Dict[str, float], labels: Sequence[str] = ("before", "after")) -> None:
+    """Print a small before/after table of median query times."""
+    print(f"{'query':<16}{labels[0] + ' ms':>12}{labels[1] + ' ms':>12}{'speedup':>10}")
+    for name in before:
+        b = before[name]
+        a = after.get(name)
+        if a is None:
+            continue
+        speedup = (b / a) if a > 0 else float("inf")
+        print(f"{name:<16}{b:>12.2f}{a:>12.2f}{speedup:>9.1f}x")
+
+
+def scan_summary(plans: Dict[str, str]) -> Dict[str, str]:
+    """First scan node of each plan, e.g. 'Seq Scan on sdoh_surveys' vs 'Index Scan using ...'."""
+    out: Dict[str, str] = {}
+    for name, plan in plans.items():
+        scan = next((ln.strip() for ln in plan.splitlines() if "Scan" in ln), plan.splitlines()[0] if plan else "")
+        out[name] = scan.lstrip("-> ").strip()
+    return out
+
+
+# ----------------------------
+# Incremental per-year loads
+# ----------------------------
+def year_checksums(df: pd.DataFrame, year_col: str = "year", key_columns: Sequence[str] = KEY_COLUMNS) -> Dict[int, str]:
+    """
+    SHA-256 per survey year over the column names and row values.  Rows are sorted
+    by the key columns first so the checksum does not depend on source row order.
+    """
+    sort_cols = [c for c in key_columns if c in df.columns]
+    header = ",".join(str(c) for c in df.columns).encode("utf-8")
+    out: Dict[int, str] = {}
+    for yr, sub in df.groupby(year_col, sort=True):
+        if sort_cols:
+            sub = sub.sort_values(sort_cols, kind="mergesort")
+        h = hashlib.sha256(header)
+        h.update(pd.util.hash_pandas_object(sub, index=False).values.tobytes())
+        out[int(yr)] = h.hexdigest()
+    return out
+
+
+def _ensure_load_state(cur) -> None:
+    cur.execute(
+        f"CREATE TABLE IF NOT EXISTS {_quote(LOAD_STATE_TABLE)} ("
+        "table_name TEXT NOT NULL, year INTEGER NOT NULL, checksum TEXT NOT NULL, "
+        "row_count BIGINT NOT NULL, loaded_at TIMESTAMPTZ NOT NULL DEFAULT now(), "
+        "PRIMARY KEY (table_name, year))"
+    )
+
+
+def _record_year(cur, table_name: str, year: int, checksum: str, row_count: int) -> None:
+    cur.execute(
+        f"INSERT INTO {_quote(LOAD_STATE_TABLE)} (table_name, year, checksum, row_count) VALUES (%s, %s, %s, %s) "
+        "ON CONFLICT (table_name, year) DO UPDATE SET checksum = EXCLUDED.checksum, "
+        "row_count = EXCLUDED.row_count, loaded_at = now()",
+        (table_name, int(year), checksum, int(row_count)),
+    )
+
+
+def loaded_year_checksums(engine: Engine, table_name: str = TABLE_NAME) -> Dict[int, str]:
+    """Checksums recorded for each year currently loaded into `table_name`."""
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        _ensure_load_state(cur)
+        cur.execute(f"SELECT year, checksum FROM {_quote(LOAD_STATE_TABLE)} WHERE table_name = %s", (table_name,))
+        out = {int(y): c for y, c in cur.fetchall()}
+        raw.commit()
+        return out
+    finally:
+        raw.close()
+
+
+def record_year_checksums(engine: Engine, df: pd.DataFrame, table_name: str = TABLE_NAME, year_col: str = "year") -> None:
+    """Replace the recorded checksums for `table_name` after a full load of `df`."""
+    sums = year_checksums(df, year_col)
+    counts = df[year_col].value_counts()
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        _ensure_load_state(cur)
+        cur.execute(f"DELETE FROM {_quote(LOAD_STATE_TABLE)} WHERE table_name = %s", (table_name,))
+        for yr, checksum in sums.items():
+            _record_year(cur, table_name, yr, checksum, int(counts.get(yr, 0)))
+        raw.commit()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+
+def _relkind(cur, table_name: str) -> Optional[str]:
+    """'r' for a plain table, 'p' for a partitioned table, None if missing."""
+    cur.execute(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE n.nspname = current_schema() AND c.relname = %s",
+        (table_name,),
+    )
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _table_columns(cur, table_name: str) -> List[Tuple[str, str]]:
+    """(column name, information_schema data_type) of an existing table, in table order."""
+    cur.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = %s ORDER BY ordinal_position",
+        (table_name,),
+    )
+    return [(r[0], r[1]) for r in cur.fetchall()]
+
+
+# information_schema.columns.data_type for type names that differ from it
+_INFO_SCHEMA_TYPES = {
+    "timestamp": "timestamp without time zone", "varchar": "character varying", "char": "character",
+    "int": "integer", "int2": "smallint", "int4": "integer", "int8": "bigint", "float4": "real",
+    "float8": "double precision", "bool": "boolean", "decimal": "numeric",
+}
+
+
+def _expected_columns(columns: Sequence[str], types: Dict[str, str]) -> List[Tuple[str, str]]:
+    """(column, data_type) the table should have, as information_schema reports it (no type modifiers)."""
+    expected = []
+    for c in columns:
+        name = types[c].split("(")[0].strip().lower()
+        expected.append((str(c), _INFO_SCHEMA_TYPES.get(name, name)))
+    return expected
+
+
+def _partition_bound(partition_by: str, year: int) -> str:
+    if partition_by == "range":
+        return f"FOR VALUES FROM ({int(year)}) TO ({int(year) + 1})"
+    return f"FOR VALUES IN ({int(year)})"
+
+
+def _partition_check(partition_by: str, year_col: str, year: int) -> str:
+    # Matching CHECK constraint lets ATTACH PARTITION skip its validation scan.
+    yc = _quote(year_col)
+    if partition_by == "range":
+        return f"{yc} IS NOT NULL AND {yc} >= {int(year)} AND {yc} < {int(year) + 1}"
+    return f"{yc} IS NOT NULL AND {yc} = {int(year)}"
+
+
+def incremental_load(
+    engine: Engine,
+    df: pd.DataFrame,
+    table_name: str = TABLE_NAME,
+    year_col: str = "year",
+    partition_by: Optional[str] = None,
+    column_types: Optional[Dict[str, str]] = None,
+    chunk_rows: int = 2000,
+    force_reload: bool = False,
+    comment: Optional[str] = TABLE_COMMENT,
+    verbose: bool = True,
+) -> Dict[str, object]:
+    """
+    Load only the survey years of `df` that are new or whose checksum changed.
+
+    partition_by:
+        None     - plain table; a changed year is replaced with DELETE + COPY.
+        "list"   - table is LIST partitioned on `year_col`, one partition per year.
+        "range"  - table is RANGE partitioned on `year_col`, [year, year + 1) per partition.
+      With partitions, a changed year is loaded into a standalone table and swapped
+      in with DETACH/ATTACH so the other years are not rewritten.
+
+    The table is rebuilt from scratch (all years, one transaction) when it does not
+    exist, its columns or their types differ from `df`, its partitioning does not match
+    `partition_by`, or `force_reload` is set.  Years already loaded but absent from
+    `df` are left in place.
+
+    Returns {"rows", "seconds", "rows_per_sec", "years_loaded", "years_skipped", "rebuilt"}.
+    """
+    if partition_by not in (None, "list", "range"):
+        raise ValueError("partition_by must be None, 'list' or 'range'")
+
+    types = dict(pg_column_types(df))
+    if column_types:
+        types.update(column_types)
+    cols_ddl = ", ".join(f"{_quote(c)} {types[c]}" for c in df.columns)
+    qt = _quote(table_name)
+
+    new_sums = year_checksums(df, year_col)
+    t0 = time.perf_counter()
+    rows = 0
+    loaded: List[int] = []
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        _ensure_load_state(cur)
+        kind = _relkind(cur, table_name)
+        want_kind = "p" if partition_by else "r"
+        rebuild = (
+            force_reload
+            or kind is None
+            or kind != want_kind
+            # a changed type (e.g. a measure that now has fractional values) cannot be COPYed into place
+            or _table_columns(cur, table_name) != _expected_columns(df.columns, types)
+        )
+
+        if rebuild:
+            old_sums: Dict[int, str] = {}
+            cur.execute(f"DROP TABLE IF EXISTS {qt} CASCADE")
+            partition_ddl = f" PARTITION BY {partition_by.upper()} ({_quote(year_col)})" if partition_by else ""
+            cur.execute(f"CREATE TABLE {qt} ({cols_ddl}){partition_ddl}")
+            if comment:
+                cur.execute(f"COMMENT ON TABLE {qt} IS %s", (comment,))
+            cur.execute(f"DELETE FROM {_quote(LOAD_STATE_TABLE)} WHERE table_name = %s", (table_name,))
+        else:
+            cur.execute(f"SELECT year, checksum FROM {_quote(LOAD_STATE_TABLE)} WHERE table_name = %s", (table_name,))
+            old_sums = {int(y): c for y, c in cur.fetchall()}
+            raw.commit()
+
+        for yr, checksum in new_sums.items():
+            if old_sums.get(yr) == checksum:
+                continue
+            year_df = df[df[year_col] == yr]
+
+            if partition_by:
+                part = f"{table_name}_y{yr}"
+                staging = f"{part}__staging"
+                cur.execute(f"DROP TABLE IF EXISTS {_quote(staging)}")
+                cur.execute(f"CREATE TABLE {_quote(staging)} (LIKE {qt} INCLUDING DEFAULTS)")
+                cur.execute(
+                    f"ALTER TABLE {_quote(staging)} ADD CONSTRAINT {_quote(part + '_year_check')} "
+                    f"CHECK ({_partition_check(partition_by, year_col, yr)})"
+                )
+                rows += _copy_frame(cur, staging, year_df, chunk_rows)
+                if _relkind(cur, part) is not None:
+                    cur.execute(f"ALTER TABLE {qt} DETACH PARTITION {_quote(part)}")
+                    cur.execute(f"DROP TABLE {_quote(part)}")
+                cur.execute(f"ALTER TABLE {_quote(staging)} RENAME TO {_quote(part)}")
+                cur.execute(f"ALTER TABLE {qt} ATTACH PARTITION {_quote(part)} {_partition_bound(partition_by, yr)}")
+            else:
+                cur.execute(f"DELETE FROM {qt} WHERE {_quote(year_col)} = %s", (int(yr),))
+                rows += _copy_frame(cur, table_name, year_df, chunk_rows)
+
+            _record_year(cur, table_name, yr, checksum, len(year_df))
+            loaded.append(yr)
+            # a rebuild commits once at the end so readers never see a partial table
+            if not rebuild:
+                raw.commit()
+
+        if loaded:
+            cur.execute(f"ANALYZE {qt}")
+        raw.commit()
+        cur.close()
+    except Exception:
+        raw.rollback()
+        raise
+    finally:
+        raw.close()
+
+    seconds = time.perf_counter() - t0
+    skipped = [y for y in new_sums if y not in loaded]
+    stats: Dict[str, object] = {
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_sec": rows / seconds if seconds > 0 else float("inf"),
+        "years_loaded": loaded,
+        "years_skipped": skipped,
+        "rebuilt": rebuild,
+    }
+    if verbose:
+        mode = "rebuilt" if rebuild else "incremental"
+        print(f'{mode} load of "{table_name}": loaded years {loaded}, unchanged years {skipped}, '
+              f"{rows} rows in {seconds:.2f}s.")
+    return stats
+
+
+# ----------------------------
+# Long-format companion table
+# ----------------------------
+_NUMERIC_TYPES = ("smallint", "integer", "bigint", "real", "double precision", "numeric")
+
+
+def measure_columns(engine: Engine, table_name: str = TABLE_NAME, key_columns: Sequence[str] = KEY_COLUMNS) -> List[str]:
+    """Numeric, non-key columns of the wide table in table order."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :t ORDER BY ordinal_position"
+        ), {"t": table_name}).fetchall()
+    return [r[0] for r in rows if r[0] not in key_columns and r[1] in _NUMERIC_TYPES]
+
+
+def build_long_table(
+    engine: Engine,
+    table_name: str = TABLE_NAME,
+    long_table: str = LONG_TABLE_NAME,
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Materialize (state, county, year, measure, value) from the wide table, skipping
+    NULL values, and swap it in atomically.  Also (re)creates:
+
+      - primary key (measure, year, state, county) for single-measure lookups
+      - index (year, state, county) for year filters and cross-measure joins
+      - view sdoh_measure_year_summary: count/mean/stddev/min/max per measure and year
+      - function stat_rank_correlated_measures(target_measure, target_year, top_n)
+        ranking every other measure by Pearson correlation with the target
+
+    The unpivot runs inside PostgreSQL (LATERAL VALUES), so no rows pass through Python.
+    """
+    measures = measure_columns(engine, table_name)
+    if not measures:
+        raise ValueError(f'No numeric measure columns found in "{table_name}".')
+
+    staging = f"{long_table}__staging"
+    qt, ql = _quote(table_name), _quote(long_table)
+    values_list = ",\n        ".join(
+        f"({_quote_literal(m)}, s.{_quote(m)}::double precision)" for m in measures
+    )
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {_quote(staging)}"))
+        conn.execute(text(
+            f"CREATE TABLE {_quote(staging)} (state TEXT NOT NULL, county TEXT NOT NULL, year INTEGER NOT NULL, "
+            "measure TEXT NOT NULL, value DOUBLE PRECISION NOT NULL)"
+        ))
+        conn.execute(text(
+            f"INSERT INTO {_quote(staging)} (state, county, year, measure, value)\n"
+            f"SELECT s.state::text, s.county::text, s.year::integer, m.measure, m.value\n"
+            f"FROM {qt} s\n"
+            f"CROSS JOIN LATERAL (VALUES\n        {values_list}\n) AS m(measure, value)\n"
+            "WHERE m.value IS NOT NULL AND s.state IS NOT NULL AND s.county IS NOT NULL AND s.year IS NOT NULL"
+        ))
+        rows = conn.execute(text(f"SELECT COUNT(*) FROM {_quote(staging)}")).scalar() or 0
+
+        conn.execute(text(f"DROP TABLE IF EXISTS {ql} CASCADE"))
+        conn.execute(text(f"ALTER TABLE {_quote(staging)} RENAME TO {ql}"))
+        conn.execute(text(f"ALTER TABLE {ql} ADD CONSTRAINT {_quote(long_table + '_pkey')} PRIMARY KEY (measure, year, state, county)"))
+        conn.execute(text(f"CREATE INDEX {_quote('ix_' + long_table + '_year_state_county')} ON {ql} (year, state, county)"))
+        conn.execute(text(f"COMMENT ON TABLE {ql} IS :c"), {
+            "c": f"Long format of {table_name}: one row per state, county, year and measure (measure = column name "
+                 f"in {table_name}). Use for questions spanning many measures."
+        })
+
+        conn.execute(text(
+            "CREATE OR REPLACE VIEW sdoh_measure_year_summary AS\n"
+            "SELECT measure, year, COUNT(*) AS n_counties, AVG(value) AS mean_value, STDDEV_SAMP(value) AS stddev_value, "
+            f"MIN(value) AS min_value, MAX(value) AS max_value FROM {ql} GROUP BY measure, year"
+        ))
+        conn.execute(text(
+            "CREATE OR REPLACE FUNCTION public.stat_rank_correlated_measures(\n"
+            "    target_measure TEXT, target_year INTEGER DEFAULT NULL, top_n INTEGER DEFAULT 20)\n"
+            "RETURNS TABLE(measure TEXT, correlation DOUBLE PRECISION, n BIGINT)\n"
+            "LANGUAGE sql STABLE AS $fn$\n"
+            "    SELECT o.measure, corr(o.value, t.value) AS correlation, COUNT(*) AS n\n"
+            f"    FROM {ql} t\n"
+            f"    JOIN {ql} o ON o.year = t.year AND o.state = t.state AND o.county = t.county AND o.measure <> t.measure\n"
+            "    WHERE t.measure = target_measure AND (target_year IS NULL OR t.year = target_year)\n"
+            "    GROUP BY o.measure\n"
+            "    HAVING COUNT(*) >= 3 AND corr(o.value, t.value) IS NOT NULL\n"
+            "    ORDER BY abs(corr(o.value, t.value)) DESC\n"
+            "    LIMIT top_n\n"
+            "$fn$"
+        ))
+        conn.execute(text(
+            "COMMENT ON FUNCTION public.stat_rank_correlated_measures(TEXT, INTEGER, INTEGER) IS "
+            "'Ranks every measure (column of sdoh_surveys) by absolute Pearson correlation with target_measure across "
+            "counties, optionally for one year. Returns measure, correlation and number of county-years. "
+            "Example: SELECT measure, correlation FROM stat_rank_correlated_measures(''acs_pct_uninsured'', 2019, 10)'"
+        ))
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {ql}"))
+
+    seconds = time.perf_counter() - t0
+    if verbose:
+        print(f'Built "{long_table}" with {rows} rows from {len(measures)} measures in {seconds:.2f}s.')
+    return {"rows": rows, "measures": len(measures), "seconds": seconds}
+
+
+def _quote_literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def layout_benchmark_queries(
+    engine: Engine,
+    table_name: str = TABLE_NAME,
+    long_table: str = LONG_TABLE_NAME,
+    target: str = "acs_pct_uninsured",
+    year: int = 2019,
+) -> Dict[str, Dict[str, str]]:
+    """
+    The same typical agent questions written against the wide and the long layout.
+    Returns {"wide": {name: sql}, "long": {name: sql}}.
+    """
+    measures = measure_columns(engine, table_name)
+    others = [m for m in measures if m != target]
+    wide_corr = ", ".join(f"corr({_quote(m)}, {_quote(target)}) AS {_quote(m)}" for m in others)
+    wide_cols = ", ".join(_quote(m) for m in measures)
+    qt, ql = _quote(table_name), _quote(long_table)
+    return {
+        "wide": {
+            "state_trend": f"SELECT year, AVG({_quote(target)}) FROM {qt} WHERE state = 'Texas' GROUP BY year ORDER BY year",
+            "year_by_state": f"SELECT state, AVG(saipe_pct_pov) FROM {qt} WHERE year = {year} GROUP BY state ORDER BY 2 DESC",
+            "county_profile": f"SELECT {wide_cols} FROM {qt} WHERE state = 'Ohio' AND county = 'Franklin' AND year = {year}",
+            "rank_correlations": f"SELECT {wide_corr} FROM {qt} WHERE year = {year}",
+        },
+        "long": {
+            "state_trend": (f"SELECT year, AVG(value) FROM {ql} WHERE measure = {_quote_literal(target)} "
+                            "AND state = 'Texas' GROUP BY year ORDER BY year"),
+            "year_by_state": (f"SELECT state, AVG(value) FROM {ql} WHERE measure = 'saipe_pct_pov' "
+                              f"AND year = {year} GROUP BY state ORDER BY 2 DESC"),
+            "county_profile": f"SELECT measure, value FROM {ql} WHERE state = 'Ohio' AND county = 'Franklin' AND year = {year}",
+            "rank_correlations": (f"SELECT measure, correlation FROM stat_rank_correlated_measures("
+                                  f"{_quote_literal(target)}, {year}, 20)"),
+        },
+    }
+
+
+def compare_layouts(engine: Engine, repeat: int = 3, **kwargs) -> Dict[str, Dict[str, float]]:
+    """Time the typical agent queries on the wide and long layouts and print them side by side."""
+    queries = layout_benchmark_queries(engine, **kwargs)
+    results = {layout: benchmark_queries(engine, qs, repeat=repeat) for layout, qs in queries.items()}
+    print_benchmark(results["wide"], results["long"], labels=("wide", "long"))
+    return results
+
+
+# ----------------------------
+# Materialized aggregate rollups
+# ----------------------------
+def build_rollups(
+    engine: Engine,
+    table_name: str = TABLE_NAME,
+    long_table: str = LONG_TABLE_NAME,
+    weight_measure: str = WEIGHT_MEASURE,
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Create (or refresh) the state x year and nation x year rollups of every measure.
+
+    Columns: [state,] year, measure, n_counties (non-null values), sum_value,
+    mean_value, weight_total and weighted_mean_value (weighted by `weight_measure`,
+    the county population).  Every (state, year) present in the wide table has a
+    row for every measure, with n_counties = 0 when all values are NULL, so
+    routed queries return the same groups as the original GROUP BY.
+
+    sum_value / n_counties let the query router in SQLTools re-aggregate to any
+    coarser grouping exactly.  The long table is rebuilt with DROP ... CASCADE, so
+    after build_long_table() the views are created again; otherwise they are
+    refreshed CONCURRENTLY so readers are not blocked.
+    """
+    qt, ql = _quote(table_name), _quote(long_table)
+    qs, qn = _quote(STATE_ROLLUP_NAME), _quote(NATION_ROLLUP_NAME)
+    t0 = time.perf_counter()
+
+    with engine.begin() as conn:
+        exists = conn.execute(text("SELECT to_regclass(:s) IS NOT NULL AND to_regclass(:n) IS NOT NULL"),
+                              {"s": STATE_ROLLUP_NAME, "n": NATION_ROLLUP_NAME}).scalar()
+        if exists:
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {qs}"))
+            conn.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {qn}"))
+        else:
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {qn}"))
+            conn.execute(text(f"DROP MATERIALIZED VIEW IF EXISTS {qs}"))
+            conn.execute(text(
+                f"CREATE MATERIALIZED VIEW {qs} AS\n"
+                "SELECT g.state, g.year, m.measure,\n"
+                "       COUNT(l.value) AS n_counties,\n"
+                "       SUM(l.value) AS sum_value,\n"
+                "       AVG(l.value) AS mean_value,\n"
+                "       SUM(w.value) FILTER (WHERE l.value IS NOT NULL) AS weight_total,\n"
+                "       SUM(l.value * w.value) / NULLIF(SUM(w.value) FILTER (WHERE l.value IS NOT NULL), 0) AS weighted_mean_value\n"
+                f"FROM (SELECT DISTINCT state::text AS state, year::integer AS year FROM {qt}\n"
+                "      WHERE state IS NOT NULL AND year IS NOT NULL) g\n"
+                f"CROSS JOIN (SELECT DISTINCT measure FROM {ql}) m\n"
+                f"LEFT JOIN {ql} l ON l.measure = m.measure AND l.year = g.year AND l.state = g.state\n"
+                f"LEFT JOIN {ql} w ON w.measure = :w AND w.year = l.year AND w.state = l.state AND w.county = l.county\n"
+                "GROUP BY g.state, g.year, m.measure"
+            ).bindparams(w=weight_measure))
+            conn.execute(text(f"CREATE UNIQUE INDEX {_quote('ux_' + STATE_ROLLUP_NAME)} ON {qs} (measure, year, state)"))
+            conn.execute(text(
+                f"CREATE MATERIALIZED VIEW {qn} AS\n"
+                "SELECT year, measure,\n"
+                "       SUM(n_counties) AS n_counties,\n"
+                "       SUM(sum_value) AS sum_value,\n"
+                "       SUM(sum_value) / NULLIF(SUM(n_counties), 0) AS mean_value,\n"
+                "       SUM(weight_total) AS weight_total,\n"
+                "       SUM(weighted_mean_value * weight_total) / NULLIF(SUM(weight_total), 0) AS weighted_mean_value\n"
+                f"FROM {qs} GROUP BY year, measure"
+            ))
+            conn.execute(text(f"CREATE UNIQUE INDEX {_quote('ux_' + NATION_ROLLUP_NAME)} ON {qn} (measure, year)"))
+            for name, grain in ((STATE_ROLLUP_NAME, "state and year"), (NATION_ROLLUP_NAME, "year (all counties)")):
+                conn.execute(text(f"COMMENT ON MATERIALIZED VIEW {_quote(name)} IS :c"), {
+                    "c": f"Precomputed county count, mean and population-weighted mean ({weight_measure}) of every "
+                         f"{table_name} measure by {grain}. measure = column name in {table_name}."
+                })
+        counts = {
+            name: conn.execute(text(f"SELECT COUNT(*) FROM {_quote(name)}")).scalar() or 0
+            for name in (STATE_ROLLUP_NAME, NATION_ROLLUP_NAME)
+        }
+
+    seconds = time.perf_counter() - t0
+    if verbose:
+        action = "Refreshed" if exists else "Built"
+        print(f"{action} rollups {counts} in {seconds:.2f}s.")
+    return {"seconds": seconds, **counts}
+
+
+# ----------------------------
+# Stratified sample
+# ----------------------------
+def build_sample(
+    engine: Engine,
+    table_name: str = TABLE_NAME,
+    sample_table: str = SAMPLE_TABLE_NAME,
+    fraction: float = 0.1,
+    min_per_stratum: int = 5,
+    seed: str = "sdoh",
+    verbose: bool = True,
+) -> Dict[str, float]:
+    """
+    Materialize a stratified sample of the wide table, one stratum per (state, year).
+
+    Each stratum keeps ceil(fraction * N_h) counties, at least min_per_stratum (or all of
+    them when the stratum is smaller).  Selection is deterministic: counties are ordered by
+    md5(county || seed), so reloads of unchanged data pick the same sample.  The sample adds
+    stratum_size (N_h) and stratum_sample_size (n_h), which the approximate query path in
+    SQLTools uses for stratified estimates, standard errors and confidence intervals.
+    Swapped in atomically like the other derived tables.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError("fraction must be in (0, 1].")
+    with engine.connect() as conn:
+        columns = [r[0] for r in conn.execute(text(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :t ORDER BY ordinal_position"
+        ), {"t": table_name}).fetchall()]
+    if not columns:
+        raise ValueError(f'Table "{table_name}" not found.')
+
+    staging = f"{sample_table}__staging"
+    qt, qs = _quote(table_name), _quote(sample_table)
+    col_list = ", ".join(f"s.{_quote(c)}" for c in columns)
+
+    t0 = time.perf_counter()
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {_quote(staging)}"))
+        conn.execute(text(
+            f"CREATE TABLE {_quote(staging)} AS\n"
+            "WITH strata AS (\n"
+            f"    SELECT state, year, COUNT(*) AS n_h,\n"
+            "           LEAST(COUNT(*), GREATEST(:min_n, CEIL(COUNT(*) * :fraction)::bigint)) AS k_h\n"
+            f"    FROM {qt} WHERE state IS NOT NULL AND year IS NOT NULL GROUP BY state, year\n"
+            "), ranked AS (\n"
+            "    SELECT t.*, row_number() OVER (PARTITION BY t.state, t.year ORDER BY md5(coalesce(t.county::text, '') || :seed)) AS rn\n"
+            f"    FROM {qt} t\n"
+            ")\n"
+            f"SELECT {col_list}, st.n_h::integer AS stratum_size, st.k_h::integer AS stratum_sample_size\n"
+            "FROM ranked s JOIN strata st ON st.state = s.state AND st.year = s.year\n"
+            "WHERE s.rn <= st.k_h"
+        ), {"min_n": int(min_per_stratum), "fraction": float(fraction), "seed": seed})
+        rows = conn.execute(text(f"SELECT COUNT(*) FROM {_quote(staging)}")).scalar() or 0
+
+        conn.execute(text(f"DROP TABLE IF EXISTS {qs} CASCADE"))
+        conn.execute(text(f"ALTER TABLE {_quote(staging)} RENAME TO {qs}"))
+        conn.execute(text(f"CREATE INDEX {_quote('ix_' + sample_table + '_state_year')} ON {qs} (state, year)"))
+        conn.execute(text(f"COMMENT ON TABLE {qs} IS :c"), {
+            "c": f"Stratified sample of {table_name} by state and year ({fraction:.0%} per stratum, at least "
+                 f"{min_per_stratum} counties). Used for approximate answers with confidence intervals."
+        })
+
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {qs}"))
+
+    seconds = time.perf_counter() - t0
+    if verbose:
+        print(f'Built "{sample_table}" with {rows} rows ({fraction:.0%} stratified by state, year) in {seconds:.2f}s.')
+    return {"rows": rows, "seconds": seconds}